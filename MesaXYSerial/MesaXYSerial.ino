@@ -8,6 +8,7 @@
 #define ENABLE_PIN 8
 #define X_LIMIT_PIN 9
 #define Y_LIMIT_PIN 10
+#define TRIG_OUT_PIN 11 // Al TRIG IN del SR830: arranca el buffer en cada fila del FLY
 
 // Configuración de pasos por milímetro (ajustar según hardware)
 const float STEPS_PER_MM_X = 6400.0; // 1/16 microstepping
@@ -44,11 +45,52 @@ bool waitingForCont = false;
 bool sweepActive = false;
 bool homedOK = false; // Estado de homing
 
+// Modo rápido (comando FAST): baudios altos, sin DBG durante barridos y
+// tramas binarias para el punto a medir y el CONT.
+// Trama: 0xA5 | tipo | largo | payload | checksum (XOR de tipo, largo y payload)
+const uint8_t FRAME_START = 0xA5;
+const uint8_t FRAME_MEASURE = 'M'; // Arduino -> PC: float x, float y (mm). Equivale a POS + LASER
+const uint8_t FRAME_CONT = 'C';    // PC -> Arduino: sin payload
+const uint8_t FRAME_ABORT = 'A';   // PC -> Arduino: sin payload
+const uint8_t FRAME_POINT = 'P';   // PC -> Arduino: float x, float y (mm). Equivale a "P x y"
+const uint8_t FRAME_MARK = 'K';    // Arduino -> PC: uint8 tipo, uint32 micros, float x, float y. Equivale a "MK"
+bool binaryMode = false;
+bool quietSweeps = false;
+
+// Crédito de puntos (CONT n): mientras quede crédito el barrido no espera un
+// CONT por punto; en cada punto se queda DWELL ms (para medir) y sigue.
+long contCredit = 0;
+unsigned long dwellMs = 0;
+
+// Lista de puntos (POINTS): la PC envía "P x y" por adelantado y "END" al
+// final; el Arduino recorre la cola en orden con el mismo POS/LASER/CONT.
+// Cada punto encolado se confirma con "ACK": la PC no manda el siguiente
+// hasta recibirlo, porque durante moveToMM no se lee el puerto y el buffer
+// de recepción (64 bytes) se desbordaría con varios puntos en camino.
+const int POINT_QUEUE_SIZE = 32;
+float pointQueueX[POINT_QUEUE_SIZE];
+float pointQueueY[POINT_QUEUE_SIZE];
+int pointHead = 0;
+int pointCount = 0;
+bool pointListOpen = false;
+
+// Fly scan (FLY): marcas de posición durante cada fila a velocidad constante.
+// "MK tipo micros x y": tipo 1 = inicio de fila (disparo del lock-in),
+// 0 = intermedia, 2 = fin de fila.
+const uint8_t MARK_MID = 0;
+const uint8_t MARK_ROW_START = 1;
+const uint8_t MARK_ROW_END = 2;
+const unsigned long MARK_INTERVAL_US = 100000;     // Texto a 9600 baudios
+const unsigned long MARK_INTERVAL_FAST_US = 10000; // Tramas en modo rápido
+const float RUNUP_FACTOR = 1.2; // Margen sobre la distancia de aceleración
+
 void setup() {
   Serial.begin(9600);
   pinMode(ENABLE_PIN, OUTPUT);
   pinMode(X_LIMIT_PIN, INPUT_PULLUP);
   pinMode(Y_LIMIT_PIN, INPUT_PULLUP);
+  pinMode(TRIG_OUT_PIN, OUTPUT);
+  digitalWrite(TRIG_OUT_PIN, LOW);
   digitalWrite(ENABLE_PIN, HIGH); // Drivers desactivados (ENABLE es activo bajo)
 
   // Configurar motores
@@ -64,6 +106,10 @@ void setup() {
 void loop() {
   static String cmdBuffer = "";
   if (Serial.available()) {
+    if (binaryMode && Serial.peek() == FRAME_START) {
+      readCommandFrame(); // Un CONT tardío fuera de barrido se descarta
+      return;
+    }
     char c = Serial.read();
     if (c == '\n') {
       cmdBuffer.trim();
@@ -103,14 +149,52 @@ void processCommand(String cmd) {
     digitalWrite(ENABLE_PIN, HIGH);
     motorsEnabled = false;
     Serial.println("OK");
-  } else if (cmd == "CONT" && waitingForCont) {
-    waitingForCont = false;
+  } else if (cmd.startsWith("CONT")) {
+    // "CONT" = 1 punto, "CONT n" = n puntos. Fuera de barrido se ignora.
+    if (sweepActive) {
+      float n = 1;
+      if (cmd.length() > 4 && !(parseFloat(cmd, 4, n) && n >= 1)) {
+        n = 1;
+      }
+      contCredit += (long)n;
+    }
+  } else if (cmd.startsWith("DWELL")) {
+    float ms;
+    if (parseFloat(cmd, 5, ms)) {
+      dwellMs = (unsigned long)ms;
+      Serial.println("OK");
+    } else {
+      Serial.println("ERR Invalid DWELL");
+    }
+  } else if (cmd.startsWith("P ")) {
+    float x, y;
+    if (parseTwoFloats(cmd, 1, x, y)) {
+      enqueuePoint(x, y);
+    } else {
+      Serial.println("ERR Invalid point");
+    }
+  } else if (cmd == "END") {
+    pointListOpen = false;
   } else if (cmd == "ABORT" && sweepActive) {
     sweepActive = false;
     waitingForCont = false;
+    contCredit = 0;
     stepperX.stop();
     stepperY.stop();
     Serial.println("OK");
+  } else if (cmd.startsWith("FAST")) {
+    float baud;
+    if (parseFloat(cmd, 4, baud) && baud >= 9600) {
+      // Se confirma a la velocidad actual y luego se cambia
+      Serial.println("OK");
+      Serial.flush();
+      Serial.end();
+      Serial.begin((long)baud);
+      binaryMode = true;
+      quietSweeps = true;
+    } else {
+      Serial.println("ERR Invalid baud rate");
+    }
   } else if (cmd.startsWith("SPEED")) {
     float speed;
     if (parseFloat(cmd, 5, speed) && speed > 0) {
@@ -133,6 +217,31 @@ void processCommand(String cmd) {
     } else {
       Serial.println("ERR Invalid TESTMOVE parameters");
     }
+  } else if (cmd == "POINTS") {
+    if (!homedOK) {
+      Serial.println("ERR Not homed");
+      return;
+    }
+    if (!motorsEnabled) {
+      digitalWrite(ENABLE_PIN, LOW);
+      motorsEnabled = true;
+    }
+    runPointList();
+  } else if (cmd.startsWith("FLY")) {
+    float x_max, y_max, res, speed;
+    if (parseFourFloats(cmd, 3, x_max, y_max, res, speed) && speed > 0) {
+      if (!homedOK) {
+        Serial.println("ERR Not homed");
+        return;
+      }
+      if (!motorsEnabled) {
+        digitalWrite(ENABLE_PIN, LOW);
+        motorsEnabled = true;
+      }
+      runFlyScan(x_max, y_max, res, speed);
+    } else {
+      Serial.println("ERR Invalid FLY parameters");
+    }
   } else if (cmd.startsWith("SWEEP")) {
     float x_max, y_max, res;
     if (parseThreeFloats(cmd, 5, x_max, y_max, res) && x_max > 0 && y_max > 0 && res > 0) {
@@ -182,13 +291,84 @@ bool parseThreeFloats(String line, int start, float &x_max, float &y_max, float
   return x_max > 0 && y_max > 0 && res > 0;
 }
 
+bool parseFourFloats(String line, int start, float &x_max, float &y_max, float &res, float &speed) {
+  line.remove(0, start);
+  line.trim();
+  int s3 = line.lastIndexOf(' ');
+  if (s3 == -1) return false;
+  speed = line.substring(s3 + 1).toFloat();
+  return parseThreeFloats(line.substring(0, s3), 0, x_max, y_max, res) && speed > 0;
+}
+
+void sendFrame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  uint8_t checksum = type ^ len;
+  Serial.write(FRAME_START);
+  Serial.write(type);
+  Serial.write(len);
+  for (uint8_t i = 0; i < len; i++) {
+    Serial.write(payload[i]);
+    checksum ^= payload[i];
+  }
+  Serial.write(checksum);
+}
+
+// Lee una trama de la PC (el byte de inicio aún está en el buffer)
+void readCommandFrame() {
+  uint8_t header[3];
+  if (Serial.readBytes(header, 3) < 3) return;
+  uint8_t type = header[1];
+  uint8_t len = header[2];
+  uint8_t checksum = type ^ len;
+  uint8_t payload[8];
+  uint8_t b;
+  for (uint8_t i = 0; i < len; i++) {
+    if (Serial.readBytes(&b, 1) < 1) return;
+    if (i < 8) payload[i] = b;
+    checksum ^= b;
+  }
+  if (Serial.readBytes(&b, 1) < 1 || b != checksum) {
+    Serial.println("ERR Bad frame");
+    return;
+  }
+  if (type == FRAME_CONT && sweepActive) {
+    // Payload opcional: uint16 con el número de puntos autorizados
+    long n = 1;
+    if (len >= 2) n = payload[0] | ((long)payload[1] << 8);
+    contCredit += n;
+  } else if (type == FRAME_ABORT && sweepActive) {
+    processCommand("ABORT");
+  } else if (type == FRAME_POINT && len == 8) {
+    float x, y;
+    memcpy(&x, payload, 4);
+    memcpy(&y, payload + 4, 4);
+    enqueuePoint(x, y);
+  }
+}
+
+// Agrega un punto a la cola de la lista en curso (POINTS)
+void enqueuePoint(float x, float y) {
+  if (!(sweepActive && pointListOpen)) {
+    Serial.println("ERR No point list");
+  } else if (pointCount >= POINT_QUEUE_SIZE) {
+    Serial.println("ERR Point queue full");
+  } else {
+    int tail = (pointHead + pointCount) % POINT_QUEUE_SIZE;
+    pointQueueX[tail] = x;
+    pointQueueY[tail] = y;
+    pointCount++;
+    Serial.println("ACK");
+  }
+}
+
 void moveToMM(float x_mm, float y_mm) {
   long x_steps = (long)(x_mm * STEPS_PER_MM_X * POS_DIR_X);
   long y_steps = (long)(y_mm * STEPS_PER_MM_Y * POS_DIR_Y);
-  Serial.print("DBG Moving to steps: ");
-  Serial.print(x_steps);
-  Serial.print(", ");
-  Serial.println(y_steps);
+  if (!(quietSweeps && sweepActive)) {
+    Serial.print("DBG Moving to steps: ");
+    Serial.print(x_steps);
+    Serial.print(", ");
+    Serial.println(y_steps);
+  }
 
   stepperX.moveTo(x_steps);
   stepperY.moveTo(y_steps);
@@ -203,30 +383,56 @@ void moveToMM(float x_mm, float y_mm) {
 void stepAndPause(float x, float y) {
   moveToMM(x, y);
   
-  // 1. Informar posición
-  Serial.print("POS ");
-  Serial.print(x, 3);
-  Serial.print(" ");
-  Serial.println(y, 3);
-
-  // 2. Enviar gatillo para que Python empiece a medir
-  Serial.println("LASER");
-
-  // 3. Bloquear hasta que Python diga "CONT"
-  waitingForCont = true;
-  while (waitingForCont && sweepActive) {
-    if (Serial.available()) {
-      String cmd = Serial.readStringUntil('\n');
-      cmd.trim();
-      processCommand(cmd); // Esto pondrá waitingForCont en false cuando llegue "CONT"
-    }
+  if (binaryMode) {
+    // 1+2. Posición y gatillo en una sola trama
+    uint8_t payload[8];
+    memcpy(payload, &x, 4);
+    memcpy(payload + 4, &y, 4);
+    sendFrame(FRAME_MEASURE, payload, 8);
+  } else {
+    // 1. Informar posición
+    Serial.print("POS ");
+    Serial.print(x, 3);
+    Serial.print(" ");
+    Serial.println(y, 3);
+
+    // 2. Enviar gatillo para que Python empiece a medir
+    Serial.println("LASER");
   }
+
+  // 3. Bloquear hasta tener crédito: lo da un "CONT" de Python tras medir
+  //    o un "CONT n" anterior que autorizó varios puntos por adelantado
+  unsigned long t0 = millis();
+  waitingForCont = (contCredit == 0);
+  while (contCredit == 0 && sweepActive) {
+    pollSerial(); // Esto sumará crédito cuando llegue "CONT"
+  }
+  waitingForCont = false;
+  if (contCredit > 0) contCredit--;
+
+  // 4. Con DWELL, el punto se mantiene al menos dwellMs desde el LASER
+  //    para que Python alcance a medir aunque ya tuviera crédito
+  while (millis() - t0 < dwellMs && sweepActive) {
+    pollSerial(); // Puede llegar más crédito o un ABORT
+  }
+}
+
+void pollSerial() {
+  if (!Serial.available()) return;
+  if (binaryMode && Serial.peek() == FRAME_START) {
+    readCommandFrame();
+    return;
+  }
+  String cmd = Serial.readStringUntil('\n');
+  cmd.trim();
+  processCommand(cmd);
 }
 
 // Modificación en runSweep: eliminamos el Serial.println("LASER") de aquí
 // porque lo moveremos dentro de stepAndPause para mayor seguridad.
 void runSweep(float x_max, float y_max, float res) {
   sweepActive = true;
+  contCredit = 0;
   int nx = (int)(x_max / res) + 1;
   int ny = (int)(y_max / res) + 1;
 
@@ -243,9 +449,116 @@ void runSweep(float x_max, float y_max, float res) {
   }
   sweepActive = false;
   waitingForCont = false;
+  contCredit = 0;
   Serial.println("OK"); 
 }
 
+// Recorre los puntos que la PC va encolando hasta recibir END (o ABORT)
+void runPointList() {
+  sweepActive = true;
+  contCredit = 0;
+  pointHead = 0;
+  pointCount = 0;
+  pointListOpen = true;
+
+  while (sweepActive) {
+    if (pointCount > 0) {
+      float x = pointQueueX[pointHead];
+      float y = pointQueueY[pointHead];
+      pointHead = (pointHead + 1) % POINT_QUEUE_SIZE;
+      pointCount--;
+      stepAndPause(x, y);
+    } else if (!pointListOpen) {
+      break;
+    } else {
+      pollSerial(); // Esperando más puntos o END
+    }
+  }
+  sweepActive = false;
+  waitingForCont = false;
+  pointListOpen = false;
+  contCredit = 0;
+  Serial.println("OK");
+}
+
+void sendMark(uint8_t kind, unsigned long t, float x, float y) {
+  if (binaryMode) {
+    uint8_t payload[13];
+    payload[0] = kind;
+    memcpy(payload + 1, &t, 4);
+    memcpy(payload + 5, &x, 4);
+    memcpy(payload + 9, &y, 4);
+    sendFrame(FRAME_MARK, payload, 13);
+  } else {
+    Serial.print("MK ");
+    Serial.print(kind);
+    Serial.print(" ");
+    Serial.print(t);
+    Serial.print(" ");
+    Serial.print(x, 5);
+    Serial.print(" ");
+    Serial.println(y, 5);
+  }
+}
+
+// Barrido con movimiento continuo: cada fila se cruza a 'speed' mm/s
+// constantes. Arranca antes del borde para llegar ya a velocidad, dispara
+// el buffer del lock-in al cruzarlo y manda marcas (micros, x) hasta el
+// borde opuesto. Antes de cada fila espera un CONT (buffer rearmado).
+void runFlyScan(float x_max, float y_max, float res, float speed) {
+  sweepActive = true;
+  contCredit = 0;
+  float v = min(speed * STEPS_PER_MM_X, maxSpeed); // pasos/s
+  float runup = RUNUP_FACTOR * v * v / (2.0 * ACCELERATION) / STEPS_PER_MM_X; // mm
+  unsigned long interval = binaryMode ? MARK_INTERVAL_FAST_US : MARK_INTERVAL_US;
+  int ny = (int)(y_max / res) + 1;
+
+  for (int j = 0; j < ny && sweepActive; j++) {
+    float y = j * res;
+    int dir = (j % 2 == 0) ? 1 : -1;
+    float xa = (dir > 0) ? 0 : x_max;
+    float xb = (dir > 0) ? x_max : 0;
+    moveToMM(xa - dir * runup, y);
+
+    waitingForCont = (contCredit == 0);
+    while (contCredit == 0 && sweepActive) {
+      pollSerial();
+    }
+    waitingForCont = false;
+    if (!sweepActive) break;
+    contCredit--;
+
+    stepperX.setMaxSpeed(v);
+    stepperX.moveTo((long)((xb + dir * runup) * STEPS_PER_MM_X * POS_DIR_X));
+    int phase = 0; // 0 = acelerando, 1 = dentro de la fila, 2 = frenando
+    unsigned long lastMark = 0;
+    while (stepperX.distanceToGo() != 0 && sweepActive) {
+      stepperX.run();
+      float x = stepperX.currentPosition() / (STEPS_PER_MM_X * POS_DIR_X);
+      unsigned long now = micros();
+      if (phase == 0 && dir * (x - xa) >= 0) {
+        digitalWrite(TRIG_OUT_PIN, HIGH); // Flanco de subida: arranca el buffer
+        sendMark(MARK_ROW_START, now, x, y);
+        digitalWrite(TRIG_OUT_PIN, LOW);
+        lastMark = now;
+        phase = 1;
+      } else if (phase == 1 && dir * (x - xb) >= 0) {
+        sendMark(MARK_ROW_END, now, x, y);
+        phase = 2;
+      } else if (phase == 1 && now - lastMark >= interval) {
+        sendMark(MARK_MID, now, x, y);
+        lastMark = now;
+      }
+      if (Serial.available()) pollSerial(); // ABORT, o el CONT de la próxima fila
+    }
+    stepperX.setMaxSpeed(maxSpeed);
+  }
+  sweepActive = false;
+  waitingForCont = false;
+  contCredit = 0;
+  Serial.println("OK");
+}
+
 void waitUntilDone(AccelStepper &s) {
   while (s.distanceToGo() != 0) {
     s.run();
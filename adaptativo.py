@@ -0,0 +1,181 @@
+"""
+Barrido adaptativo: una pasada gruesa y refinamiento solo donde la señal cambia.
+
+La malla fina es la del barrido normal (paso 'res', índices 0..nx-1).
+La pasada gruesa mide los múltiplos de 'paso_grueso' celdas (potencia de 2).
+En cada nivel, cada cuadrado de lado q cuyas esquinas medidas difieren en R
+más que umbral_r (fracción del rango de R medido) o en φ más que umbral_fase
+grados se subdivide: se miden sus puntos a paso q/2. Se repite hasta q = 1.
+
+Los puntos medidos caen siempre en la malla fina, así que DataManager los
+guarda y reconstruye como cualquier barrido; las celdas no medidas se
+rellenan con la esquina medida más cercana del nivel que las cubre
+(rellenar_jerarquico).
+"""
+import warnings
+
+import numpy as np
+
+
+def rellenar_jerarquico(z, medido):
+    """
+    Rellena las celdas no medidas de una malla de barrido adaptativo.
+    Busca el menor paso p >= 2 (potencia de 2) cuya retícula de múltiplos
+    esté completa y, de p hacia 1, copia a cada bloque de lado q el valor de
+    su esquina inferior si fue medida. Si no hay una retícula completa (p.ej.
+    un barrido por filas abortado) devuelve z sin cambios.
+    """
+    if medido.all():
+        return z
+    ny, nx = z.shape
+    limite = min(n - 1 for n in (ny, nx) if n > 1) if max(ny, nx) > 1 else 0
+    paso = 2
+    while paso <= limite and not medido[::paso, ::paso].all():
+        paso *= 2
+    if paso > limite:
+        return z
+
+    salida = np.array(z, dtype=float, copy=True)
+    iy = np.arange(ny)[:, None]
+    ix = np.arange(nx)[None, :]
+    sin_medir = ~medido
+    q = paso
+    while q >= 1:
+        ay, ax = (iy // q) * q, (ix // q) * q
+        usar = sin_medir & medido[ay, ax]
+        salida[usar] = z[ay, ax][usar]
+        q //= 2
+    return salida
+
+
+class EscaneoAdaptativo:
+    """
+    Planificador del barrido adaptativo. Uso:
+
+        plan = EscaneoAdaptativo(x_max, y_max, res)
+        puntos = plan.puntos_iniciales()
+        while puntos:
+            ... medir cada (x, y) y llamar plan.registrar(x, y, z_data) ...
+            puntos = plan.siguientes_puntos()
+    """
+
+    def __init__(self, x_max, y_max, res, paso_grueso=8, umbral_r=0.05, umbral_fase=10.0):
+        self.x_max = x_max
+        self.y_max = y_max
+        self.res = res
+        self.nx = int(x_max / res) + 1
+        self.ny = int(y_max / res) + 1
+        # Potencia de 2 para que cada nivel parta el paso exactamente a la mitad
+        self.paso_grueso = 1 << max(int(paso_grueso).bit_length() - 1, 0)
+        self.umbral_r = umbral_r
+        self.umbral_fase = umbral_fase
+
+        self.r = np.full((self.ny, self.nx), np.nan)
+        self.fase = np.full((self.ny, self.nx), np.nan)
+        self.medido = np.zeros((self.ny, self.nx), dtype=bool)
+        self.paso_actual = self.paso_grueso
+
+    @property
+    def total_malla(self):
+        return self.nx * self.ny
+
+    @property
+    def puntos_medidos(self):
+        return int(self.medido.sum())
+
+    def _a_mm(self, iy, ix):
+        """Índices -> lista de (x, y) en mm, en serpentina por filas."""
+        orden = np.lexsort((ix, iy))
+        iy, ix = iy[orden], ix[orden]
+        # Filas impares del nivel en sentido inverso (menos recorrido)
+        _, inicio = np.unique(iy, return_index=True)
+        puntos = []
+        for k, (a, b) in enumerate(zip(inicio, list(inicio[1:]) + [len(iy)])):
+            tramo = range(a, b) if k % 2 == 0 else range(b - 1, a - 1, -1)
+            puntos.extend((round(ix[i] * self.res, 3), round(iy[i] * self.res, 3)) for i in tramo)
+        return puntos
+
+    def puntos_iniciales(self):
+        """Pasada gruesa (sin las celdas ya medidas, al retomar)."""
+        p = self.paso_grueso
+        iy, ix = np.meshgrid(np.arange(0, self.ny, p), np.arange(0, self.nx, p), indexing='ij')
+        iy, ix = iy.ravel(), ix.ravel()
+        pendientes = ~self.medido[iy, ix]
+        return self._a_mm(iy[pendientes], ix[pendientes])
+
+    def registrar(self, x, y, z_data):
+        ix = min(max(int(round(x / self.res)), 0), self.nx - 1)
+        iy = min(max(int(round(y / self.res)), 0), self.ny - 1)
+        self.r[iy, ix] = z_data.get('R', np.nan)
+        self.fase[iy, ix] = z_data.get('phi', np.nan)
+        self.medido[iy, ix] = True
+
+    def registrar_lote(self, xs, ys, rs, fases):
+        """Registra puntos ya medidos de una vez (p.ej. leídos de la DB al retomar)."""
+        ix = np.clip(np.rint(np.asarray(xs) / self.res), 0, self.nx - 1).astype(np.intp)
+        iy = np.clip(np.rint(np.asarray(ys) / self.res), 0, self.ny - 1).astype(np.intp)
+        self.r[iy, ix] = rs
+        self.fase[iy, ix] = fases
+        self.medido[iy, ix] = True
+
+    def _cuadrados_a_refinar(self, q):
+        """Orígenes (iy, ix) de los cuadrados de lado q con cambio grande."""
+        oy, ox = np.meshgrid(np.arange(0, max(self.ny - 1, 1), q),
+                             np.arange(0, max(self.nx - 1, 1), q), indexing='ij')
+        oy, ox = oy.ravel(), ox.ravel()
+        fy = np.minimum(oy + q, self.ny - 1)
+        fx = np.minimum(ox + q, self.nx - 1)
+        esquinas = ((oy, ox), (oy, fx), (fy, ox), (fy, fx))
+
+        r = np.stack([self.r[a, b] for a, b in esquinas])
+        fase = np.stack([self.fase[a, b] for a, b in esquinas])
+        # Diferencias de fase envueltas a (-180, 180] respecto de la primera esquina medida
+        primera = np.argmax(~np.isnan(fase), axis=0)
+        referencia = np.take_along_axis(fase, primera[None, :], axis=0)[0]
+        d_fase = (fase - referencia + 180.0) % 360.0 - 180.0
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # Cuadrados sin esquinas medidas
+            salto_r = np.nanmax(r, axis=0) - np.nanmin(r, axis=0)
+            salto_fase = np.nanmax(d_fase, axis=0) - np.nanmin(d_fase, axis=0)
+            escala_r = np.nanmax(self.r) - np.nanmin(self.r)
+        escala_r = escala_r if np.isfinite(escala_r) and escala_r > 0 else np.inf
+
+        refinar = (salto_r > self.umbral_r * escala_r) | (salto_fase > self.umbral_fase)
+        return oy[refinar], ox[refinar]
+
+    def siguientes_puntos(self):
+        """Puntos del próximo nivel (paso/2), o lista vacía si terminó."""
+        while self.paso_actual > 1:
+            q = self.paso_actual
+            h = q // 2
+            self.paso_actual = h
+            oy, ox = self._cuadrados_a_refinar(q)
+            if oy.size == 0:
+                continue
+            candidatos_y = np.concatenate([oy, oy + h, oy + h, oy + h, oy + q])
+            candidatos_x = np.concatenate([ox + h, ox, ox + h, ox + q, ox + h])
+            dentro = (candidatos_y < self.ny) & (candidatos_x < self.nx)
+            plano = np.unique(candidatos_y[dentro] * self.nx + candidatos_x[dentro])
+            plano = plano[~self.medido.ravel()[plano]]
+            if plano.size:
+                iy, ix = np.divmod(plano, self.nx)
+                return self._a_mm(iy, ix)
+        return []
+
+    def mallas(self):
+        """
+        Mallas rellenas para mostrar, con el mismo formato que
+        data_manager.reconstruir_malla.
+        """
+        z_mag = rellenar_jerarquico(np.nan_to_num(self.r, nan=0.0), self.medido)
+        z_fase = rellenar_jerarquico(np.nan_to_num(self.fase, nan=0.0), self.medido)
+        return {
+            "x_max": (self.nx - 1) * self.res,
+            "y_max": (self.ny - 1) * self.res,
+            "res": self.res,
+            "xs": np.linspace(0, (self.nx - 1) * self.res, self.nx),
+            "ys": np.linspace(0, (self.ny - 1) * self.res, self.ny),
+            "z_mag": z_mag,
+            "z_fase": z_fase,
+        }
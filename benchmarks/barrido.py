@@ -0,0 +1,128 @@
+"""
+Benchmark de throughput del barrido contra el hardware simulado (simulador.py).
+
+Para cada tamaño de barrido y cada modo de adquisición informa puntos/s,
+el desglose por etapa (ms por punto) y los tiempos de cuadro de la GUI al
+redibujar los puntos por lotes como lo hace RenderScheduler.
+
+Uso (desde la raíz del repo):
+    python benchmarks/barrido.py
+    python benchmarks/barrido.py --tamanos 0.05:0.01 0.1:0.005 --latencia-serial 0.008
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simulador import crear_mesa_simulada  # noqa: E402
+
+# (lado en mm, resolución en mm)
+TAMANOS = ((0.05, 0.01), (0.1, 0.01))
+
+MODOS = {
+    "handshake": ({}, False),
+    "pipeline": ({"pipeline": True}, False),
+    "buffer": ({"usar_buffer": True}, False),
+    "credito x8": ({"ventana_cont": 8}, False),
+    "credito+pipeline": ({"ventana_cont": 8, "pipeline": True}, False),
+    "rapido+pipeline": ({"pipeline": True}, True),
+    "fly": ({"fly": True}, False),
+}
+
+
+def correr_barrido(lado, res, opciones, modo_rapido, opciones_arduino, opciones_lockin):
+    mesa, arduino, lockin_sim = crear_mesa_simulada(
+        modo_rapido=modo_rapido, opciones_arduino=opciones_arduino, opciones_lockin=opciones_lockin
+    )
+    arduino.reiniciar_estadisticas()
+    lockin_sim.reiniciar_estadisticas()
+
+    opciones = dict(opciones)
+    if opciones.pop("fly", False):
+        generador = mesa.fly_scan_generator(lado, lado, res)
+    else:
+        generador = mesa.sweep_and_measure_generator(lado, lado, res, **opciones)
+
+    puntos, llegadas = [], []
+    t0 = time.perf_counter()
+    for x, y, z in generador:
+        puntos.append((x, y, z['R']))
+        llegadas.append(time.perf_counter() - t0)
+    duracion = time.perf_counter() - t0
+
+    n = max(len(puntos), 1)
+    asentamiento = mesa.estadisticas_asentamiento.get("media", 0.0)
+    resultado = {
+        "puntos": len(puntos),
+        "pts_s": len(puntos) / duracion,
+        "mov_ms": arduino.tiempo_movimiento / n * 1e3,
+        "espera_cont_ms": (arduino.tiempo_espera_cont + arduino.tiempo_dwell) / n * 1e3,
+        "gpib_ms": lockin_sim.tiempo_gpib / n * 1e3,
+        "asent_ms": asentamiento * 1e3,
+        "tardios": mesa.puntos_tardios,
+    }
+    mesa.close()
+    return resultado, puntos, llegadas
+
+
+def tiempos_de_cuadro(lado, res, puntos, llegadas, fps=25):
+    """Redibuja los puntos agrupados por cuadro y devuelve (p50, p99) en ms."""
+    try:
+        from PyQt6.QtWidgets import QApplication
+        from graficar import Grafica3DRealTime
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication(sys.argv)
+    grafica = Grafica3DRealTime()
+    grafica.inicializar_malla(lado, lado, res)
+
+    cuadros = {}
+    for punto, t in zip(puntos, llegadas):
+        cuadros.setdefault(int(t * fps), []).append(punto)
+
+    duraciones = []
+    for indice in sorted(cuadros):
+        t0 = time.perf_counter()
+        grafica.actualizar_puntos(cuadros[indice])
+        duraciones.append((time.perf_counter() - t0) * 1e3)
+    app.processEvents()
+    return float(np.percentile(duraciones, 50)), float(np.percentile(duraciones, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", nargs="+", default=[f"{l}:{r}" for l, r in TAMANOS],
+                        help="Barridos como lado:res en mm")
+    parser.add_argument("--modos", nargs="+", default=list(MODOS), choices=list(MODOS))
+    parser.add_argument("--latencia-serial", type=float, default=0.004, help="Segundos por sentido")
+    parser.add_argument("--latencia-gpib", type=float, default=0.008, help="Segundos por consulta")
+    parser.add_argument("--sin-gui", action="store_true", help="No medir tiempos de cuadro")
+    args = parser.parse_args()
+
+    opciones_arduino = {"latencia_serial": args.latencia_serial}
+    opciones_lockin = {"latencia_consulta": args.latencia_gpib}
+
+    filas = []
+    for tamano in args.tamanos:
+        lado, res = (float(v) for v in tamano.split(":"))
+        for modo in args.modos:
+            opciones, rapido = MODOS[modo]
+            r, puntos, llegadas = correr_barrido(lado, res, opciones, rapido, opciones_arduino, opciones_lockin)
+            cuadro = None if args.sin_gui else tiempos_de_cuadro(lado, res, puntos, llegadas)
+            filas.append((tamano, modo, r, cuadro))
+
+    print(f"{'barrido':>10} {'modo':>16} {'pts':>5} {'pts/s':>7} {'mov':>7} {'espera':>7} "
+          f"{'gpib':>7} {'asent':>7} {'tarde':>5} {'cuadro p50/p99':>15}")
+    print(f"{'':>10} {'':>16} {'':>5} {'':>7} {'(ms/pt)':>7} {'(ms/pt)':>7} {'(ms/pt)':>7} {'(ms/pt)':>7}")
+    for tamano, modo, r, cuadro in filas:
+        texto_cuadro = "n/d" if cuadro is None else f"{cuadro[0]:.1f}/{cuadro[1]:.1f} ms"
+        print(f"{tamano:>10} {modo:>16} {r['puntos']:>5} {r['pts_s']:>7.1f} {r['mov_ms']:>7.1f} "
+              f"{r['espera_cont_ms']:>7.1f} {r['gpib_ms']:>7.1f} {r['asent_ms']:>7.1f} "
+              f"{r['tardios']:>5} {texto_cuadro:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark de DataManager.cargar_medicion: carga vectorizada frente a la
+reconstrucción original (fetchall + bucle por punto).
+
+Uso (desde la raíz del repo):
+    python benchmarks/carga_mediciones.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager import DataManager, COLUMNAS_NUMERICAS  # noqa: E402
+
+TAMANOS = (10_000, 100_000, 1_000_000)
+RES = 0.005
+
+
+def cargar_medicion_original(conn, experiment_id):
+    """Copia de la implementación previa, como referencia."""
+    rows = conn.execute("""
+        SELECT x_pos, y_pos, magnitude_r, phase_phi
+        FROM mediciones
+        WHERE experiment_id = ?
+        ORDER BY y_pos ASC, x_pos ASC
+    """, [experiment_id]).fetchall()
+
+    x_vals = np.array([r[0] for r in rows])
+    y_vals = np.array([r[1] for r in rows])
+    r_vals = np.array([r[2] for r in rows])
+    phi_vals = np.array([r[3] for r in rows])
+
+    x_unique = np.unique(x_vals)
+    y_unique = np.unique(y_vals)
+    dx = float(np.diff(x_unique).min()) if len(x_unique) >= 2 else 0.001
+    dy = float(np.diff(y_unique).min()) if len(y_unique) >= 2 else 0.001
+    res = min(dx, dy)
+    x_max = float(x_vals.max())
+    y_max = float(y_vals.max())
+    nx = int(x_max / res) + 1
+    ny = int(y_max / res) + 1
+
+    z_mag = np.full((ny, nx), np.nan)
+    z_fase = np.full((ny, nx), np.nan)
+    for x, y, r, phi in zip(x_vals, y_vals, r_vals, phi_vals):
+        ix = int(np.clip(round(x / res), 0, nx - 1))
+        iy = int(np.clip(round(y / res), 0, ny - 1))
+        z_mag[iy, ix] = r
+        z_fase[iy, ix] = phi
+
+    return {
+        "z_mag": np.nan_to_num(z_mag, nan=0.0),
+        "z_fase": np.nan_to_num(z_fase, nan=0.0),
+    }
+
+
+def poblar(db, experiment_id, n_puntos):
+    """Inserta una malla cuadrada sintética de ~n_puntos en un solo lote."""
+    lado = int(np.sqrt(n_puntos))
+    iy, ix = np.divmod(np.arange(lado * lado), lado)
+    n = ix.size
+    lote = {
+        "timestamp": np.full(n, np.datetime64("2026-01-01T00:00:00", "us")),
+        "x_pos": np.round(ix * RES, 3),
+        "y_pos": np.round(iy * RES, 3),
+        "ch_x": np.random.rand(n),
+        "ch_y": np.random.rand(n),
+        "magnitude_r": np.random.rand(n) * 1e-6,
+        "phase_phi": np.random.rand(n) * 360 - 180,
+        "laser_freq": np.full(n, 10.0),
+    }
+    assert tuple(lote)[1:] == COLUMNAS_NUMERICAS
+    db._escribir_lote(db.conn, experiment_id, lote)
+    return n
+
+
+def medir(func, repeticiones=3):
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = func()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+def main():
+    with tempfile.TemporaryDirectory() as carpeta:
+        db = DataManager(folder=carpeta, max_bytes_cache=0)  # Sin caché: medir la carga real
+        print(f"{'puntos':>10} {'original (s)':>14} {'vectorizado (s)':>16} {'x':>7}")
+        for n_objetivo in TAMANOS:
+            exp_id = f"BENCH_{n_objetivo}"
+            n = poblar(db, exp_id, n_objetivo)
+            rep = 1 if n > 200_000 else 3
+            t_orig, ref = medir(lambda: cargar_medicion_original(db.conn, exp_id), rep)
+            t_vec, nuevo = medir(lambda: db.cargar_medicion(exp_id), rep)
+            assert np.array_equal(ref["z_mag"], nuevo["z_mag"])
+            assert np.array_equal(ref["z_fase"], nuevo["z_fase"])
+            print(f"{n:>10} {t_orig:>14.3f} {t_vec:>16.3f} {t_orig / t_vec:>6.1f}x")
+        db.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark del catálogo de experimentos: listar, cargar y borrar con muchos
+experimentos guardados, frente al listado original (GROUP BY sobre todos
+los puntos), y costo de escribir un lote de 500 filas.
+
+Uso (desde la raíz del repo):
+    python benchmarks/catalogo.py [n_experimentos] [puntos_por_experimento]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_manager import DataManager, MAX_BYTES_CACHE  # noqa: E402
+
+RES = 0.005
+
+
+def lote_sintetico(n, inicio=0):
+    lado = int(np.ceil(np.sqrt(n)))
+    iy, ix = np.divmod(np.arange(inicio, inicio + n), lado)
+    return {
+        "timestamp": np.full(n, np.datetime64("2026-01-01T00:00:00", "us")),
+        "x_pos": np.round(ix * RES, 3),
+        "y_pos": np.round(iy * RES, 3),
+        "ch_x": np.random.rand(n),
+        "ch_y": np.random.rand(n),
+        "magnitude_r": np.random.rand(n) * 1e-6,
+        "phase_phi": np.random.rand(n) * 360 - 180,
+        "laser_freq": np.full(n, 10.0),
+    }
+
+
+def listar_original(conn):
+    """Copia del listado previo al catálogo, como referencia."""
+    return conn.execute("""
+        SELECT experiment_id, MIN(timestamp) as fecha, COUNT(*) as n_puntos
+        FROM mediciones
+        GROUP BY experiment_id
+        ORDER BY fecha DESC
+    """).fetchall()
+
+
+def escribir_lote_original(conn, experiment_id, lote):
+    """Inserción previa: el ID como columna 'object' por fila."""
+    lote = {"experiment_id": np.full(len(lote["timestamp"]), experiment_id, dtype=object), **lote}
+    columnas = ", ".join(lote)
+    conn.register("lote_pendiente", lote)
+    conn.execute(f"INSERT INTO mediciones ({columnas}) SELECT {columnas} FROM lote_pendiente")
+    conn.unregister("lote_pendiente")
+
+
+def medir(func, repeticiones=5):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        func()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def main():
+    n_exp = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_pts = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    with tempfile.TemporaryDirectory() as carpeta:
+        db = DataManager(folder=carpeta, max_bytes_cache=0)  # Sin caché: medir la carga real
+        t0 = time.perf_counter()
+        for k in range(n_exp):
+            db._escribir_lote(db.conn, f"EXP_{k:05d}", lote_sintetico(n_pts))
+        db.conn.execute("CHECKPOINT")
+        print(f"{n_exp} experimentos x {n_pts} puntos cargados en {time.perf_counter() - t0:.1f} s")
+
+        t_orig = medir(lambda: listar_original(db.conn))
+        t_cat = medir(db.listar_mediciones)
+        assert len(db.listar_mediciones()) == n_exp
+        print(f"listar:  GROUP BY {t_orig * 1e3:8.2f} ms   catálogo {t_cat * 1e3:8.2f} ms")
+
+        exp_id = f"EXP_{n_exp // 2:05d}"
+        t_carga = medir(lambda: db.cargar_medicion(exp_id))
+        db.cache_mallas.max_bytes = MAX_BYTES_CACHE
+        db.cargar_medicion(exp_id)
+        t_cache = medir(lambda: db.cargar_medicion(exp_id))
+        print(f"cargar {n_pts} puntos: {t_carga * 1e3:.1f} ms   desde la caché {t_cache * 1e3:.3f} ms")
+        t0 = time.perf_counter()
+        db.eliminar_medicion(f"EXP_{n_exp // 3:05d}")
+        print(f"borrar un experimento: {(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+        lote = lote_sintetico(db.tam_lote)
+        t_orig = medir(lambda: escribir_lote_original(db.conn, "EXP_LOTE_A", lote))
+        t_nuevo = medir(lambda: db._escribir_lote(db.conn, "EXP_LOTE_B", lote))
+        print(f"lote de {db.tam_lote} filas: ID por fila {t_orig * 1e3:7.1f} ms   "
+              f"ID como parámetro + catálogo {t_nuevo * 1e3:7.1f} ms")
+        db.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Bitácora estructurada del programa, sobre el módulo logging estándar.
+
+Los módulos registran con logging.getLogger(__name__). configurar_bitacora()
+instala un QueueHandler en el logger raíz: quien registra solo encola el
+record y un QueueListener, en su propio hilo, lo escribe al archivo rotativo
+y a la consola. El hilo de adquisición nunca espera por la consola o el disco.
+
+Los registros por punto se marcan con extra=PUNTO. Se muestrean antes de
+encolarse (uno de cada 'muestreo_puntos') y por defecto no salen por consola;
+el resumen de cada barrido sí se registra siempre.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+# extra= para los registros por punto del barrido
+PUNTO = {"punto": True}
+
+FORMATO_ARCHIVO = "%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s"
+FORMATO_CONSOLA = "%(levelname)s %(name)s: %(message)s"
+
+_listener = None
+
+
+class FiltroMuestreoPuntos(logging.Filter):
+    """Deja pasar uno de cada 'cada' registros por punto (0 = ninguno)."""
+
+    def __init__(self, cada):
+        super().__init__()
+        self.cada = cada
+        self._vistos = 0
+
+    def filter(self, record):
+        if not getattr(record, "punto", False):
+            return True
+        if self.cada <= 0:
+            return False
+        self._vistos += 1
+        return (self._vistos - 1) % self.cada == 0
+
+
+class FiltroSinPuntos(logging.Filter):
+    """Descarta los registros por punto (para la consola)."""
+
+    def filter(self, record):
+        return not getattr(record, "punto", False)
+
+
+def configurar_bitacora(carpeta=os.path.join("data", "logs"), nivel_consola=logging.INFO,
+                        nivel_archivo=logging.DEBUG, muestreo_puntos=100, puntos_en_consola=False,
+                        max_bytes=5 * 1024 * 1024, respaldos=5):
+    """
+    Configura el logger raíz con escritura asíncrona a
+    '<carpeta>/laboratorio.log' (rotativo) y a la consola.
+    Llamar una vez al arrancar; las llamadas siguientes no hacen nada.
+    Devuelve el QueueListener (se detiene solo al salir del programa).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    os.makedirs(carpeta, exist_ok=True)
+    archivo = logging.handlers.RotatingFileHandler(
+        os.path.join(carpeta, "laboratorio.log"), maxBytes=max_bytes,
+        backupCount=respaldos, encoding="utf-8",
+    )
+    archivo.setLevel(nivel_archivo)
+    archivo.setFormatter(logging.Formatter(FORMATO_ARCHIVO))
+
+    consola = logging.StreamHandler()
+    consola.setLevel(nivel_consola)
+    consola.setFormatter(logging.Formatter(FORMATO_CONSOLA))
+    if not puntos_en_consola:
+        consola.addFilter(FiltroSinPuntos())
+
+    cola = queue.SimpleQueue()
+    en_cola = logging.handlers.QueueHandler(cola)
+    en_cola.addFilter(FiltroMuestreoPuntos(muestreo_puntos))
+
+    raiz = logging.getLogger()
+    raiz.setLevel(min(nivel_consola, nivel_archivo))
+    raiz.addHandler(en_cola)
+
+    _listener = logging.handlers.QueueListener(cola, archivo, consola, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -1,10 +1,106 @@
 import duckdb
 import json
+import logging
 from datetime import datetime
 import os
+import threading
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from instrumentacion import INSTANTES_DB
+from adaptativo import rellenar_jerarquico
+
+log = logging.getLogger(__name__)
+
+# Columnas numéricas de la tabla 'mediciones', en orden
+COLUMNAS_NUMERICAS = ("x_pos", "y_pos", "ch_x", "ch_y", "magnitude_r", "phase_phi", "laser_freq")
+
+# Carga por partes: la vista previa tiene como mucho estas celdas
+MAX_CELDAS_PREVIA = 62_500
+
+# Reintentos de un lote ante un conflicto de escritura con otro cursor
+# (p.ej. guardar_alias sobre la fila del catálogo del barrido en curso)
+REINTENTOS_CONFLICTO = 5
+
+# Memoria máxima de la caché de mallas reconstruidas
+MAX_BYTES_CACHE = 512 * 1024 * 1024
+
+
+class CacheMallas:
+    """
+    Caché LRU de mallas reconstruidas (dicts de cargar_medicion) por
+    experiment_id, acotada en bytes. Los arrays guardados quedan de solo
+    lectura: quien los use debe copiarlos antes de modificarlos. Segura
+    entre hilos: una malla leída antes de una invalidación (p.ej. mientras
+    se escriben puntos de ese experimento) no se guarda, ver version().
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES_CACHE):
+        self.max_bytes = max_bytes
+        self._mallas = OrderedDict()  # experiment_id -> (malla, bytes)
+        self._versiones = {}  # experiment_id -> invalidaciones
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def _tamano(malla):
+        return sum(v.nbytes for v in malla.values() if isinstance(v, np.ndarray))
+
+    def obtener(self, experiment_id):
+        with self._lock:
+            entrada = self._mallas.get(experiment_id)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._mallas.move_to_end(experiment_id)
+            self.aciertos += 1
+            return entrada[0]
+
+    def version(self, experiment_id):
+        """Tomarla antes de leer de la DB y pasarla a guardar()."""
+        with self._lock:
+            return self._versiones.get(experiment_id, 0)
+
+    def guardar(self, experiment_id, malla, version=None):
+        if malla is None:
+            return
+        tamano = self._tamano(malla)
+        if tamano > self.max_bytes:
+            return
+        for v in malla.values():
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+        with self._lock:
+            if version is not None and version != self._versiones.get(experiment_id, 0):
+                return
+            self._quitar(experiment_id)
+            self._mallas[experiment_id] = (malla, tamano)
+            self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                self._quitar(next(iter(self._mallas)))
+
+    def invalidar(self, experiment_id):
+        with self._lock:
+            self._versiones[experiment_id] = self._versiones.get(experiment_id, 0) + 1
+            self._quitar(experiment_id)
+
+    def _quitar(self, experiment_id):
+        entrada = self._mallas.pop(experiment_id, None)
+        if entrada is not None:
+            self.bytes -= entrada[1]
+
+    def estadisticas(self):
+        """{'aciertos', 'fallos', 'mallas', 'bytes', 'max_bytes'}"""
+        with self._lock:
+            return {"aciertos": self.aciertos, "fallos": self.fallos, "mallas": len(self._mallas),
+                    "bytes": self.bytes, "max_bytes": self.max_bytes}
+
 
 class DataManager:
-    def __init__(self, folder="data", db_name="laboratorio_datos.db"):
+    def __init__(self, folder="data", db_name="laboratorio_datos.db", tam_lote=500, intervalo_flush=2.0,
+                 max_bytes_cache=MAX_BYTES_CACHE):
         # 1. Definimos la ruta completa
         self.folder = folder
         self.db_path = os.path.join(self.folder, db_name)
@@ -12,10 +108,33 @@ class DataManager:
         # 2. Creamos la carpeta si no existe (como mkdir -p)
         if not os.path.exists(self.folder):
             os.makedirs(self.folder)
-            print(f"Carpeta '{self.folder}' creada exitosamente.")
+            log.info("Carpeta '%s' creada exitosamente.", self.folder)
             
+        # Una sola conexión por base; cada hilo trabaja con su propio cursor
+        # (ver _cursor). Los puntos los escribe solo el hilo de flush.
         self.conn = None
+        self._cursores = {}
+        self._lock_cursores = threading.Lock()
         self.current_experiment_id = None
+        # {experiment_id: alias}, leído de una vez del catálogo; None = recargar
+        self._aliases = None
+        # Mallas de las mediciones vistas hace poco; se invalidan al escribir o borrar
+        self.cache_mallas = CacheMallas(max_bytes_cache)
+
+        # Escritura por lotes: las filas se acumulan en arrays columnares y un
+        # hilo en segundo plano las inserta cada 'tam_lote' filas o cada
+        # 'intervalo_flush' segundos. Ante un crash se pierde como mucho un lote.
+        # Cada lote es de un solo experimento (el ID va como parámetro, no por fila).
+        self.tam_lote = tam_lote
+        self.intervalo_flush = intervalo_flush
+        self._cond = threading.Condition()
+        self._lotes_listos = []
+        self._lotes_en_vuelo = []  # Tomados por el hilo de flush y aún no escritos
+        self._cerrando = False
+        self._hilo_flush = None
+        # (t_inicio, t_fin, n_filas) de cada lote escrito, en perf_counter
+        self.lotes_escritos = deque(maxlen=1000)
+        self._nuevo_buffer()
         self._inicializar_tabla()
 
     def _inicializar_tabla(self):
@@ -37,177 +156,644 @@ class DataManager:
         );
         """
         self.conn.execute(query)
-        print(f"Base de datos lista en: {self.db_path}")
+        # Instantes por etapa de cada punto (segundos desde el inicio del barrido);
+        # las bases anteriores los reciben como columnas nulas
+        for col in INSTANTES_DB:
+            self.conn.execute(f"ALTER TABLE mediciones ADD COLUMN IF NOT EXISTS {col} DOUBLE")
+
+        # Parámetros de cada barrido, para poder retomarlo con el mismo ID
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS barridos (
+            experiment_id VARCHAR PRIMARY KEY,
+            x_min DOUBLE,
+            y_min DOUBLE,
+            x_max DOUBLE,
+            y_max DOUBLE,
+            res DOUBLE,
+            laser_freq DOUBLE,
+            modo VARCHAR,
+            umbral DOUBLE
+        );
+        """)
+
+        # Catálogo: una fila por experimento, mantenida al escribir cada lote.
+        # Listar no recorre 'mediciones' y sigue siendo O(experimentos).
+        nuevo_catalogo = not self._existe_tabla("experimentos")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS experimentos (
+            experiment_id VARCHAR PRIMARY KEY,
+            inicio TIMESTAMP,
+            fin TIMESTAMP,
+            x_max DOUBLE,
+            y_max DOUBLE,
+            res DOUBLE,
+            laser_freq DOUBLE,
+            n_puntos BIGINT DEFAULT 0,
+            alias VARCHAR
+        );
+        """)
+        if nuevo_catalogo:
+            self._migrar_catalogo()
+        if os.path.exists(self._ruta_aliases()):
+            self._migrar_aliases()
+        log.info("Base de datos lista en: %s", self.db_path)
+
+    def _cursor(self):
+        """
+        Cursor del hilo actual sobre la conexión compartida. Los cursores de
+        DuckDB no se comparten entre hilos; con uno por hilo las lecturas
+        (GUI, cargas en segundo plano) corren a la par de la escritura de
+        lotes y ven el último commit.
+        """
+        ident = threading.get_ident()
+        cursor = self._cursores.get(ident)
+        if cursor is None:
+            with self._lock_cursores:
+                cursor = self._cursores[ident] = self.conn.cursor()
+        return cursor
+
+    def liberar_cursor(self):
+        """Cierra el cursor del hilo actual (llamar al terminar un hilo de trabajo)."""
+        with self._lock_cursores:
+            cursor = self._cursores.pop(threading.get_ident(), None)
+        if cursor is not None:
+            cursor.close()
+
+    def _existe_tabla(self, nombre):
+        return self._cursor().execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [nombre]
+        ).fetchone()[0] > 0
+
+    def _migrar_catalogo(self):
+        """Arma el catálogo desde los puntos de una base anterior y la compacta."""
+        n = self._cursor().execute("SELECT COUNT(*) FROM mediciones").fetchone()[0]
+        if n == 0:
+            return
+        t_inicio = time.perf_counter()
+        self._cursor().execute("""
+            INSERT INTO experimentos (experiment_id, inicio, fin, x_max, y_max, res, laser_freq, n_puntos)
+            SELECT m.experiment_id, MIN(m.timestamp), MAX(m.timestamp),
+                   COALESCE(ANY_VALUE(b.x_max), MAX(m.x_pos)),
+                   COALESCE(ANY_VALUE(b.y_max), MAX(m.y_pos)),
+                   ANY_VALUE(b.res), ARG_MAX(m.laser_freq, m.timestamp), COUNT(*)
+            FROM mediciones m LEFT JOIN barridos b USING (experiment_id)
+            GROUP BY m.experiment_id
+        """)
+        self.compactar()
+        log.info("Catálogo de experimentos creado desde %d puntos en %.1f s",
+                 n, time.perf_counter() - t_inicio)
+
+    def compactar(self):
+        """
+        Reescribe 'mediciones' ordenada por experimento. DuckDB guarda por
+        grupos de filas con el mínimo y máximo de cada columna, así que con
+        cada experimento contiguo un WHERE experiment_id = ? (leer, borrar)
+        solo toca los grupos de ese experimento. Las escrituras normales ya
+        quedan contiguas; conviene compactar tras reanudar o borrar muchos
+        barridos. No llamar con un barrido en curso.
+        """
+        self.flush()
+        cur = self._cursor()
+        cur.execute("BEGIN TRANSACTION")
+        try:
+            cur.execute("""
+                CREATE TABLE mediciones_compacta AS
+                SELECT * FROM mediciones ORDER BY experiment_id, timestamp
+            """)
+            cur.execute("DROP TABLE mediciones")
+            cur.execute("ALTER TABLE mediciones_compacta RENAME TO mediciones")
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("CHECKPOINT")
 
     def iniciar_nuevo_experimento(self):
         """Genera un ID único basado en la fecha y hora actual."""
         # Ejemplo de ID: "EXP_20231027_153022"
         now = datetime.now()
-        self.current_experiment_id = f"EXP_{now.strftime('%Y%m%d_%H%M%S')}"
+        with self._cond:
+            self._sellar_buffer()
+            self.current_experiment_id = f"EXP_{now.strftime('%Y%m%d_%H%M%S')}"
         return self.current_experiment_id
 
+    def reanudar_experimento(self, experiment_id):
+        """Vuelve a guardar en un experimento existente (para retomar un barrido)."""
+        self.flush()
+        self.current_experiment_id = experiment_id
+        return experiment_id
+
+    def guardar_parametros(self, experiment_id, x_min, y_min, x_max, y_max, res, freq, modo="raster", umbral=None):
+        """Guarda (o reemplaza) los parámetros del barrido de un experimento."""
+        try:
+            self._cursor().execute(
+                "INSERT OR REPLACE INTO barridos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [experiment_id, x_min, y_min, x_max, y_max, res, freq, modo, umbral],
+            )
+            # Geometría de la malla en el catálogo (sin tocar los puntos ya contados)
+            self._cursor().execute("""
+                INSERT INTO experimentos (experiment_id, inicio, x_max, y_max, res, laser_freq)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (experiment_id) DO UPDATE SET
+                    x_max = excluded.x_max, y_max = excluded.y_max,
+                    res = excluded.res, laser_freq = excluded.laser_freq
+            """, [experiment_id, datetime.now(), x_max, y_max, res, freq])
+        except Exception as e:
+            log.error("Error guardando parámetros de %s: %s", experiment_id, e)
+
+    def cargar_parametros(self, experiment_id):
+        """Parámetros del barrido como dict, o None si no se guardaron."""
+        try:
+            cur = self._cursor().execute("SELECT * FROM barridos WHERE experiment_id = ?", [experiment_id])
+            fila = cur.fetchone()
+        except Exception as e:
+            log.error("Error cargando parámetros de %s: %s", experiment_id, e)
+            return None
+        if fila is None:
+            return None
+        return dict(zip((d[0] for d in cur.description), fila))
+
+    def puntos_medidos(self, experiment_id):
+        """
+        Puntos ya guardados de un experimento (dict de arrays x_pos, y_pos,
+        magnitude_r, phase_phi), incluidos los que estaban en el buffer.
+        """
+        if experiment_id == self.current_experiment_id:
+            self.flush()
+        try:
+            return self._cursor().execute("""
+                SELECT x_pos, y_pos, magnitude_r, phase_phi
+                FROM mediciones
+                WHERE experiment_id = ?
+            """, [experiment_id]).fetchnumpy()
+        except Exception as e:
+            log.error("Error leyendo puntos de %s: %s", experiment_id, e)
+            return None
+
     def guardar_punto(self, x, y, lockin_data, freq):
         """
-        Inserta una fila de datos.
-        lockin_data: diccionario con keys 'X', 'Y', 'R', 'phi'
+        Añade una fila al buffer de escritura (no toca la DB en este hilo).
+        lockin_data: diccionario con keys 'X', 'Y', 'R', 'phi' y opcionalmente
+        'tiempos' (instantes perf_counter por etapa, ver instrumentacion.py)
         """
         if not self.current_experiment_id:
-            print("ADVERTENCIA: Intentando guardar sin iniciar experimento.")
+            log.warning("Intentando guardar sin iniciar experimento.")
             return
 
-        timestamp = datetime.now()
-        
-        # Preparamos la query parametrizada (Evita errores y es más seguro)
-        query = """
-        INSERT INTO mediciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        with self._cond:
+            if self._buf_id != self.current_experiment_id:
+                self._sellar_buffer()
+                self._buf_id = self.current_experiment_id
+            i = self._n
+            self._buf_ts[i] = np.datetime64(datetime.now(), 'us')
+            fila = (
+                x, y,
+                lockin_data.get('X', 0.0),
+                lockin_data.get('Y', 0.0),
+                lockin_data.get('R', 0.0),
+                lockin_data.get('phi', 0.0),
+                freq,
+            )
+            for col, valor in zip(COLUMNAS_NUMERICAS, fila):
+                self._buf_cols[col][i] = float(valor)
+            tiempos = lockin_data.get('tiempos') or {}
+            t0 = tiempos.get('t0', 0.0)
+            for col in INSTANTES_DB:
+                t = tiempos.get(col)
+                self._buf_cols[col][i] = np.nan if t is None else t - t0
+            self._n += 1
+
+            if self._n >= self.tam_lote:
+                self._sellar_buffer()
+                self._cond.notify_all()
+
+        if self._hilo_flush is None:
+            self._iniciar_hilo_flush()
+
+    # ---------------------------------------------------------
+    # ESCRITURA POR LOTES
+    # ---------------------------------------------------------
+
+    def _nuevo_buffer(self):
+        self._n = 0
+        self._buf_id = self.current_experiment_id
+        self._buf_ts = np.empty(self.tam_lote, dtype='datetime64[us]')
+        self._buf_cols = {col: np.empty(self.tam_lote) for col in COLUMNAS_NUMERICAS + INSTANTES_DB}
+
+    def _sellar_buffer(self):
+        """Pasa el buffer actual a la cola de lotes listos (llamar con el lock)."""
+        if self._n == 0:
+            return
+        n = self._n
+        lote = {"timestamp": self._buf_ts[:n]}
+        for col, valores in self._buf_cols.items():
+            lote[col] = valores[:n]
+        self._lotes_listos.append((self._buf_id, lote))
+        self._nuevo_buffer()
+
+    def _escribir_lote(self, conn, experiment_id, lote):
         """
-        
-        params = (
-            self.current_experiment_id,
-            timestamp,
-            float(x),
-            float(y),
-            float(lockin_data.get('X', 0.0)),
-            float(lockin_data.get('Y', 0.0)),
-            float(lockin_data.get('R', 0.0)),
-            float(lockin_data.get('phi', 0.0)),
-            float(freq)
-        )
-        
+        Inserta un lote columnar de un experimento con una sola sentencia y
+        actualiza su fila del catálogo en la misma transacción. Ante un
+        conflicto con otra transacción se reintenta; no se descartan puntos.
+        (Registrar una columna de strings por fila como array 'object'
+        cuesta ~0.3 s por lote; el ID va como parámetro.)
+        """
+        columnas = ", ".join(lote)
+        n = len(lote["timestamp"])
+        t_inicio = time.perf_counter()
+        try:
+            conn.register("lote_pendiente", lote)
+        except Exception as e:
+            log.error("Error guardando en DB: %s", e)
+            return
         try:
-            self.conn.execute(query, params)
+            for intento in range(REINTENTOS_CONFLICTO):
+                try:
+                    self._insertar_lote(conn, experiment_id, columnas, lote, n)
+                    break
+                except duckdb.TransactionException as e:
+                    _deshacer(conn)
+                    if intento == REINTENTOS_CONFLICTO - 1:
+                        raise
+                    log.warning("Conflicto guardando lote de %s (intento %d): %s", experiment_id, intento + 1, e)
+                    time.sleep(0.05 * (intento + 1))
+            self.cache_mallas.invalidar(experiment_id)
+            self.lotes_escritos.append((t_inicio, time.perf_counter(), n))
         except Exception as e:
-            print(f"Error guardando en DB: {e}")
+            _deshacer(conn)
+            log.error("Error guardando en DB: %s", e)
+        finally:
+            try:
+                conn.unregister("lote_pendiente")
+            except Exception as e:
+                # Que no mate al hilo de flush: flush() esperaría para siempre
+                log.error("Error liberando el lote registrado: %s", e)
+
+    @staticmethod
+    def _insertar_lote(conn, experiment_id, columnas, lote, n):
+        """Puntos del lote + fila del catálogo, en una transacción."""
+        conn.execute("BEGIN TRANSACTION")
+        conn.execute(
+            f"INSERT INTO mediciones (experiment_id, {columnas}) SELECT ?, {columnas} FROM lote_pendiente",
+            [experiment_id],
+        )
+        conn.execute("""
+            INSERT INTO experimentos (experiment_id, inicio, fin, x_max, y_max, laser_freq, n_puntos)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (experiment_id) DO UPDATE SET
+                inicio = LEAST(experimentos.inicio, excluded.inicio),
+                fin = GREATEST(experimentos.fin, excluded.fin),
+                x_max = GREATEST(experimentos.x_max, excluded.x_max),
+                y_max = GREATEST(experimentos.y_max, excluded.y_max),
+                laser_freq = excluded.laser_freq,
+                n_puntos = COALESCE(experimentos.n_puntos, 0) + excluded.n_puntos
+        """, [
+            experiment_id, lote["timestamp"].min().item(), lote["timestamp"].max().item(),
+            float(np.max(lote["x_pos"])), float(np.max(lote["y_pos"])),
+            float(lote["laser_freq"][-1]), n,
+        ])
+        conn.execute("COMMIT")
+
+    def _iniciar_hilo_flush(self):
+        self._hilo_flush = threading.Thread(target=self._bucle_flush, name="DataManagerFlush", daemon=True)
+        self._hilo_flush.start()
+
+    def _bucle_flush(self):
+        # Este hilo es el único que escribe puntos, con su propio cursor
+        cursor = self._cursor()
+        try:
+            while True:
+                with self._cond:
+                    if not self._lotes_listos and not self._cerrando:
+                        self._cond.wait(self.intervalo_flush)
+                    # Vencido el intervalo, también se escriben lotes parciales
+                    self._sellar_buffer()
+                    self._lotes_en_vuelo, self._lotes_listos = self._lotes_listos, []
+                    lotes = list(self._lotes_en_vuelo)
+                    terminar = self._cerrando
+
+                for experiment_id, lote in lotes:
+                    self._escribir_lote(cursor, experiment_id, lote)
+                    with self._cond:
+                        self._lotes_en_vuelo.pop(0)
+
+                with self._cond:
+                    self._cond.notify_all()
+                if terminar:
+                    return
+        finally:
+            self.liberar_cursor()
+
+    def flush(self):
+        """
+        Escribe todo lo pendiente y espera a que quede en la DB. Si el hilo
+        de flush no existe o murió, escribe desde este hilo lo que quedó
+        (incluido el lote que aquel tenía entre manos).
+        """
+        with self._cond:
+            self._sellar_buffer()
+            self._cond.notify_all()
+            # Con timeout, para no colgarse si el hilo muere mientras se espera
+            while self._hilo_flush is not None and self._hilo_flush.is_alive():
+                if self._cond.wait_for(lambda: not self._lotes_listos and not self._lotes_en_vuelo, timeout=0.5):
+                    return
+            lotes = self._lotes_en_vuelo + self._lotes_listos
+            self._lotes_en_vuelo, self._lotes_listos = [], []
+        if lotes and self._hilo_flush is not None:
+            log.error("El hilo de flush terminó; se escriben %d lotes pendientes desde este hilo.", len(lotes))
+        for experiment_id, lote in lotes:
+            self._escribir_lote(self._cursor(), experiment_id, lote)
 
     def listar_mediciones(self):
         """
         Devuelve lista de (experiment_id, timestamp, n_puntos) ordenada por timestamp descendente.
         Útil para poblar un menú desplegable de mediciones disponibles.
+        Lee solo el catálogo 'experimentos'.
         """
         try:
-            result = self.conn.execute("""
-                SELECT experiment_id, MIN(timestamp) as fecha, COUNT(*) as n_puntos
-                FROM mediciones
-                GROUP BY experiment_id
+            result = self._cursor().execute("""
+                SELECT experiment_id, inicio AS fecha, n_puntos
+                FROM experimentos
+                WHERE n_puntos > 0
                 ORDER BY fecha DESC
             """).fetchall()
             return result
         except Exception as e:
-            print(f"Error listando mediciones: {e}")
+            log.error("Error listando mediciones: %s", e)
             return []
 
     def cargar_medicion(self, experiment_id):
         """
         Carga todos los puntos de una medición.
         Devuelve dict con: x_max, y_max, res, xs, ys, z_mag (2D), z_fase (2D)
-        para visualizar en las gráficas 3D.
+        para visualizar en las gráficas 3D. Las mallas vistas hace poco salen
+        de cache_mallas (arrays de solo lectura).
         """
+        if experiment_id == self.current_experiment_id:
+            self.flush()
+        malla = self.cache_mallas.obtener(experiment_id)
+        if malla is not None:
+            return malla
+        version = self.cache_mallas.version(experiment_id)
         try:
-            rows = self.conn.execute("""
+            # fetchnumpy devuelve cada columna como array, sin pasar por tuplas.
+            # Sin ORDER BY: reconstruir_malla dispersa por índice, el orden no importa
+            cur = self._cursor()
+            cols = cur.execute("""
                 SELECT x_pos, y_pos, magnitude_r, phase_phi
                 FROM mediciones
                 WHERE experiment_id = ?
-                ORDER BY y_pos ASC, x_pos ASC
-            """, [experiment_id]).fetchall()
+            """, [experiment_id]).fetchnumpy()
+            malla = _malla_de_columnas(cols, rellenar=self._es_adaptativo(cur, experiment_id))
+            self.cache_mallas.guardar(experiment_id, malla, version)
+            return malla
+        except Exception as e:
+            log.error("Error cargando medición %s: %s", experiment_id, e)
+            return None
 
-            if not rows:
-                return None
+    @staticmethod
+    def _es_adaptativo(cur, experiment_id):
+        """Solo las mallas de barridos adaptativos se rellenan al reconstruirlas."""
+        fila = cur.execute("SELECT modo FROM barridos WHERE experiment_id = ?", [experiment_id]).fetchone()
+        return fila is not None and fila[0] == "adaptativo"
+
+    def cargar_medicion_por_partes(self, experiment_id, tramos=8, max_celdas_previa=MAX_CELDAS_PREVIA):
+        """
+        Carga una medición en pasos, para hacerlo en un hilo aparte. Generador
+        que entrega, en orden:
+            ("previa", malla)       un punto de cada k por eje, si la medición
+                                    tiene más de max_celdas_previa puntos
+            ("progreso", fracción)  tras leer cada franja de filas (en y)
+            ("completa", malla)     igual que cargar_medicion (None si no hay puntos)
+        Si la malla está en cache_mallas solo se entrega ("completa", malla).
+        Dejar de iterar cancela la carga entre franjas. Los errores de la DB
+        se propagan.
+        """
+        if experiment_id == self.current_experiment_id:
+            self.flush()
+        malla = self.cache_mallas.obtener(experiment_id)
+        if malla is not None:
+            yield "completa", malla
+            return
+        version = self.cache_mallas.version(experiment_id)
+        cur = self._cursor()
+        fila = cur.execute(
+            "SELECT y_max, res, n_puntos FROM experimentos WHERE experiment_id = ?", [experiment_id]
+        ).fetchone()
+        y_max, res, n_puntos = fila if fila is not None else (None, None, 0)
+        rellenar = self._es_adaptativo(cur, experiment_id)
+
+        if res and n_puntos > max_celdas_previa:
+            k = int(np.ceil(np.sqrt(n_puntos / max_celdas_previa)))
+            cols = cur.execute("""
+                SELECT x_pos, y_pos, magnitude_r, phase_phi
+                FROM mediciones
+                WHERE experiment_id = ?
+                  AND CAST(round(x_pos / ?) AS BIGINT) % ? = 0
+                  AND CAST(round(y_pos / ?) AS BIGINT) % ? = 0
+            """, [experiment_id, res, k, res, k]).fetchnumpy()
+            previa = _malla_de_columnas(cols, rellenar)
+            if previa is not None:
+                yield "previa", previa
+
+        # Franjas en y: en un barrido por filas cada una cae en pocos grupos de filas
+        if not y_max:
+            tramos = 1
+        bordes = np.linspace(0.0, y_max or 0.0, tramos + 1)
+        bordes[0], bordes[-1] = -np.inf, np.inf
+        partes = []
+        for i in range(tramos):
+            partes.append(cur.execute("""
+                SELECT x_pos, y_pos, magnitude_r, phase_phi
+                FROM mediciones
+                WHERE experiment_id = ? AND y_pos >= ? AND y_pos < ?
+            """, [experiment_id, float(bordes[i]), float(bordes[i + 1])]).fetchnumpy())
+            yield "progreso", (i + 1) / tramos
+
+        cols = {col: np.concatenate([np.asarray(p[col], dtype=float) for p in partes])
+                for col in ("x_pos", "y_pos", "magnitude_r", "phase_phi")}
+        malla = _malla_de_columnas(cols, rellenar)
+        self.cache_mallas.guardar(experiment_id, malla, version)
+        yield "completa", malla
 
-            import numpy as np
-            x_vals = np.array([r[0] for r in rows])
-            y_vals = np.array([r[1] for r in rows])
-            r_vals = np.array([r[2] for r in rows])
-            phi_vals = np.array([r[3] for r in rows])
-
-            x_unique = np.unique(x_vals)
-            y_unique = np.unique(y_vals)
-
-            if len(x_unique) < 2:
-                dx = 0.001
-            else:
-                dx = float(np.diff(x_unique).min())
-            if len(y_unique) < 2:
-                dy = 0.001
-            else:
-                dy = float(np.diff(y_unique).min())
-            res = min(dx, dy)
-            x_max = float(x_vals.max())
-            y_max = float(y_vals.max())
-
-            nx = int(x_max / res) + 1
-            ny = int(y_max / res) + 1
-
-            z_mag = np.zeros((ny, nx))
-            z_fase = np.zeros((ny, nx))
-            z_mag.fill(np.nan)
-            z_fase.fill(np.nan)
-
-            for i, (x, y, r, phi) in enumerate(zip(x_vals, y_vals, r_vals, phi_vals)):
-                ix = int(np.clip(round(x / res), 0, nx - 1))
-                iy = int(np.clip(round(y / res), 0, ny - 1))
-                z_mag[iy, ix] = r
-                z_fase[iy, ix] = phi
-
-            z_mag = np.nan_to_num(z_mag, nan=0.0)
-            z_fase = np.nan_to_num(z_fase, nan=0.0)
-
-            return {
-                "x_max": x_max,
-                "y_max": y_max,
-                "res": res,
-                "xs": np.linspace(0, x_max, nx),
-                "ys": np.linspace(0, y_max, ny),
-                "z_mag": z_mag,
-                "z_fase": z_fase,
-            }
+    def cargar_tiempos(self, experiment_id):
+        """
+        Devuelve los instantes por etapa de cada punto (segundos desde el
+        inicio del barrido) como dict de arrays, en orden de adquisición.
+        """
+        if experiment_id == self.current_experiment_id:
+            self.flush()
+        try:
+            return self._cursor().execute(f"""
+                SELECT x_pos, y_pos, {", ".join(INSTANTES_DB)}
+                FROM mediciones
+                WHERE experiment_id = ?
+                ORDER BY t_pos ASC NULLS LAST, timestamp ASC
+            """, [experiment_id]).fetchnumpy()
         except Exception as e:
-            print(f"Error cargando medición {experiment_id}: {e}")
+            log.error("Error cargando tiempos de %s: %s", experiment_id, e)
             return None
 
     def _ruta_aliases(self):
+        """aliases.json de versiones anteriores (los alias ahora van en 'experimentos')."""
         return os.path.join(self.folder, "aliases.json")
 
-    def obtener_alias(self, experiment_id):
-        """Devuelve el alias de una medición, o None si no existe."""
+    def _migrar_aliases(self):
+        """Pasa los alias de aliases.json al catálogo y renombra el archivo."""
         path = self._ruta_aliases()
-        if not os.path.exists(path):
-            return None
         try:
             with open(path, "r", encoding="utf-8") as f:
                 aliases = json.load(f)
-            return aliases.get(experiment_id)
-        except (json.JSONDecodeError, IOError):
-            return None
+        except (json.JSONDecodeError, IOError) as e:
+            log.warning("No se pudo leer %s para migrar los alias: %s", path, e)
+            return
+        filas = [[alias.strip(), exp_id] for exp_id, alias in aliases.items()
+                 if isinstance(alias, str) and alias.strip()]
+        if filas:
+            # No pisa alias ya guardados en la DB
+            self._cursor().executemany(
+                "UPDATE experimentos SET alias = ? WHERE experiment_id = ? AND alias IS NULL", filas
+            )
+        os.replace(path, path + ".migrado")
+        log.info("Alias de %s migrados a la base de datos (%d entradas)", path, len(filas))
 
-    def guardar_alias(self, experiment_id, alias):
-        """Guarda un alias (seudónimo) para una medición."""
-        path = self._ruta_aliases()
-        aliases = {}
-        if os.path.exists(path):
+    def obtener_aliases(self):
+        """{experiment_id: alias} de todas las mediciones con alias (una sola consulta, cacheada)."""
+        if self._aliases is None:
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    aliases = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                pass
-        alias_limpio = (alias or "").strip()
-        if alias_limpio:
-            aliases[experiment_id] = alias_limpio
-        else:
-            aliases.pop(experiment_id, None)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(aliases, f, indent=2, ensure_ascii=False)
+                self._aliases = dict(self._cursor().execute(
+                    "SELECT experiment_id, alias FROM experimentos WHERE alias IS NOT NULL"
+                ).fetchall())
+            except Exception as e:
+                log.error("Error leyendo alias: %s", e)
+                return {}
+        return self._aliases
+
+    def obtener_alias(self, experiment_id):
+        """Devuelve el alias de una medición, o None si no existe."""
+        return self.obtener_aliases().get(experiment_id)
+
+    def guardar_alias(self, experiment_id, alias):
+        """Guarda un alias (seudónimo) para una medición; vacío lo borra."""
+        alias_limpio = (alias or "").strip() or None
+        try:
+            self._cursor().execute("""
+                INSERT INTO experimentos (experiment_id, alias) VALUES (?, ?)
+                ON CONFLICT (experiment_id) DO UPDATE SET alias = excluded.alias
+            """, [experiment_id, alias_limpio])
+        except Exception as e:
+            log.error("Error guardando alias de %s: %s", experiment_id, e)
+        finally:
+            self._aliases = None
 
     def eliminar_medicion(self, experiment_id):
         """Elimina todos los datos de una medición de la base de datos."""
+        cur = self._cursor()
         try:
-            self.conn.execute("DELETE FROM mediciones WHERE experiment_id = ?", [experiment_id])
-            self.guardar_alias(experiment_id, "")
+            cur.execute("BEGIN TRANSACTION")
+            for tabla in ("mediciones", "barridos", "experimentos"):
+                cur.execute(f"DELETE FROM {tabla} WHERE experiment_id = ?", [experiment_id])
+            cur.execute("COMMIT")
             return True
         except Exception as e:
-            print(f"Error eliminando medición {experiment_id}: {e}")
+            _deshacer(cur)
+            log.error("Error eliminando medición %s: %s", experiment_id, e)
             return False
+        finally:
+            self._aliases = None  # El alias se borra con la fila del catálogo
+            self.cache_mallas.invalidar(experiment_id)
 
     def cerrar(self):
+        self.flush()
+        if self._hilo_flush is not None:
+            with self._cond:
+                self._cerrando = True
+                self._cond.notify_all()
+            self._hilo_flush.join()
+            self._hilo_flush = None
+        with self._lock_cursores:
+            cursores, self._cursores = list(self._cursores.values()), {}
+        for cursor in cursores:
+            cursor.close()
         if self.conn:
             self.conn.close()
-            print("Conexión a DB cerrada.")
\ No newline at end of file
+            log.info("Conexión a DB cerrada.")
+
+
+def _deshacer(conn):
+    """ROLLBACK que no falla si no había transacción abierta (no tapa el error original)."""
+    try:
+        conn.execute("ROLLBACK")
+    except duckdb.Error:
+        pass
+
+
+def _malla_de_columnas(cols, rellenar=False):
+    """reconstruir_malla a partir del dict de columnas de fetchnumpy."""
+    return reconstruir_malla(
+        np.asarray(cols["x_pos"], dtype=float),
+        np.asarray(cols["y_pos"], dtype=float),
+        np.asarray(cols["magnitude_r"], dtype=float),
+        np.asarray(cols["phase_phi"], dtype=float),
+        rellenar=rellenar,
+    )
+
+
+def reconstruir_malla(x_vals, y_vals, r_vals, phi_vals, rellenar=False):
+    """
+    Reconstruye las mallas 2D de R y φ a partir de puntos sueltos.
+    La resolución se infiere del menor paso entre coordenadas distintas.
+    Todo es vectorizado: los índices se calculan de una vez y se
+    dispersan en las mallas con indexado avanzado. Con rellenar=True (solo
+    barridos adaptativos) las celdas no medidas se rellenan con
+    rellenar_jerarquico; si no, quedan en 0 (p.ej. un barrido abortado).
+    Devuelve None si no hay puntos.
+    """
+    if x_vals.size == 0:
+        return None
+
+    x_unique = np.unique(x_vals)
+    y_unique = np.unique(y_vals)
+
+    if len(x_unique) < 2:
+        dx = 0.001
+    else:
+        dx = float(np.diff(x_unique).min())
+    if len(y_unique) < 2:
+        dy = 0.001
+    else:
+        dy = float(np.diff(y_unique).min())
+    res = min(dx, dy)
+    x_max = float(x_vals.max())
+    y_max = float(y_vals.max())
+
+    nx = int(x_max / res) + 1
+    ny = int(y_max / res) + 1
+
+    ix = np.clip(np.rint(x_vals / res), 0, nx - 1).astype(np.intp)
+    iy = np.clip(np.rint(y_vals / res), 0, ny - 1).astype(np.intp)
+
+    # Las celdas sin medir (o con NaN) quedan en 0
+    z_mag = np.zeros((ny, nx))
+    z_fase = np.zeros((ny, nx))
+    z_mag[iy, ix] = r_vals
+    z_fase[iy, ix] = phi_vals
+    np.nan_to_num(z_mag, copy=False, nan=0.0)
+    np.nan_to_num(z_fase, copy=False, nan=0.0)
+
+    if rellenar and x_vals.size < nx * ny:
+        medido = np.zeros((ny, nx), dtype=bool)
+        medido[iy, ix] = True
+        z_mag = rellenar_jerarquico(z_mag, medido)
+        z_fase = rellenar_jerarquico(z_fase, medido)
+
+    return {
+        "x_max": x_max,
+        "y_max": y_max,
+        "res": res,
+        "xs": np.linspace(0, x_max, nx),
+        "ys": np.linspace(0, y_max, ny),
+        "z_mag": z_mag,
+        "z_fase": z_fase,
+    }
@@ -1,19 +1,94 @@
 import sys
+import math
 import numpy as np
 if not hasattr(np, 'product'):
     np.product = np.prod
 
+import pyqtgraph as pg
 import pyqtgraph.opengl as gl
-from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QGridLayout
 from PyQt6.QtGui import QVector3D, QFont
 from PyQt6.QtCore import QTimer, QEvent, Qt
-import matplotlib.pyplot as plt
+
+# Vértices máximos de la superficie mostrada (por gráfica)
+MAX_VERTICES = 250_000
+# La región refinada al acercar la cámara es algo mayor que lo visible
+MARGEN_LOD = 1.5
+
+# Mapa de colores 'gist_rainbow' (mismos nodos que matplotlib), como tabla
+# float32 precalculada y compartida por todas las gráficas
+NODOS_GIST_RAINBOW = (
+    (0.000, (1.00, 0.00, 0.16)),
+    (0.030, (1.00, 0.00, 0.00)),
+    (0.215, (1.00, 1.00, 0.00)),
+    (0.400, (0.00, 1.00, 0.00)),
+    (0.586, (0.00, 1.00, 1.00)),
+    (0.770, (0.00, 0.00, 1.00)),
+    (0.954, (1.00, 0.00, 1.00)),
+    (1.000, (1.00, 0.00, 0.75)),
+)
+ENTRADAS_LUT = 4096
+
+
+def tabla_colores(nodos=NODOS_GIST_RAINBOW, n=ENTRADAS_LUT):
+    """Tabla RGBA (n, 4) float32 interpolando linealmente entre los nodos."""
+    posiciones = [p for p, _ in nodos]
+    t = np.linspace(0.0, 1.0, n)
+    lut = np.ones((n, 4), dtype=np.float32)
+    for canal in range(3):
+        lut[:, canal] = np.interp(t, posiciones, [c[canal] for _, c in nodos])
+    return lut
+
+
+LUT = tabla_colores()
+
+
+def colorear(z_norm, salida, lut=LUT):
+    """
+    Escribe en 'salida' (m, 4) el color de cada valor de z_norm (m valores
+    en [0, 1]) cuantizado a una entrada de la tabla. Sin arrays nuevos del
+    tamaño de la malla salvo los índices.
+    """
+    indices = np.multiply(z_norm, len(lut) - 1).astype(np.int32)
+    # mode='clip' satura los índices fuera de rango y evita el chequeo de límites
+    np.take(lut, indices, axis=0, out=salida, mode='clip')
+    return salida
+
+
+def agregar_bloques(z, b, modo="mean"):
+    """
+    Reduce una malla 2D (o un eje 1D) por bloques de b × b celdas con la
+    media o el máximo. Los bloques del borde que no están completos usan
+    solo las celdas que tienen.
+    """
+    if b <= 1:
+        return z
+    z = np.asarray(z, dtype=float)
+    faltan = [(0, (-n) % b) for n in z.shape]
+    if any(f for _, f in faltan):
+        z = np.pad(z, faltan, constant_values=np.nan)
+    forma = []
+    for n in z.shape:
+        forma += [n // b, b]
+    bloques = z.reshape(forma)
+    ejes = tuple(range(1, 2 * z.ndim, 2))
+    return np.nanmax(bloques, axis=ejes) if modo == "max" else np.nanmean(bloques, axis=ejes)
 
 
 class Grafica3DRealTime(QWidget):
-    def __init__(self, titulo_z="R (µV)"): # <--- Añadimos el título por defecto
+    def __init__(self, titulo_z="R (µV)", umbral_reescalado=0.1, max_vertices=MAX_VERTICES,
+                 agregacion="mean"): # <--- Añadimos el título por defecto
         super().__init__()
         self.titulo_z_texto = titulo_z # Guardamos el nombre del eje
+        # Fracción del rango aplicado que puede crecer el rango real antes de
+        # forzar un reescalado completo de la malla (ruta incremental)
+        self.umbral_reescalado = umbral_reescalado
+        # Nivel de detalle: z_raw queda a resolución completa, pero la
+        # superficie muestra bloques de b × b celdas ("mean" o "max") para no
+        # pasar de max_vertices. Al acercar la cámara se muestra solo la
+        # región visible, con bloques más chicos.
+        self.max_vertices = max_vertices
+        self.agregacion = agregacion
         
         # Definimos una fuente pequeña para los ejes
         self.font_ejes = QFont('Arial', 8) 
@@ -33,7 +108,7 @@ class Grafica3DRealTime(QWidget):
         # Estado interno
         self.surface_item = None
         self.axes_items = []
-        self.cmap = plt.get_cmap('gist_rainbow')
+        self._colores = None  # Buffer RGBA float32 de la superficie, se reutiliza
 
         self.z_max_historico = 1e-9
         self.z_scale_factor = 1.0
@@ -41,6 +116,11 @@ class Grafica3DRealTime(QWidget):
         self._z_scale_dragging = False
         self._z_scale_last_y = 0
 
+        # Recalcular el nivel de detalle cuando la cámara deja de moverse
+        self._timer_lod = QTimer(self)
+        self._timer_lod.setSingleShot(True)
+        self._timer_lod.timeout.connect(self._actualizar_lod)
+
         self.mostrar_vista_previa()
         self.view.installEventFilter(self)
 
@@ -75,10 +155,22 @@ class Grafica3DRealTime(QWidget):
         self.ys = np.linspace(0, y_max, self.ny)
 
         self.z_raw = np.zeros((self.ny, self.nx))
-        self.z_grid = np.zeros((self.ny, self.nx))
+        # Región de z_raw mostrada y tamaño de bloque: (iy0, iy1, ix0, ix1, b)
+        self._lod = self._region_lod(0, self.ny, 0, self.nx)
+        xs_vista, ys_vista = self._ejes_lod()
+        self.z_grid = np.zeros((len(ys_vista), len(xs_vista)))
 
         self.z_max_historico = 1e-9
 
+        # Estado de la ruta incremental: min/max en curso, escala aplicada
+        # en la última reescala completa y celdas pendientes de recolorear
+        self._z_min_run = 0.0
+        self._z_max_run = 0.0
+        self._z_min_aplicado = 0.0
+        self._rng_aplicado = 1e-12
+        self._scale_aplicada = None
+        self._celdas_sucias = []
+
         if self.surface_item:
             self.view.removeItem(self.surface_item)
 
@@ -86,13 +178,14 @@ class Grafica3DRealTime(QWidget):
             self.view.removeItem(item)
         self.axes_items = []
 
-        colores = self.cmap(np.zeros_like(self.z_grid)).reshape(-1, 4)
+        self._colores = self._buffer_colores(self.z_grid.size)
+        colorear(np.zeros(self.z_grid.size), self._colores)
 
         self.surface_item = gl.GLSurfacePlotItem(
-            x=self.xs,
-            y=self.ys,
+            x=xs_vista,
+            y=ys_vista,
             z=self.z_grid,
-            colors=colores,
+            colors=self._colores,
             shader='shaded',
             smooth=False
         )
@@ -102,6 +195,57 @@ class Grafica3DRealTime(QWidget):
         self._dibujar_ejes_enumerados()
         self.ajustar_camara(x_max, y_max)
 
+    # ---------------------------------------------------------
+    # NIVEL DE DETALLE
+    # ---------------------------------------------------------
+
+    def _buffer_colores(self, n):
+        """Buffer de colores para n vértices: reutiliza el actual si el tamaño coincide."""
+        if self._colores is None or len(self._colores) != n:
+            return np.empty((n, 4), dtype=np.float32)
+        return self._colores
+
+    def _region_lod(self, iy0, iy1, ix0, ix1):
+        """Región alineada al tamaño de bloque que la deja dentro del presupuesto."""
+        celdas = (iy1 - iy0) * (ix1 - ix0)
+        b = max(1, math.ceil(math.sqrt(celdas / self.max_vertices))) if self.max_vertices else 1
+        iy0, ix0 = (iy0 // b) * b, (ix0 // b) * b
+        return iy0, iy1, ix0, ix1, b
+
+    def _ejes_lod(self):
+        """Coordenadas (centro de cada bloque) de la superficie mostrada."""
+        iy0, iy1, ix0, ix1, b = self._lod
+        return agregar_bloques(self.xs[ix0:ix1], b), agregar_bloques(self.ys[iy0:iy1], b)
+
+    def _z_lod(self):
+        iy0, iy1, ix0, ix1, b = self._lod
+        return agregar_bloques(self.z_raw[iy0:iy1, ix0:ix1], b, self.agregacion)
+
+    def _region_visible(self):
+        """Índices de z_raw que entran en la vista actual (con margen)."""
+        opts = self.view.opts
+        centro = opts['center']
+        media = opts['distance'] * math.tan(math.radians(opts['fov']) / 2) * MARGEN_LOD
+        ix0 = int(np.clip(math.floor((centro.x() - media) / self.res), 0, self.nx - 1))
+        ix1 = int(np.clip(math.ceil((centro.x() + media) / self.res) + 1, ix0 + 1, self.nx))
+        iy0 = int(np.clip(math.floor((centro.y() - media) / self.res), 0, self.ny - 1))
+        iy1 = int(np.clip(math.ceil((centro.y() + media) / self.res) + 1, iy0 + 1, self.ny))
+        return iy0, iy1, ix0, ix1
+
+    def _actualizar_lod(self):
+        """Rearma la superficie si la vista pide otra región o tamaño de bloque."""
+        if self.surface_item is None or not self.max_vertices or self.nx * self.ny <= self.max_vertices:
+            return
+        lod = self._region_lod(*self._region_visible())
+        if lod == self._lod:
+            return
+        self._lod = lod
+        xs_vista, ys_vista = self._ejes_lod()
+        self.z_grid = np.zeros((len(ys_vista), len(xs_vista)))
+        self._colores = self._buffer_colores(self.z_grid.size)
+        self.surface_item.setData(x=xs_vista, y=ys_vista, z=self.z_grid)
+        self._recalcular_superficie()
+
     # ---------------------------------------------------------
     # ESCALADO Z
     # ---------------------------------------------------------
@@ -133,20 +277,85 @@ class Grafica3DRealTime(QWidget):
         else:
             scale = self.z_scale_factor
 
-        self.z_grid = (self.z_raw - z_min) * scale
+        # Referencia para la ruta incremental hasta la próxima reescala
+        self._z_min_run = z_min
+        self._z_max_run = z_max
+        self._z_min_aplicado = z_min
+        self._rng_aplicado = rng
+        self._scale_aplicada = scale
+        self._celdas_sucias = []
+
+        # La escala sale de z_raw completo: no cambia al cambiar el detalle
+        z_vista = self._z_lod()
+        self.z_grid = (z_vista - z_min) * scale
 
         if rng > 1e-12:
-            z_norm = (self.z_raw - z_min) / rng
+            z_norm = self.z_grid.reshape(-1) * (1.0 / (rng * scale))  # (z - z_min) / rng
         else:
-            z_norm = np.zeros_like(self.z_raw)
+            z_norm = np.zeros(self.z_grid.size)
 
-        colores = self.cmap(z_norm).reshape(-1, 4)
-        self.surface_item.setData(z=self.z_grid, colors=colores)
+        colorear(z_norm, self._colores)
+        self.surface_item.setData(z=self.z_grid, colors=self._colores)
 
-        z_visual_range = max(float(np.ptp(self.z_grid)), 0.01)
+        z_visual_range = max((z_max - z_min) * scale, 0.01)
         self._actualizar_eje_z_visual(z_min, z_max, z_visual_range)
         self.view.update()
 
+    def _requiere_reescalado(self):
+        """True si el rango real se salió del aplicado más allá del umbral."""
+        if self._scale_aplicada is None:
+            return True
+        margen = self.umbral_reescalado * self._rng_aplicado
+        z_max_aplicado = self._z_min_aplicado + self._rng_aplicado
+        return (self._z_min_run < self._z_min_aplicado - margen or
+                self._z_max_run > z_max_aplicado + margen)
+
+    def _aplicar_cambios(self):
+        """
+        Ruta incremental: recalcula altura y color solo de las celdas sucias
+        con la escala vigente. Si el rango cambió más que el umbral, hace
+        una reescala completa.
+        """
+        if self.surface_item is None or not self._celdas_sucias:
+            return
+
+        if self._requiere_reescalado():
+            self._recalcular_superficie()
+            return
+
+        idx = np.fromiter(self._celdas_sucias, dtype=np.intp)
+        self._celdas_sucias = []
+
+        # Celdas de z_raw -> bloques de la superficie mostrada
+        iy0, iy1, ix0, ix1, b = self._lod
+        iy, ix = np.divmod(idx, self.nx)
+        dentro = (iy >= iy0) & (iy < iy1) & (ix >= ix0) & (ix < ix1)
+        if not dentro.any():
+            return
+        by, bx = (iy[dentro] - iy0) // b, (ix[dentro] - ix0) // b
+        idx = np.unique(by * self.z_grid.shape[1] + bx)
+        by, bx = np.divmod(idx, self.z_grid.shape[1])
+        if b == 1:
+            z = self.z_raw[iy0 + by, ix0 + bx]
+        else:
+            agregar = np.max if self.agregacion == "max" else np.mean
+            z = np.array([
+                agregar(self.z_raw[iy0 + i * b:min(iy0 + (i + 1) * b, iy1), ix0 + j * b:min(ix0 + (j + 1) * b, ix1)])
+                for i, j in zip(by, bx)
+            ])
+        self.z_grid.reshape(-1)[idx] = (z - self._z_min_aplicado) * self._scale_aplicada
+
+        if self._rng_aplicado > 1e-12:
+            z_norm = np.clip((z - self._z_min_aplicado) / self._rng_aplicado, 0.0, 1.0)
+        else:
+            z_norm = np.zeros_like(z)
+        self._colores[idx] = colorear(z_norm, np.empty((len(idx), 4), dtype=np.float32))
+
+        # GLSurfacePlotItem no permite subir un subrango: se reutilizan los
+        # mismos buffers, pero sin recalcular la malla completa en CPU
+        self.surface_item.setData(z=self.z_grid, colors=self._colores)
+        self.view.update()
+
     # ---------------------------------------------------------
     # EJE Z CON MAGNITUD REAL
     # ---------------------------------------------------------
@@ -258,6 +467,8 @@ class Grafica3DRealTime(QWidget):
             return False
 
         t = event.type()
+        if t in (QEvent.Type.Wheel, QEvent.Type.MouseButtonRelease):
+            self._timer_lod.start(150)  # Zoom o fin de un arrastre de cámara
         if t == QEvent.Type.MouseButtonPress and event.button() == Qt.MouseButton.RightButton:
             self._z_scale_dragging = True
             self._z_scale_last_y = event.position().y() if hasattr(event, 'position') else event.pos().y()
@@ -288,6 +499,19 @@ class Grafica3DRealTime(QWidget):
     # ---------------------------------------------------------
 
     def actualizar_punto(self, x_val, y_val, z_val):
+        self._registrar_punto(x_val, y_val, z_val)
+        self._aplicar_cambios()
+
+    def actualizar_puntos(self, puntos):
+        """
+        Aplica un lote de puntos (x, y, z) con un único redibujado.
+        Lo usa el planificador de render de la GUI para agrupar llegadas.
+        """
+        for x_val, y_val, z_val in puntos:
+            self._registrar_punto(x_val, y_val, z_val)
+        self._aplicar_cambios()
+
+    def _registrar_punto(self, x_val, y_val, z_val):
         ix = int(np.clip(round(x_val / self.res), 0, self.nx - 1))
         iy = int(np.clip(round(y_val / self.res), 0, self.ny - 1))
 
@@ -297,7 +521,13 @@ class Grafica3DRealTime(QWidget):
         if abs_z > self.z_max_historico:
             self.z_max_historico = abs_z
 
-        self._recalcular_superficie()
+        # Min/max en curso: solo crecen, el reescalado completo los reajusta
+        if z_val < self._z_min_run:
+            self._z_min_run = z_val
+        if z_val > self._z_max_run:
+            self._z_max_run = z_val
+
+        self._celdas_sucias.append(iy * self.nx + ix)
 
     def cargar_datos_completos(self, x_max, y_max, res, z_grid):
         """
@@ -313,6 +543,47 @@ class Grafica3DRealTime(QWidget):
         self._recalcular_superficie()
 
 
+class VentanaLatencias(QWidget):
+    """
+    Histogramas en vivo de la latencia por etapa del barrido (ms), con
+    p50/p99 en el título de cada uno. Lee un RegistroLatencias cada
+    medio segundo mientras está visible.
+    """
+
+    def __init__(self, registro, etapas, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Latencias por etapa")
+        self.resize(900, 600)
+        self.registro = registro
+
+        grid = QGridLayout(self)
+        self.graficos = {}
+        for i, etapa in enumerate(etapas):
+            plot = pg.PlotWidget()
+            plot.setLabel('bottom', 'ms')
+            curva = plot.plot([0, 1], [0], stepMode="center", fillLevel=0, brush=(80, 160, 255, 150))
+            grid.addWidget(plot, i // 3, i % 3)
+            self.graficos[etapa] = (plot, curva)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refrescar)
+        self.timer.start(500)
+
+    def refrescar(self):
+        if not self.isVisible():
+            return
+        percentiles = self.registro.percentiles()
+        for etapa, (plot, curva) in self.graficos.items():
+            hist = self.registro.histograma(etapa)
+            if hist is None:
+                plot.setTitle(f"{etapa}: sin datos")
+                continue
+            conteos, bordes = hist
+            curva.setData(bordes, conteos)
+            p50, p99, n = percentiles[etapa]
+            plot.setTitle(f"{etapa}: p50 {p50 * 1e3:.1f} / p99 {p99 * 1e3:.1f} ms (n={n})")
+
+
 # ---------------------------------------------------------
 # PRUEBA AUTOMÁTICA
 # ---------------------------------------------------------
@@ -1,13 +1,23 @@
 import sys
+import os
 import time
+import logging
+import numpy as np
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QLabel, QPushButton, QSlider, QFrame, QMessageBox, QLineEdit, QComboBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QHBoxLayout, QLabel, QPushButton, QSlider, QFrame, QMessageBox, QLineEdit, QComboBox,
+                             QCheckBox, QProgressBar)
+from PyQt6.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal
 
-# Importar nuestros módulos
-from graficar import Grafica3DRealTime
-from mesaxy import MesaXY
-from data_manager import DataManager
+# Importar nuestros módulos. graficar (pyqtgraph/OpenGL), mesaxy (pyserial,
+# pyvisa) y data_manager (duckdb) se importan la primera vez que se usan,
+# para que la ventana aparezca antes (ver MainWindow._tras_mostrar).
+from instrumentacion import RegistroLatencias, ETAPAS, exportar_chrome_trace, puntos_desde_columnas
+from adaptativo import EscaneoAdaptativo
+from bitacora import configurar_bitacora
+
+log = logging.getLogger(__name__)
+
+CARPETA_DATOS = "data"
 
 
 class HomeWorker(QThread):
@@ -33,18 +43,34 @@ class WorkerThread(QThread):
     finished_signal = pyqtSignal()
     error_signal = pyqtSignal(str)
 
-    def __init__(self, mesa_instance, x_max, y_max, res):
+    def __init__(self, mesa_instance, x_max, y_max, res, usar_buffer=False, pipeline=False, ventana_cont=1,
+                 plan=None, puntos=None, fly=False):
         super().__init__()
         self.mesa = mesa_instance
         self.x_max = x_max
         self.y_max = y_max
         self.res = res
+        self.usar_buffer = usar_buffer
+        self.pipeline = pipeline
+        self.ventana_cont = ventana_cont
+        self.plan = plan  # EscaneoAdaptativo, o None para el barrido completo
+        self.puntos = puntos  # Lista de (x, y) para recorrer con POINTS, o None
+        self.fly = fly  # Movimiento continuo por filas (FLY)
 
     def run(self):
         try:
             # 3. Iniciar el generador
-            # Pasamos un parámetro extra para saber que es un inicio real
-            for x, y, z_data in self.mesa.sweep_and_measure_generator(self.x_max, self.y_max, self.res):
+            opciones = dict(usar_buffer=self.usar_buffer, pipeline=self.pipeline,
+                            ventana_cont=self.ventana_cont)
+            if self.plan is not None:
+                generador = self.mesa.adaptive_sweep_generator(self.plan, **opciones)
+            elif self.puntos is not None:
+                generador = self.mesa.measure_points_generator(self.puntos, **opciones)
+            elif self.fly:
+                generador = self.mesa.fly_scan_generator(self.x_max, self.y_max, self.res)
+            else:
+                generador = self.mesa.sweep_and_measure_generator(self.x_max, self.y_max, self.res, **opciones)
+            for x, y, z_data in generador:
                 self.data_signal.emit(x, y, z_data)
             self.finished_signal.emit()
                 
@@ -56,34 +82,259 @@ class ConnectWorker(QThread):
     success_signal = pyqtSignal(object) # Enviará el objeto 'mesa' si todo sale bien
     error_signal = pyqtSignal(str)     # Enviará el mensaje de error si falla
 
-    def __init__(self, port):
+    def __init__(self, port, modo_rapido=False):
         super().__init__()
         self.port = port
+        self.modo_rapido = modo_rapido
 
     def run(self):
         try:
             # Aquí invocamos a la clase pesada de tu otro archivo
             # El bloqueo de 'time.sleep' y 'while' ocurrirá AQUÍ, no en la GUI
-            nueva_mesa = MesaXY(port=self.port) 
+            from mesaxy import MesaXY  # pyserial/pyvisa solo al conectar
+            nueva_mesa = MesaXY(port=self.port, modo_rapido=self.modo_rapido)
             self.success_signal.emit(nueva_mesa)
         except Exception as e:
             self.error_signal.emit(str(e))
 
+class CargaBaseDatosWorker(QThread):
+    """Abre la base de datos y lista las mediciones sin frenar el arranque."""
+    success_signal = pyqtSignal(object, list)  # db, [(texto, exp_id)]
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, folder=CARPETA_DATOS):
+        super().__init__()
+        self.folder = folder
+        self.db = None
+
+    def run(self):
+        try:
+            from data_manager import DataManager
+            self.db = DataManager(folder=self.folder)
+            items = MainWindow._textos_mediciones(self.db)
+            self.db.liberar_cursor()
+            self.success_signal.emit(self.db, items)
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+class CargaMedicionWorker(QThread):
+    """Carga una medición guardada sin bloquear la GUI: vista previa gruesa y luego la malla completa."""
+    previa_signal = pyqtSignal(str, object)    # exp_id, malla gruesa
+    progreso_signal = pyqtSignal(int)          # 0-100
+    success_signal = pyqtSignal(str, object)   # exp_id, malla completa (None si no hay puntos)
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, db, exp_id):
+        super().__init__()
+        self.db = db
+        self.exp_id = exp_id
+        self._cancelado = False
+
+    def cancelar(self):
+        """La carga se corta antes de la próxima franja; no se emiten más señales."""
+        self._cancelado = True
+
+    def run(self):
+        pasos = self.db.cargar_medicion_por_partes(self.exp_id)
+        try:
+            for tipo, valor in pasos:
+                if self._cancelado:
+                    return
+                if tipo == "previa":
+                    self.previa_signal.emit(self.exp_id, valor)
+                elif tipo == "progreso":
+                    self.progreso_signal.emit(int(valor * 100))
+                else:
+                    self.success_signal.emit(self.exp_id, valor)
+        except Exception as e:
+            if not self._cancelado:
+                self.error_signal.emit(str(e))
+        finally:
+            pasos.close()
+            self.db.liberar_cursor()
+
+class RenderScheduler(QObject):
+    """
+    Acumula los puntos que llegan del WorkerThread y los dibuja por lotes
+    con un QTimer, a un máximo de fps_max cuadros por segundo.
+    Así la velocidad de redibujado nunca frena la adquisición.
+    """
+    frame_signal = pyqtSignal(dict)  # Estadísticas tras cada cuadro dibujado
+
+    def __init__(self, plotter_mag, plotter_fase, fps_max=25, registro=None, parent=None):
+        super().__init__(parent)
+        self.plotter_mag = plotter_mag
+        self.plotter_fase = plotter_fase
+        self.registro = registro  # RegistroLatencias opcional
+        self.pendientes = []
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.set_fps_max(fps_max)
+        self.reset_estadisticas()
+
+    def set_fps_max(self, fps_max):
+        self.fps_max = max(float(fps_max), 1.0)
+        self.timer.setInterval(int(1000 / self.fps_max))
+
+    def reset_estadisticas(self):
+        self.frames = 0
+        self.frames_perdidos = 0
+        self.puntos_dibujados = 0
+        self.puntos_ultimo_frame = 0
+        self.max_puntos_frame = 0
+
+    def encolar(self, x, y, data_dict):
+        """Solo guarda el punto; el dibujado ocurre en el próximo cuadro."""
+        self.pendientes.append((x, y, data_dict))
+
+    def start(self):
+        self.pendientes = []
+        self.reset_estadisticas()
+        self.timer.start()
+
+    def stop(self):
+        """Detiene el timer y dibuja lo que haya quedado pendiente."""
+        self.timer.stop()
+        self.flush()
+
+    def flush(self):
+        if not self.pendientes:
+            return
+        lote, self.pendientes = self.pendientes, []
+
+        t0 = time.perf_counter()
+        puntos_mag = [(x, y, d['R']) for x, y, d in lote if 'R' in d]
+        puntos_fase = [(x, y, d['phi']) for x, y, d in lote if 'phi' in d]
+        if puntos_mag:
+            self.plotter_mag.actualizar_puntos(puntos_mag)
+        if puntos_fase:
+            self.plotter_fase.actualizar_puntos(puntos_fase)
+        t_fin = time.perf_counter()
+        duracion = t_fin - t0
+
+        if self.registro is not None:
+            for _, _, d in lote:
+                tiempos = d.get('tiempos')
+                if tiempos is not None:
+                    tiempos['t_render'] = t_fin
+                    self.registro.registrar_punto(tiempos)
+
+        # Un cuadro que tarda más que el periodo se come los ticks siguientes
+        periodo = 1.0 / self.fps_max
+        if duracion > periodo:
+            self.frames_perdidos += int(duracion // periodo)
+
+        self.frames += 1
+        self.puntos_dibujados += len(lote)
+        self.puntos_ultimo_frame = len(lote)
+        self.max_puntos_frame = max(self.max_puntos_frame, len(lote))
+        self.frame_signal.emit(self.estadisticas())
+
+    def estadisticas(self):
+        return {
+            "frames": self.frames,
+            "frames_perdidos": self.frames_perdidos,
+            "puntos_ultimo_frame": self.puntos_ultimo_frame,
+            "max_puntos_frame": self.max_puntos_frame,
+            "puntos_por_frame": self.puntos_dibujados / self.frames if self.frames else 0.0,
+        }
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, t_arranque=None):
         super().__init__()
         self.setWindowTitle("Control Radiometría Fototérmica - SR830 & Arduino")
         self.resize(1100, 700)
+        # Instante (perf_counter) desde el que se mide el arranque
+        self.t_arranque = t_arranque if t_arranque is not None else time.perf_counter()
+        self.hitos_arranque = {}
         
         self.mesa = None
         self.worker = None
         
-        # Inicializamos la Base de Datos (guardado en carpeta data)
-        self.db = DataManager()
-        self.db_viewer = DataManager(folder="data")
+        # La Base de Datos (carpeta data) se abre en segundo plano tras mostrar la ventana.
+        # Un solo DataManager para el barrido en vivo y las mediciones guardadas
+        self.db = None
+        self.carga_db = None
+        # Carga de mediciones guardadas en segundo plano (la actual y las canceladas que siguen corriendo)
+        self.carga_medicion = None
+        self.cargas_canceladas = []
+        self.plotter_fase = None
+        self.plotter_mag = None
+        self.render_scheduler = None
         self.current_freq = 0.0
+        self.fps_max = 25  # Tope de refresco de las gráficas durante el barrido
+        self.plan_adaptativo = None
+        # Latencias por etapa de cada punto (estadísticas en vivo y traza)
+        self.registro_latencias = RegistroLatencias()
+        self.ventana_latencias = None
+        self.carpeta_trazas = os.path.join(CARPETA_DATOS, "trazas")
 
         self.init_ui()
+        # Corre apenas arranca el bucle de eventos, con la ventana ya creada
+        QTimer.singleShot(0, self._tras_mostrar)
+
+    # ---------------------------------------------------------
+    # ARRANQUE DIFERIDO
+    # ---------------------------------------------------------
+
+    def _registrar_hito(self, nombre):
+        ms = (time.perf_counter() - self.t_arranque) * 1e3
+        self.hitos_arranque[nombre] = ms
+        log.info("Arranque: %s a los %.0f ms", nombre, ms)
+
+    def _tras_mostrar(self):
+        """
+        Pinta la ventana (controles listos) y recién entonces abre la base de
+        datos en un hilo y arma las gráficas 3D.
+        """
+        self.repaint()
+        self._registrar_hito("ventana visible")
+        self.carga_db = CargaBaseDatosWorker(CARPETA_DATOS)
+        self.carga_db.success_signal.connect(self._al_abrir_base)
+        self.carga_db.error_signal.connect(self._al_fallar_base)
+        self.carga_db.start()
+        self._crear_graficas()
+
+    def _crear_graficas(self):
+        from graficar import Grafica3DRealTime
+
+        # Instanciamos ambas gráficas. Al agregarlas al QHBoxLayout, 
+        # la primera que agreguemos quedará a la izquierda de la segunda.
+        self.plotter_fase = Grafica3DRealTime(titulo_z="Fase °")  # Gráfica para la Fase
+        # En R se agrega por máximo para que un pico angosto no se pierda al alejar la vista
+        self.plotter_mag = Grafica3DRealTime(titulo_z="R (µV)", agregacion="max")   # Gráfica para la Magnitud R
+
+        # Agregamos primero la fase (queda a la izquierda) y luego magnitud (a la derecha)
+        self.lbl_cargando.deleteLater()
+        self.panel_graficas.addWidget(self.plotter_fase)
+        self.panel_graficas.addWidget(self.plotter_mag)
+
+        # Los puntos del barrido se dibujan por lotes a fps_max
+        self.render_scheduler = RenderScheduler(
+            self.plotter_mag, self.plotter_fase, fps_max=self.fps_max,
+            registro=self.registro_latencias, parent=self
+        )
+        self.render_scheduler.frame_signal.connect(self._actualizar_estado_render)
+        self._registrar_hito("gráficas listas")
+        self._habilitar_mediciones_guardadas()
+
+    def _al_abrir_base(self, db, items):
+        self.db = db
+        self._refrescar_combo_mediciones(items)
+        self._registrar_hito("base de datos lista")
+        self._habilitar_mediciones_guardadas()
+
+    def _al_fallar_base(self, error):
+        log.error("No se pudo abrir la base de datos: %s", error)
+        QMessageBox.critical(self, "Base de datos", f"No se pudo abrir la base de datos: {error}")
+
+    def _habilitar_mediciones_guardadas(self):
+        """Los controles de mediciones guardadas necesitan la DB y las gráficas."""
+        listo = self.db is not None and self.plotter_mag is not None
+        for boton in (self.btn_renombrar, self.btn_borrar, self.btn_visualizar,
+                      self.btn_reanudar, self.btn_traza):
+            boton.setEnabled(listo)
 
     def init_ui(self):
         main_widget = QWidget()
@@ -112,6 +363,14 @@ class MainWindow(QMainWindow):
             ctrl_layout, "Y Max (mm)", 10, 100, 50, 10, 0
         )
 
+        # Esquina inferior del sub-rectángulo a medir (0 = desde el origen)
+        self.slider_x0, self.input_x0 = self.crear_control_numerico(
+            ctrl_layout, "X Min (mm)", 0, 99, 0, 10, 1
+        )
+        self.slider_y0, self.input_y0 = self.crear_control_numerico(
+            ctrl_layout, "Y Min (mm)", 0, 99, 0, 10, 1
+        )
+
         # Resolución: 0.005 a 1.000 mm (Factor 1000, 3 decimales)
         self.slider_res, self.input_res = self.crear_control_numerico(
             ctrl_layout, "Resolución (mm)", 5, 1000, 1000, 1000, 3
@@ -122,8 +381,40 @@ class MainWindow(QMainWindow):
             ctrl_layout, "frecuencia (Hz)", 1, 1000, 1000, 1, 0
         )
 
+        # Adquisición por filas con el buffer interno del SR830
+        self.chk_buffer = QCheckBox("Usar buffer del lock-in (por filas)")
+        ctrl_layout.addWidget(self.chk_buffer)
+
+        # Estabilización: además de la espera calculada, leer hasta que R converja
+        self.chk_convergencia = QCheckBox("Esperar convergencia de R")
+        ctrl_layout.addWidget(self.chk_convergencia)
+
+        # Pipeline: la mesa se mueve mientras se lee/procesa el punto anterior
+        self.chk_pipeline = QCheckBox("Pipeline (mover mientras se lee)")
+        ctrl_layout.addWidget(self.chk_pipeline)
+
+        # Crédito: puntos autorizados por cada "CONT n" (1 = un CONT por punto)
+        self.slider_ventana, self.input_ventana = self.crear_control_numerico(
+            ctrl_layout, "Puntos por CONT", 1, 64, 1, 1, 0
+        )
+
+        # Adaptativo: pasada gruesa y refinamiento donde R o φ cambian más que el umbral
+        self.chk_adaptativo = QCheckBox("Barrido adaptativo (grueso + refinar)")
+        ctrl_layout.addWidget(self.chk_adaptativo)
+        self.slider_umbral, self.input_umbral = self.crear_control_numerico(
+            ctrl_layout, "Umbral refinamiento (% de R)", 1, 50, 5, 1, 0
+        )
+
+        # Fly scan: filas a velocidad constante con el lock-in muestreando a tasa fija
+        self.chk_fly = QCheckBox("Fly scan (movimiento continuo)")
+        ctrl_layout.addWidget(self.chk_fly)
+
         ctrl_layout.addSpacing(20) # Un pequeño respiro visual
 
+        # Enlace serial rápido (baudios altos + tramas binarias), se negocia al conectar
+        self.chk_rapido = QCheckBox("Enlace serial rápido")
+        ctrl_layout.addWidget(self.chk_rapido)
+
         # Botones de Control
         self.btn_connect = QPushButton("1. CONECTAR HARDWARE")
         self.btn_connect.setStyleSheet("background: #2196F3; color: white; padding: 8px;")
@@ -149,6 +440,19 @@ class MainWindow(QMainWindow):
         self.btn_stop.setEnabled(False)
         ctrl_layout.addWidget(self.btn_stop)
 
+        self.lbl_render = QLabel("")
+        self.lbl_render.setStyleSheet("color: #777; font-size: 10px;")
+        ctrl_layout.addWidget(self.lbl_render)
+
+        self.lbl_latencias = QLabel("")
+        self.lbl_latencias.setStyleSheet("color: #777; font-size: 10px; font-family: monospace;")
+        ctrl_layout.addWidget(self.lbl_latencias)
+
+        self.btn_latencias = QPushButton("Histogramas de latencia")
+        self.btn_latencias.setStyleSheet("background: #607D8B; color: white; padding: 6px;")
+        self.btn_latencias.clicked.connect(self._mostrar_latencias)
+        ctrl_layout.addWidget(self.btn_latencias)
+
         # --- VISUALIZAR MEDICIONES GUARDADAS ---
         ctrl_layout.addSpacing(20)
         lbl_vis = QLabel("VISUALIZAR MEDICIÓN")
@@ -175,25 +479,47 @@ class MainWindow(QMainWindow):
         row_alias.addWidget(self.btn_borrar)
         ctrl_layout.addLayout(row_alias)
 
-        self._refrescar_combo_mediciones()
-
         self.btn_visualizar = QPushButton("CARGAR Y VISUALIZAR")
         self.btn_visualizar.setStyleSheet("background: #9C27B0; color: white; padding: 8px;")
         self.btn_visualizar.clicked.connect(self.visualizar_medicion_seleccionada)
         ctrl_layout.addWidget(self.btn_visualizar)
 
+        row_carga = QHBoxLayout()
+        self.barra_carga = QProgressBar()
+        self.barra_carga.setRange(0, 100)
+        self.barra_carga.setTextVisible(True)
+        row_carga.addWidget(self.barra_carga, 1)
+        self.btn_cancelar_carga = QPushButton("Cancelar")
+        self.btn_cancelar_carga.setStyleSheet("background: #607D8B; color: white; padding: 4px; font-size: 11px;")
+        self.btn_cancelar_carga.clicked.connect(self._cancelar_carga_medicion)
+        row_carga.addWidget(self.btn_cancelar_carga)
+        ctrl_layout.addLayout(row_carga)
+        self.lbl_carga = QLabel("")
+        self.lbl_carga.setStyleSheet("color: #777; font-size: 10px;")
+        ctrl_layout.addWidget(self.lbl_carga)
+        self._mostrar_barra_carga(False)
+
+        self.btn_reanudar = QPushButton("REANUDAR MEDICIÓN")
+        self.btn_reanudar.setStyleSheet("background: #FF9800; color: white; padding: 8px;")
+        self.btn_reanudar.clicked.connect(self.reanudar_medicion)
+        ctrl_layout.addWidget(self.btn_reanudar)
+
+        self.btn_traza = QPushButton("Exportar traza (Perfetto)")
+        self.btn_traza.setStyleSheet("background: #607D8B; color: white; padding: 6px;")
+        self.btn_traza.clicked.connect(self._exportar_traza_seleccionada)
+        ctrl_layout.addWidget(self.btn_traza)
+
         layout.addWidget(controls_panel)
 
         # --- PANEL DERECHO (Gráfica 3D) ---
-        # Instanciamos ambas gráficas. Al agregarlas al QHBoxLayout, 
-        # la primera que agreguemos quedará a la izquierda de la segunda.
-        
-        self.plotter_fase = Grafica3DRealTime(titulo_z="Fase °")  # Gráfica para la Fase
-        self.plotter_mag = Grafica3DRealTime(titulo_z="R (µV)")   # Gráfica para la Magnitud R
-
-        # Agregamos primero la fase (queda a la izquierda) y luego magnitud (a la derecha)
-        layout.addWidget(self.plotter_fase)
-        layout.addWidget(self.plotter_mag)
+        # Las gráficas se crean tras mostrar la ventana (_crear_graficas)
+        self.panel_graficas = QHBoxLayout()
+        self.lbl_cargando = QLabel("Cargando gráficas...")
+        self.lbl_cargando.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.lbl_cargando.setStyleSheet("color: #777;")
+        self.panel_graficas.addWidget(self.lbl_cargando)
+        layout.addLayout(self.panel_graficas, 1)
+        self._habilitar_mediciones_guardadas()
 
     def crear_slider(self, min_v, max_v, init_v, func):
         s = QSlider(Qt.Orientation.Horizontal)
@@ -256,7 +582,7 @@ class MainWindow(QMainWindow):
         self.btn_connect.setStyleSheet("background: #FF6900; color: white; padding: 8px;")
         
         # 2. Creamos al trabajador y conectamos sus "avisos"
-        self.conn_thread = ConnectWorker(port='COM3')
+        self.conn_thread = ConnectWorker(port='COM3', modo_rapido=self.chk_rapido.isChecked())
         self.conn_thread.success_signal.connect(self.on_connection_success)
         self.conn_thread.error_signal.connect(self.on_connection_error)
 
@@ -298,7 +624,7 @@ class MainWindow(QMainWindow):
         self.btn_home.setEnabled(True)
         self.btn_home.setText("HOMED")
         self.btn_measure.setEnabled(True)
-        print("Mesa en posición de origen.")
+        log.info("Mesa en posición de origen.")
 
     def on_home_error(self, error):
         """Si algo falla durante el movimiento"""
@@ -309,28 +635,132 @@ class MainWindow(QMainWindow):
     def start_measurement(self):
         self.btn_measure.setStyleSheet("background: #2196F3; color: white; padding: 12px; font-weight: bold;")
         if not self.mesa: return
+        if self.db is None:
+            QMessageBox.information(self, "Medición", "La base de datos todavía se está abriendo.")
+            return
 
         # 1. Configurar Hardware
         self.current_freq = self.slider_freq.value()
-        print(f"Configurando Lock-in a {self.current_freq} Hz...")
+        log.info("Configurando Lock-in a %s Hz...", self.current_freq)
         self.mesa.ajustar_frecuencia(self.current_freq)
+        self.mesa.modo_convergencia = self.chk_convergencia.isChecked()
         
-        # 2. Preparar Base de Datos
+        # 2. Preparar Base de Datos (con los parámetros, para poder retomarlo)
         exp_id = self.db.iniciar_nuevo_experimento()
-        print(f"Iniciando guardado de datos en ID: {exp_id}")
+        log.info("Iniciando guardado de datos en ID: %s", exp_id)
+        params = self._parametros_desde_controles()
+        self.db.guardar_parametros(exp_id, **params)
 
         # 3. Preparar Gráficas
-        self.res_actual = self.slider_res.value() / 1000.0
-        x_max = self.slider_x.value() / 10.0
-        y_max = self.slider_y.value() / 10.0
+        self.res_actual = params["res"]
+        x_max, y_max = params["x_max"], params["y_max"]
         
         # Inicializamos ambas mallas
         self.plotter_fase.inicializar_malla(x_max, y_max, self.res_actual)
         self.plotter_mag.inicializar_malla(x_max, y_max, self.res_actual)
 
         # 4. Iniciar Worker
+        self.plan_adaptativo = None
+        puntos = None
+        if params["modo"] == "adaptativo":
+            self.plan_adaptativo = EscaneoAdaptativo(x_max, y_max, self.res_actual, umbral_r=params["umbral"])
+        elif params["x_min"] > 0 or params["y_min"] > 0:
+            # Sub-rectángulo: lista de puntos con recorrido optimizado
+            puntos = self.mesa.region_points(params["x_min"], params["y_min"], x_max, y_max, self.res_actual)
+        self._lanzar_worker(x_max, y_max, puntos, fly=params["modo"] == "fly")
+
+    def _parametros_desde_controles(self):
+        adaptativo = self.chk_adaptativo.isChecked()
+        fly = self.chk_fly.isChecked() and not adaptativo
+        completo = adaptativo or fly  # Siempre desde el origen
+        return {
+            "x_min": 0.0 if completo else self.slider_x0.value() / 10.0,
+            "y_min": 0.0 if completo else self.slider_y0.value() / 10.0,
+            "x_max": self.slider_x.value() / 10.0,
+            "y_max": self.slider_y.value() / 10.0,
+            "res": self.slider_res.value() / 1000.0,
+            "freq": float(self.current_freq),
+            "modo": "adaptativo" if adaptativo else "fly" if fly else "raster",
+            "umbral": self.slider_umbral.value() / 100.0 if adaptativo else None,
+        }
+
+    def _parametros_a_controles(self, params):
+        """Pone los controles como estaban en el barrido guardado."""
+        self.slider_x0.setValue(round(params["x_min"] * 10))
+        self.slider_y0.setValue(round(params["y_min"] * 10))
+        self.slider_x.setValue(round(params["x_max"] * 10))
+        self.slider_y.setValue(round(params["y_max"] * 10))
+        self.slider_res.setValue(round(params["res"] * 1000))
+        self.slider_freq.setValue(round(params["laser_freq"]))
+        self.chk_adaptativo.setChecked(params["modo"] == "adaptativo")
+        self.chk_fly.setChecked(params["modo"] == "fly")
+        if params["umbral"] is not None:
+            self.slider_umbral.setValue(round(params["umbral"] * 100))
+
+    def reanudar_medicion(self):
+        """
+        Retoma la medición seleccionada con el mismo ID: lee qué celdas ya
+        están en la DB y mide solo las que faltan, con los parámetros
+        guardados del barrido.
+        """
+        exp_id = self.combo_mediciones.currentData()
+        if exp_id is None:
+            QMessageBox.information(self, "Reanudar", "Selecciona primero una medición.")
+            return
+        if not self.mesa:
+            QMessageBox.information(self, "Reanudar", "Conecta el hardware y haz HOME antes de reanudar.")
+            return
+        params = self.db.cargar_parametros(exp_id)
+        if params is None:
+            QMessageBox.warning(self, "Reanudar", f"{exp_id} no tiene parámetros de barrido guardados.")
+            return
+        medidos = self.db.puntos_medidos(exp_id)
+        if medidos is None:
+            return
+        xs = np.asarray(medidos["x_pos"], dtype=float)
+        ys = np.asarray(medidos["y_pos"], dtype=float)
+        rs = np.asarray(medidos["magnitude_r"], dtype=float)
+        fases = np.asarray(medidos["phase_phi"], dtype=float)
+
+        self._parametros_a_controles(params)
+        x_max, y_max, self.res_actual = params["x_max"], params["y_max"], params["res"]
+        self.plan_adaptativo = None
+        puntos = None
+        if params["modo"] == "adaptativo":
+            self.plan_adaptativo = EscaneoAdaptativo(x_max, y_max, self.res_actual, umbral_r=params["umbral"])
+            self.plan_adaptativo.registrar_lote(xs, ys, rs, fases)
+        else:
+            region = self.mesa.region_points(params["x_min"], params["y_min"], x_max, y_max, self.res_actual)
+            puntos = self.mesa.planificar(region, medidos=np.column_stack([xs, ys]), res=self.res_actual)
+            if not puntos:
+                QMessageBox.information(self, "Reanudar", f"{exp_id} ya está completa.")
+                return
+
+        self.current_freq = params["laser_freq"]
+        log.info("Reanudando %s: %d puntos ya medidos.", exp_id, xs.size)
+        self.mesa.ajustar_frecuencia(self.current_freq)
+        self.mesa.modo_convergencia = self.chk_convergencia.isChecked()
+        self.db.reanudar_experimento(exp_id)
+
+        # Lo ya medido se dibuja de entrada; lo nuevo se suma encima
+        self.plotter_fase.inicializar_malla(x_max, y_max, self.res_actual)
+        self.plotter_mag.inicializar_malla(x_max, y_max, self.res_actual)
+        if xs.size:
+            self.plotter_mag.actualizar_puntos(list(zip(xs, ys, rs)))
+            self.plotter_fase.actualizar_puntos(list(zip(xs, ys, fases)))
+        self._lanzar_worker(x_max, y_max, puntos)
+
+    def _lanzar_worker(self, x_max, y_max, puntos, fly=False):
+        self._cancelar_carga_medicion()  # Las gráficas pasan a mostrar el barrido
         self.toggle_inputs(False)
-        self.worker = WorkerThread(self.mesa, x_max, y_max, self.res_actual)
+        self.registro_latencias.reiniciar()
+        self.db.lotes_escritos.clear()
+        self.render_scheduler.start()
+        self.worker = WorkerThread(self.mesa, x_max, y_max, self.res_actual,
+                                   usar_buffer=self.chk_buffer.isChecked(),
+                                   pipeline=self.chk_pipeline.isChecked(),
+                                   ventana_cont=self.slider_ventana.value(),
+                                   plan=self.plan_adaptativo, puntos=puntos, fly=fly)
         self.worker.data_signal.connect(self.handle_new_data) # <--- Aquí recibimos el dato
         self.worker.finished_signal.connect(self.measurement_finished)
         self.worker.error_signal.connect(self.measurement_error)
@@ -341,22 +771,88 @@ class MainWindow(QMainWindow):
         Este método se ejecuta cada vez que el Arduino/Lockin escupen un dato.
         Aquí graficamos Y GUARDAMOS.
         """
-        # 1. Actualizar Gráficas
-        if 'R' in data_dict:
-            self.plotter_mag.actualizar_punto(x, y, data_dict['R'])
-            
-        # Reemplaza 'Theta' por la clave exacta que uses en tu diccionario para la fase
-        if 'phi' in data_dict: 
-            self.plotter_fase.actualizar_punto(x, y, data_dict['phi'])
+        tiempos = data_dict.get('tiempos')
+        if tiempos is not None:
+            tiempos['t_gui'] = time.perf_counter()
+
+        # 1. Encolar para las gráficas (se dibujan por lotes en el próximo cuadro)
+        self.render_scheduler.encolar(x, y, data_dict)
         
         # 2. Guardar en DuckDB
         # Pasamos x, y, el diccionario completo y la frecuencia actual
         self.db.guardar_punto(x, y, data_dict, self.current_freq)
 
+    def _actualizar_estado_render(self, stats):
+        self.lbl_render.setText(
+            f"Render: {stats['puntos_ultimo_frame']} pts/cuadro "
+            f"(media {stats['puntos_por_frame']:.1f}), "
+            f"{stats['frames_perdidos']} cuadros perdidos"
+        )
+        # Las percentiles no hace falta recalcularlas en cada cuadro
+        if stats['frames'] % 10 == 1:
+            self._actualizar_latencias()
+
+    def _recoger_lotes_db(self):
+        """Pasa al registro los lotes que el DataManager escribió desde la última vez."""
+        while self.db.lotes_escritos:
+            self.registro_latencias.registrar_lote_db(*self.db.lotes_escritos.popleft())
+
+    def _actualizar_latencias(self):
+        self._recoger_lotes_db()
+        lineas = [f"{'etapa':<13}{'p50':>8}{'p99':>8} ms"]
+        for etapa, (p50, p99, _) in self.registro_latencias.percentiles().items():
+            lineas.append(f"{etapa:<13}{p50 * 1e3:>8.1f}{p99 * 1e3:>8.1f}")
+        self.lbl_latencias.setText("\n".join(lineas))
+
+    def _mostrar_latencias(self):
+        if self.ventana_latencias is None:
+            from graficar import VentanaLatencias
+            etapas = [nombre for nombre, *_ in ETAPAS] + ["db_lote"]
+            self.ventana_latencias = VentanaLatencias(self.registro_latencias, etapas)
+        self.ventana_latencias.show()
+        self.ventana_latencias.raise_()
+
+    def _guardar_traza_barrido(self):
+        """Exporta la traza del barrido recién terminado, con los lotes de la DB incluidos."""
+        self._recoger_lotes_db()
+        self._actualizar_latencias()
+        exp_id = self.db.current_experiment_id
+        if not self.registro_latencias.n_puntos or not exp_id:
+            return
+        cols = self.db.cargar_tiempos(exp_id)
+        if cols is None:
+            return
+        os.makedirs(self.carpeta_trazas, exist_ok=True)
+        ruta = os.path.join(self.carpeta_trazas, f"{exp_id}.json")
+        try:
+            self.registro_latencias.exportar_chrome_trace(ruta, cols)
+            log.info("Traza del barrido guardada en: %s", ruta)
+        except OSError as e:
+            log.error("No se pudo guardar la traza: %s", e)
+
+    def _exportar_traza_seleccionada(self):
+        """Exporta la traza de una medición guardada a partir de los instantes en la DB."""
+        exp_id = self.combo_mediciones.currentData()
+        if exp_id is None:
+            QMessageBox.information(self, "Traza", "Selecciona primero una medición.")
+            return
+        cols = self.db.cargar_tiempos(exp_id)
+        if cols is None or len(cols["t_pos"]) == 0:
+            QMessageBox.warning(self, "Traza", f"No hay datos para {exp_id}")
+            return
+        os.makedirs(self.carpeta_trazas, exist_ok=True)
+        ruta = os.path.join(self.carpeta_trazas, f"{exp_id}_db.json")
+        exportar_chrome_trace(ruta, puntos_desde_columnas(cols))
+        QMessageBox.information(self, "Traza", f"Traza guardada en {ruta}\n(abrir en ui.perfetto.dev o chrome://tracing)")
+
     def emergency_stop(self):
         if self.worker and self.worker.isRunning():
             self.mesa.stop_current_operation()
             self.worker.wait()
+        if self.render_scheduler is not None:
+            self.render_scheduler.stop()
+        if self.db is not None:
+            self.db.flush()
         if self.mesa:
             self.mesa.close()
             self.mesa = None
@@ -374,61 +870,102 @@ class MainWindow(QMainWindow):
 
 
     def measurement_finished(self):
+        self.render_scheduler.stop()
+        self.db.flush()
+        self._guardar_traza_barrido()
+        self._mostrar_malla_adaptativa()
         self.toggle_inputs(True)
         self._refrescar_combo_mediciones()
         QMessageBox.information(self, "Fin", "Barrido completado y datos guardados.")
 
+    def _mostrar_malla_adaptativa(self):
+        """Tras un barrido adaptativo, muestra la malla con las celdas no medidas rellenas."""
+        if self.plan_adaptativo is None:
+            return
+        data = self.plan_adaptativo.mallas()
+        self.plotter_mag.cargar_datos_completos(data["x_max"], data["y_max"], data["res"], data["z_mag"])
+        self.plotter_fase.cargar_datos_completos(data["x_max"], data["y_max"], data["res"], data["z_fase"])
+        log.info("Barrido adaptativo: %d de %d puntos medidos.",
+                 self.plan_adaptativo.puntos_medidos, self.plan_adaptativo.total_malla)
+
     def measurement_error(self, err_msg):
+        self.render_scheduler.stop()
+        self.db.flush()
+        self._guardar_traza_barrido()
         self.toggle_inputs(True)
         QMessageBox.critical(self, "Error", err_msg)
 
     def toggle_inputs(self, enable):
         self.slider_x.setEnabled(enable)
         self.slider_y.setEnabled(enable)
+        self.slider_x0.setEnabled(enable)
+        self.slider_y0.setEnabled(enable)
         self.slider_res.setEnabled(enable)
         self.slider_freq.setEnabled(enable)
+        self.chk_buffer.setEnabled(enable)
+        self.chk_convergencia.setEnabled(enable)
+        self.chk_pipeline.setEnabled(enable)
+        self.slider_ventana.setEnabled(enable)
+        self.chk_adaptativo.setEnabled(enable)
+        self.slider_umbral.setEnabled(enable)
+        self.chk_fly.setEnabled(enable)
         self.btn_home.setEnabled(enable)
         self.btn_measure.setEnabled(enable)
+        self.btn_reanudar.setEnabled(enable and self.db is not None)
 
-    def _refrescar_combo_mediciones(self):
-        """Recarga el listado de mediciones disponibles en el combo."""
-        self.combo_mediciones.blockSignals(True)
-        self.combo_mediciones.clear()
-        self.combo_mediciones.addItem("— Seleccionar —", None)
+    @staticmethod
+    def _textos_mediciones(db):
+        """[(texto, exp_id)] de las mediciones guardadas, para el combo."""
+        aliases = db.obtener_aliases()
 
         def _texto_item(exp_id, fecha, n_puntos):
-            alias = self.db_viewer.obtener_alias(exp_id)
+            alias = aliases.get(exp_id)
             fecha_str = fecha.strftime("%Y-%m-%d %H:%M") if hasattr(fecha, 'strftime') else str(fecha)
             base = f"{exp_id} ({fecha_str}, {n_puntos} pts)"
             return f"{alias} — {base}" if alias else base
 
-        mediciones = self.db_viewer.listar_mediciones()
-        for exp_id, fecha, n_puntos in mediciones:
-            self.combo_mediciones.addItem(_texto_item(exp_id, fecha, n_puntos), exp_id)
-        for exp_id, fecha, n_puntos in self.db.listar_mediciones():
-            ids_actuales = [self.combo_mediciones.itemData(i) for i in range(1, self.combo_mediciones.count())]
-            if exp_id not in ids_actuales:
-                self.combo_mediciones.addItem(_texto_item(exp_id, fecha, n_puntos), exp_id)
+        return [(_texto_item(exp_id, fecha, n_puntos), exp_id)
+                for exp_id, fecha, n_puntos in db.listar_mediciones()]
+
+    def _refrescar_combo_mediciones(self, items=None):
+        """Recarga el listado de mediciones disponibles en el combo."""
+        if self.db is None:
+            return
+        if items is None:
+            items = self._textos_mediciones(self.db)
+        self.combo_mediciones.blockSignals(True)
+        self.combo_mediciones.clear()
+        self.combo_mediciones.addItem("— Seleccionar —", None)
+        for texto, exp_id in items:
+            self.combo_mediciones.addItem(texto, exp_id)
         self.combo_mediciones.blockSignals(False)
         self._al_cambiar_medicion_combo()
 
     def _al_cambiar_medicion_combo(self):
         """Actualiza el campo de alias al cambiar la medición seleccionada."""
         exp_id = self.combo_mediciones.currentData()
-        if exp_id is None:
+        if exp_id is None or self.db is None:
             self.input_alias.clear()
             return
-        alias = self.db_viewer.obtener_alias(exp_id)
+        alias = self.db.obtener_alias(exp_id)
         self.input_alias.setText(alias or "")
 
+    def _es_barrido_en_curso(self, exp_id):
+        """True si exp_id es el experimento que el barrido actual está escribiendo."""
+        return (self.worker is not None and self.worker.isRunning()
+                and exp_id == self.db.current_experiment_id)
+
     def _renombrar_medicion(self):
         """Guarda el alias (seudónimo) de la medición seleccionada."""
         exp_id = self.combo_mediciones.currentData()
         if exp_id is None:
             QMessageBox.information(self, "Renombrar", "Selecciona primero una medición.")
             return
+        if self._es_barrido_en_curso(exp_id):
+            QMessageBox.information(self, "Renombrar", "Espera a que termine el barrido de esta medición.")
+            return
         alias = self.input_alias.text().strip()
-        self.db_viewer.guardar_alias(exp_id, alias)
+        self.db.guardar_alias(exp_id, alias)
         self._refrescar_combo_mediciones()
         idx = self.combo_mediciones.findData(exp_id)
         if idx >= 0:
@@ -441,6 +978,9 @@ class MainWindow(QMainWindow):
         if exp_id is None:
             QMessageBox.information(self, "Borrar", "Selecciona primero una medición.")
             return
+        if self._es_barrido_en_curso(exp_id):
+            QMessageBox.information(self, "Borrar", "Detén el barrido antes de borrar esta medición.")
+            return
         resp = QMessageBox.question(
             self, "Borrar medición", "¿Desea borrar los datos de esta medición?",
             QMessageBox.StandardButton.Ok | QMessageBox.StandardButton.Cancel,
@@ -448,44 +988,113 @@ class MainWindow(QMainWindow):
         )
         if resp != QMessageBox.StandardButton.Ok:
             return
-        ok1 = self.db_viewer.eliminar_medicion(exp_id)
-        ok2 = self.db.eliminar_medicion(exp_id)
-        if ok1 or ok2:
+        if self.db.eliminar_medicion(exp_id):
             self._refrescar_combo_mediciones()
             QMessageBox.information(self, "Borrar", "Medición eliminada.")
         else:
             QMessageBox.warning(self, "Borrar", "No se pudo eliminar la medición.")
 
     def visualizar_medicion_seleccionada(self):
-        """Carga la medición seleccionada y la muestra en las gráficas 3D."""
+        """
+        Carga la medición seleccionada en un hilo y la muestra en las gráficas
+        3D: primero una vista previa gruesa, después la resolución completa.
+        Elegir otra medición mientras tanto cancela la carga anterior.
+        """
         exp_id = self.combo_mediciones.currentData()
         if exp_id is None:
             QMessageBox.information(self, "Visualizar", "Selecciona una medición del menú.")
             return
 
-        data = self.db_viewer.cargar_medicion(exp_id)
-        if data is None:
-            data = self.db.cargar_medicion(exp_id)
+        self._cancelar_carga_medicion()
+        self.carga_medicion = CargaMedicionWorker(self.db, exp_id)
+        self.carga_medicion.previa_signal.connect(self._al_cargar_previa)
+        self.carga_medicion.progreso_signal.connect(self._al_progresar_carga)
+        self.carga_medicion.success_signal.connect(self._al_cargar_medicion)
+        self.carga_medicion.error_signal.connect(self._al_fallar_carga)
+        self.t_carga = time.perf_counter()
+        self.barra_carga.setValue(0)
+        self._mostrar_barra_carga(True)
+        self.lbl_carga.setText(f"Cargando {exp_id}...")
+        self.carga_medicion.start()
+
+    def _mostrar_barra_carga(self, visible):
+        self.barra_carga.setVisible(visible)
+        self.btn_cancelar_carga.setVisible(visible)
+
+    def _cancelar_carga_medicion(self):
+        """Cancela la carga en curso (si hay); el hilo termina en la próxima franja."""
+        self.cargas_canceladas = [w for w in self.cargas_canceladas if w.isRunning()]
+        if self.carga_medicion is not None and self.carga_medicion.isRunning():
+            self.carga_medicion.cancelar()
+            self.cargas_canceladas.append(self.carga_medicion)
+            self.lbl_carga.setText(f"Carga de {self.carga_medicion.exp_id} cancelada.")
+        self.carga_medicion = None
+        self._mostrar_barra_carga(False)
+
+    def _es_carga_actual(self):
+        # Las señales de una carga cancelada pueden llegar tarde: se ignoran
+        return self.sender() is self.carga_medicion and self.carga_medicion is not None
+
+    def _mostrar_malla(self, data):
+        self.plotter_mag.cargar_datos_completos(data["x_max"], data["y_max"], data["res"], data["z_mag"])
+        self.plotter_fase.cargar_datos_completos(data["x_max"], data["y_max"], data["res"], data["z_fase"])
+
+    def _al_cargar_previa(self, exp_id, data):
+        if not self._es_carga_actual():
+            return
+        self._mostrar_malla(data)
+        self.lbl_carga.setText(f"{exp_id}: vista previa ({data['z_mag'].shape[1]}×{data['z_mag'].shape[0]}), "
+                               f"cargando resolución completa...")
+
+    def _al_progresar_carga(self, porcentaje):
+        if self._es_carga_actual():
+            self.barra_carga.setValue(porcentaje)
+
+    def _al_cargar_medicion(self, exp_id, data):
+        if not self._es_carga_actual():
+            return
+        self.carga_medicion = None
+        self._mostrar_barra_carga(False)
         if data is None:
+            self.lbl_carga.setText("")
             QMessageBox.warning(self, "Error", f"No se pudo cargar la medición {exp_id}")
             return
-
-        self.plotter_mag.cargar_datos_completos(
-            data["x_max"], data["y_max"], data["res"], data["z_mag"]
+        self._mostrar_malla(data)
+        ny, nx = data["z_mag"].shape
+        cache = self.db.cache_mallas.estadisticas()
+        self.lbl_carga.setText(
+            f"{exp_id}: {nx}×{ny} celdas en {time.perf_counter() - self.t_carga:.2f} s\n"
+            f"Caché: {cache['mallas']} mallas, {cache['bytes'] / 2**20:.0f}/{cache['max_bytes'] / 2**20:.0f} MB, "
+            f"{cache['aciertos']} aciertos / {cache['fallos']} fallos"
         )
-        self.plotter_fase.cargar_datos_completos(
-            data["x_max"], data["y_max"], data["res"], data["z_fase"]
-        )
-        QMessageBox.information(self, "Visualizar", f"Medición {exp_id} cargada correctamente.")
+
+    def _al_fallar_carga(self, error):
+        if not self._es_carga_actual():
+            return
+        exp_id = self.carga_medicion.exp_id
+        self.carga_medicion = None
+        self._mostrar_barra_carga(False)
+        self.lbl_carga.setText("")
+        log.error("Error cargando medición %s: %s", exp_id, error)
+        QMessageBox.warning(self, "Error", f"No se pudo cargar la medición {exp_id}: {error}")
 
     def closeEvent(self, event):
+        self._cancelar_carga_medicion()
         self.emergency_stop()
-        self.db.cerrar()
-        self.db_viewer.cerrar()
+        for carga in self.cargas_canceladas:
+            carga.wait()
+        if self.carga_db is not None and self.carga_db.isRunning():
+            self.carga_db.wait()
+        # Si la DB terminó de abrir pero la señal no llegó a procesarse, cerrar la del hilo
+        db = self.db if self.db is not None else getattr(self.carga_db, "db", None)
+        if db is not None:
+            db.cerrar()
         event.accept()
 
 if __name__ == "__main__":
+    t_arranque = time.perf_counter()
+    configurar_bitacora()
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(t_arranque=t_arranque)
     window.show()
     sys.exit(app.exec())
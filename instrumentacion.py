@@ -0,0 +1,136 @@
+"""
+Instrumentación de latencias por punto del barrido.
+
+Cada punto viaja con un dict 'tiempos' (dentro del dict de mediciones) con
+instantes time.perf_counter() por etapa, que van completando MesaXY, la GUI
+y el RenderScheduler:
+
+    t0          inicio del barrido (SWEEP enviado)
+    t_cont      CONT que liberó el movimiento hacia este punto
+    t_pos       llegada de POS
+    t_laser     llegada de LASER
+    t_asentado  fin de la estabilización
+    t_captura   medición tomada del lock-in
+    t_yield     punto cedido por el generador
+    t_gui       handle_new_data en el hilo de la GUI
+    t_render    punto dibujado
+"""
+import json
+from collections import deque
+
+import numpy as np
+
+# (nombre, instante inicial, instante final, carril en la traza)
+ETAPAS = (
+    ("movimiento", "t_cont", "t_pos", "Mesa"),
+    ("serial", "t_pos", "t_laser", "Mesa"),
+    ("asentamiento", "t_laser", "t_asentado", "Lock-in"),
+    ("gpib", "t_asentado", "t_captura", "Lock-in"),
+    ("senal_qt", "t_yield", "t_gui", "GUI"),
+    ("render", "t_gui", "t_render", "GUI"),
+)
+
+# Instantes que se guardan en la DB junto a cada punto (relativos a t0)
+INSTANTES_DB = ("t_cont", "t_pos", "t_laser", "t_asentado", "t_captura", "t_gui")
+
+CARRILES = {"Mesa": 1, "Lock-in": 2, "GUI": 3, "DB": 4}
+
+
+class RegistroLatencias:
+    """
+    Acumula las duraciones por etapa de los puntos de un barrido para las
+    estadísticas en vivo (ventana de muestras acotada) y los lotes escritos
+    en la DB. Los instantes de cada punto no se guardan aquí (crecerían con
+    el barrido): la traza se arma al final con los que quedaron en la DB.
+    """
+
+    def __init__(self, max_muestras=5000):
+        self.max_muestras = max_muestras
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.t0 = None  # Inicio del barrido (perf_counter), del primer punto
+        self.n_puntos = 0
+        self.lotes_db = []
+        self.muestras = {nombre: deque(maxlen=self.max_muestras) for nombre, *_ in ETAPAS}
+        self.muestras["db_lote"] = deque(maxlen=self.max_muestras)
+
+    def registrar_punto(self, tiempos):
+        """Registra las duraciones de un punto ya dibujado."""
+        if self.t0 is None:
+            self.t0 = tiempos.get("t0", 0.0)
+        self.n_puntos += 1
+        for nombre, inicio, fin, _ in ETAPAS:
+            if inicio in tiempos and fin in tiempos:
+                self.muestras[nombre].append(tiempos[fin] - tiempos[inicio])
+
+    def registrar_lote_db(self, t_inicio, t_fin, n_filas):
+        self.lotes_db.append((t_inicio, t_fin, n_filas))
+        self.muestras["db_lote"].append(t_fin - t_inicio)
+
+    def percentiles(self):
+        """{etapa: (p50, p99, n)} en segundos, solo de etapas con muestras."""
+        resultado = {}
+        for nombre, valores in self.muestras.items():
+            if valores:
+                p50, p99 = np.percentile(np.fromiter(valores, float), (50, 99))
+                resultado[nombre] = (float(p50), float(p99), len(valores))
+        return resultado
+
+    def histograma(self, etapa, bins=30):
+        """(conteos, bordes en ms) de la etapa, o None si no hay muestras."""
+        valores = self.muestras.get(etapa)
+        if not valores:
+            return None
+        return np.histogram(np.fromiter(valores, float) * 1e3, bins=bins)
+
+    def exportar_chrome_trace(self, ruta, cols):
+        """
+        Traza del barrido: los instantes de cols (DataManager.cargar_tiempos,
+        relativos a t0; sin 'render', que no se guarda) más los lotes de la DB.
+        """
+        t0 = self.t0 if self.t0 is not None else 0.0
+        lotes = [(t_inicio - t0, t_fin - t0, n_filas) for t_inicio, t_fin, n_filas in self.lotes_db]
+        exportar_chrome_trace(ruta, puntos_desde_columnas(cols), lotes)
+
+
+def puntos_desde_columnas(cols):
+    """Lista de dicts de instantes por punto a partir de las columnas t_* de la DB."""
+    # Las columnas con NULL llegan como arrays enmascarados: NaN = etapa ausente
+    instantes = {c: np.ma.filled(np.ma.asarray(v, dtype=float), np.nan)
+                 for c, v in cols.items() if c.startswith("t_")}
+    return [dict(zip(instantes, fila)) for fila in zip(*instantes.values())]
+
+
+def traza_chrome(puntos, lotes_db=(), t0=0.0):
+    """
+    Arma el JSON de Chrome trace / Perfetto: un evento completo ("X") por
+    etapa y punto, en un carril por subsistema. Las etapas sin sus dos
+    instantes se omiten (p.ej. 'render' en trazas leídas de la DB).
+    """
+    eventos = [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": carril}}
+        for carril, tid in CARRILES.items()
+    ]
+    for i, tiempos in enumerate(puntos):
+        for nombre, inicio, fin, carril in ETAPAS:
+            a, b = tiempos.get(inicio), tiempos.get(fin)
+            if a is None or b is None or np.isnan(a) or np.isnan(b):
+                continue
+            eventos.append({
+                "name": nombre, "ph": "X", "pid": 1, "tid": CARRILES[carril],
+                "ts": (a - t0) * 1e6, "dur": max(b - a, 0.0) * 1e6,
+                "args": {"punto": i},
+            })
+    for t_inicio, t_fin, n_filas in lotes_db:
+        eventos.append({
+            "name": "db_lote", "ph": "X", "pid": 1, "tid": CARRILES["DB"],
+            "ts": (t_inicio - t0) * 1e6, "dur": (t_fin - t_inicio) * 1e6,
+            "args": {"filas": n_filas},
+        })
+    return {"traceEvents": eventos, "displayTimeUnit": "ms"}
+
+
+def exportar_chrome_trace(ruta, puntos, lotes_db=(), t0=0.0):
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(traza_chrome(puntos, lotes_db, t0), f)
@@ -1,14 +1,66 @@
+import math
+import numpy as np
 import pyvisa
 
 # Variable global para guardar la amplitud deseada (ej. 2.5V o 1V)
 LASER_ON_VOLTAGE = 5  
 LASER_OFF_VOLTAGE = 1.0 
 
+# Capacidad del buffer interno del SR830 (puntos por canal)
+BUFFER_MAX_PUNTOS = 16383
+
+# Tasas de muestreo del buffer: SRAT i = 2**(i - 4) Hz (62.5 mHz ... 512 Hz)
+SRAT_MAX = 13
+
+
+def tasa_muestreo(indice):
+    """Muestras por segundo del buffer con SRAT 'indice' (0..13)."""
+    return 2.0 ** (indice - 4)
+
+
+def indice_tasa(tasa):
+    """Menor SRAT cuya tasa alcanza 'tasa' (Hz), limitado a 512 Hz."""
+    for i in range(SRAT_MAX + 1):
+        if tasa_muestreo(i) >= tasa:
+            return i
+    return SRAT_MAX
+
+
+def calcular_asentamiento(tau, orden, fraccion=0.99):
+    """
+    Tiempo (s) que tarda un filtro de 'orden' polos RC iguales de constante
+    'tau' en alcanzar 'fraccion' de un escalón a la entrada.
+    Para 99%: ~5τ (6 dB/oct), ~7τ (12), ~9τ (18), ~10τ (24), como en el manual.
+    """
+    def respuesta(t):
+        x = t / tau
+        termino, suma = 1.0, 1.0
+        for k in range(1, orden):
+            termino *= x / k
+            suma += termino
+        return 1.0 - math.exp(-x) * suma
+
+    lo, hi = 0.0, tau
+    while respuesta(hi) < fraccion:
+        hi *= 2
+    for _ in range(50):  # Bisección
+        mid = (lo + hi) / 2
+        if respuesta(mid) < fraccion:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
 
 class SR830:
-    def __init__(self, resource_name='GPIB0::8::INSTR', timeout=5000):
-        self.rm = pyvisa.ResourceManager()
-        self.inst = self.rm.open_resource(resource_name)
+    def __init__(self, resource_name='GPIB0::8::INSTR', timeout=5000, inst=None):
+        # inst permite usar un recurso ya abierto (p.ej. el simulador)
+        if inst is None:
+            self.rm = pyvisa.ResourceManager()
+            self.inst = self.rm.open_resource(resource_name)
+        else:
+            self.rm = None
+            self.inst = inst
         self.inst.timeout = timeout
 
     def set_amplitude(self, voltage):
@@ -17,14 +69,129 @@ class SR830:
     def set_frequency(self, freq):
         self.inst.write(f'FREQ {freq}')
 
-    def get_measurements(self):
-        snap = self.inst.query('SNAP? 1,2,3,4').strip()
+    def constante_tiempo(self):
+        """Constante de tiempo configurada (s): 10 µs, 30 µs, 100 µs ... 30 ks."""
+        i = int(self.inst.query('OFLT?').strip())
+        return (1 if i % 2 == 0 else 3) * 10 ** (i // 2) * 1e-5
+
+    def orden_filtro(self):
+        """Número de polos del filtro: OFSL 0..3 = 6, 12, 18, 24 dB/oct."""
+        return int(self.inst.query('OFSL?').strip()) + 1
+
+    def tiempo_asentamiento(self, fraccion=0.99):
+        return calcular_asentamiento(self.constante_tiempo(), self.orden_filtro(), fraccion)
+
+    def get_measurements(self, voltaje_despues=None):
+        """SNAP? de X, Y, R y θ; opcionalmente cambia la amplitud en el mismo mensaje."""
+        cmd = 'SNAP? 1,2,3,4'
+        if voltaje_despues is not None:
+            cmd += f';SLVL {voltaje_despues}'
+        return self._parsear_snap(self.inst.query(cmd).strip())
+
+    def solicitar_medicion(self, voltaje_despues=None):
+        """
+        Envía SNAP? sin esperar la respuesta. El SR830 congela los valores al
+        recibir el comando, así que la muestra ya está tomada al volver.
+        Opcionalmente cambia la amplitud en el mismo mensaje, después de
+        congelar la muestra.
+        """
+        cmd = 'SNAP? 1,2,3,4'
+        if voltaje_despues is not None:
+            cmd += f';SLVL {voltaje_despues}'
+        self.inst.write(cmd)
+
+    def leer_medicion(self):
+        """Lee la respuesta de un SNAP? enviado con solicitar_medicion."""
+        return self._parsear_snap(self.inst.read().strip())
+
+    @staticmethod
+    def _parsear_snap(snap):
         x, y, r, phi = map(float, snap.split(','))
         return {'X': x, 'Y': y, 'R': r, 'phi': phi}
 
+    # ---------------------------------------------------------
+    # BUFFER INTERNO (adquisición por lotes)
+    # ---------------------------------------------------------
+
+    def iniciar_buffer(self):
+        """
+        Prepara el buffer interno para guardar un punto por cada TRIG.
+        El SR830 solo almacena lo que muestran CH1 y CH2, así que se
+        configuran como R y θ; X e Y se reconstruyen al leer.
+        """
+        self.inst.write('DDEF 1,1,0;DDEF 2,1,0')
+        self.inst.write('SRAT 14;SEND 0;TSTR 0')  # 14 = muestreo por TRIG
+        self.reiniciar_buffer()
+
+    def reiniciar_buffer(self):
+        self.inst.write('REST;STRT')
+
+    def disparar(self, voltaje_despues=None):
+        """
+        Guarda un punto en el buffer (TRIG). Opcionalmente cambia la
+        amplitud en el mismo mensaje para ahorrar una transacción GPIB.
+        """
+        cmd = 'TRIG'
+        if voltaje_despues is not None:
+            cmd += f';SLVL {voltaje_despues}'
+        self.inst.write(cmd)
+
+    def iniciar_buffer_continuo(self, indice_srat):
+        """
+        Prepara el buffer para muestrear a tasa fija (SRAT 'indice_srat').
+        Con TSTR 1 el muestreo arranca con el flanco en TRIG IN (lo da el
+        Arduino al empezar cada fila del fly scan), así la muestra k es del
+        instante del disparo + k / tasa.
+        """
+        self.inst.write('DDEF 1,1,0;DDEF 2,1,0')
+        self.inst.write(f'SRAT {indice_srat};SEND 0;TSTR 1')
+        self.rearmar_buffer()
+
+    def rearmar_buffer(self):
+        """Vacía el buffer y lo deja esperando el próximo disparo."""
+        self.inst.write('REST')
+
+    def puntos_en_buffer(self):
+        return int(self.inst.query('SPTS?').strip())
+
+    def _leer_canal(self, canal, n):
+        # TRCB? devuelve n floats IEEE de 4 bytes, little endian, sin cabecera
+        return self.inst.query_binary_values(
+            f'TRCB? {canal},0,{n}', datatype='f', is_big_endian=False,
+            container=np.array, header_fmt='empty', expect_termination=False,
+            data_points=n
+        )
+
+    def leer_buffer(self, n):
+        """
+        Lee los n primeros puntos del buffer en binario (dos consultas en
+        total) y lo reinicia. Devuelve una lista de dicts como get_measurements.
+        """
+        if n <= 0:
+            return []
+        r, phi = self.leer_buffer_crudo(n)
+        self.reiniciar_buffer()
+
+        x = r * np.cos(np.radians(phi))
+        y = r * np.sin(np.radians(phi))
+        return [
+            {'X': float(xi), 'Y': float(yi), 'R': float(ri), 'phi': float(pi)}
+            for xi, yi, ri, pi in zip(x, y, r, phi)
+        ]
+
+    def leer_buffer_crudo(self, n):
+        """Arrays (R, θ en grados) de los n primeros puntos, sin reiniciar."""
+        r = self._leer_canal(1, n).astype(float)
+        phi = self._leer_canal(2, n).astype(float)
+        return r, phi
+
+    def detener_buffer(self):
+        self.inst.write('PAUS;REST')
+
     def close(self):
         self.inst.close()
-        self.rm.close()
+        if self.rm is not None:
+            self.rm.close()
 
 if __name__ == "__main__":
     lockin = SR830()
@@ -1,10 +1,15 @@
+import time
+T_ARRANQUE = time.perf_counter()  # Antes de cualquier import pesado: cuenta para el arranque
+
 import sys
 from PyQt6.QtWidgets import QApplication
 from gui import MainWindow
+from bitacora import configurar_bitacora
 
 def main():
+    configurar_bitacora()
     app = QApplication(sys.argv)
-    win = MainWindow()
+    win = MainWindow(t_arranque=T_ARRANQUE)
     win.show()
     return app.exec()
 
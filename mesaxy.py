@@ -1,34 +1,407 @@
 import serial
+import logging
+import math
 import time
+import queue
+import struct
+import threading
+from functools import reduce
+import numpy as np
+from bitacora import PUNTO
+import planificador
+
+log = logging.getLogger(__name__)
+
 # Asegúrate de que lockin.py esté accesible
 try:
-    from lockin import SR830, LASER_ON_VOLTAGE, LASER_OFF_VOLTAGE
+    from lockin import (SR830, LASER_ON_VOLTAGE, LASER_OFF_VOLTAGE, BUFFER_MAX_PUNTOS,
+                        indice_tasa, tasa_muestreo)
 except ImportError:
-    print("error con el lockin")
+    log.error("error con el lockin")
+
+# Tramas binarias del modo rápido (ver MesaXYSerial.ino):
+# 0xA5 | tipo | largo | payload | checksum (XOR de tipo, largo y payload)
+TRAMA_INICIO = 0xA5
+TRAMA_MEDIR = ord('M')  # Arduino -> PC: float32 x, float32 y. Equivale a POS + LASER
+TRAMA_CONT = ord('C')   # PC -> Arduino
+TRAMA_PUNTO = ord('P')  # PC -> Arduino: float32 x, float32 y. Equivale a "P x y"
+TRAMA_MARCA = ord('K')  # Arduino -> PC: uint8 tipo, uint32 t_us, float32 x, float32 y. Equivale a "MK"
+
+# Tipos de marca de posición del fly scan
+MARCA_INTERMEDIA = 0
+MARCA_INICIO_FILA = 1  # Instante del disparo del buffer del lock-in
+MARCA_FIN_FILA = 2
+
+# Puntos "P x y" encolados en el firmware por delante del que se mide (su cola
+# es de 32). Se envían de a uno: el siguiente sale cuando llega el ACK del
+# anterior, así nunca hay más de una línea por punto en el buffer de recepción
+# del AVR (64 bytes), que no se lee mientras la mesa se mueve.
+VENTANA_PUNTOS = 16
+
+
+def _checksum(datos):
+    return reduce(lambda a, b: a ^ b, datos, 0)
+
+
+def _trama(tipo, payload=b""):
+    cuerpo = bytes([tipo, len(payload)]) + payload
+    return bytes([TRAMA_INICIO]) + cuerpo + bytes([_checksum(cuerpo)])
+
+
+def binear_fila(r, phi, t_muestras, t_marcas, x_marcas, res, nx):
+    """
+    Asigna cada muestra de una fila del fly scan a su celda de la malla.
+    La x de cada muestra se interpola entre las marcas (t, x) del firmware;
+    las muestras fuera de la fila (antes del disparo o después de la
+    última marca) se descartan. Promedia X e Y por celda (promedio
+    vectorial, la fase no se promedia directamente) y devuelve una lista
+    de (ix, z_data) en el orden en que se recorrió la fila.
+    """
+    dentro = (t_muestras >= t_marcas[0]) & (t_muestras <= t_marcas[-1])
+    x = np.interp(t_muestras[dentro], t_marcas, x_marcas)
+    ix = np.rint(x / res).astype(np.int64)
+    validas = (ix >= 0) & (ix < nx)
+    ix = ix[validas]
+    r, phi = r[dentro][validas], np.radians(phi[dentro][validas])
+
+    cuenta = np.bincount(ix, minlength=nx)
+    suma_x = np.bincount(ix, weights=r * np.cos(phi), minlength=nx)
+    suma_y = np.bincount(ix, weights=r * np.sin(phi), minlength=nx)
+    celdas = np.flatnonzero(cuenta)
+    if x_marcas[-1] < x_marcas[0]:
+        celdas = celdas[::-1]  # Fila recorrida hacia x decrecientes
+
+    resultado = []
+    for i in celdas:
+        mx, my = suma_x[i] / cuenta[i], suma_y[i] / cuenta[i]
+        resultado.append((int(i), {'X': float(mx), 'Y': float(my), 'R': float(math.hypot(mx, my)),
+                                   'phi': math.degrees(math.atan2(my, mx)), 'muestras': int(cuenta[i])}))
+    return resultado
+
 
 class MesaXY:
-    def __init__(self, port='COM3', baudrate=9600, timeout=5):
-        self.lockin = SR830()
+    def __init__(self, port='COM3', baudrate=9600, timeout=5, modo_rapido=False, baudrate_rapido=115200,
+                 lockin=None, ser=None):
+        # lockin/ser permiten inyectar instancias ya abiertas (p.ej. el simulador)
+        self.lockin = lockin if lockin is not None else SR830()
         # Bajamos un poco el timeout para que el hilo no sufra demasiado
-        self.ser = serial.Serial(port, baudrate, timeout=timeout)
+        self.ser = ser if ser is not None else serial.Serial(port, baudrate, timeout=timeout)
         self._abort = False
-        time.sleep(1) # El Arduino se reinicia al conectar
+
+        # Estabilización tras encender el láser: se calcula desde la constante
+        # de tiempo y la pendiente del filtro del lock-in al iniciar cada barrido.
+        # En modo convergencia, además, se consulta hasta que R deje de cambiar.
+        self.fraccion_asentamiento = 0.99
+        self.modo_convergencia = False
+        self.tolerancia_convergencia = 0.01  # Cambio relativo de R entre lecturas
+        self.estadisticas_asentamiento = {}
+
+        # Ventana de crédito ("CONT n"): cuántos puntos se autorizan de una vez.
+        # El firmware se queda DWELL = latencia del enlace + asentamiento +
+        # captura (medidas al iniciar el barrido) en cada punto. Si una captura
+        # llega tarde, la ventana se reduce a la mitad (DWELL sigue puesto hasta
+        # el final del barrido aunque la ventana baje a 1).
+        # Margen mínimo sobre la captura medida: el DWELL se cuenta con millis()
+        # en el firmware (puede quedar hasta 1 ms corto) y el hilo lector
+        # estampa la llegada del LASER con algo de retraso.
+        self.margen_minimo_dwell = 0.002
+        self._ventana = 1
+        self._ventana_maxima = 1
+        self._credito = 0
+        self._dwell = 0.0
+        self._latencia_enlace = 0.0  # Del LASER en el Arduino a su llegada a la PC
+        self._t_liberacion = 0.0  # Instante estimado en que la mesa arrancó hacia el punto actual
+        self._lista_pendiente = None  # Iterador de la lista POINTS en curso
+        self._punto_en_vuelo = False  # Punto enviado cuyo ACK aún no llegó
+        self._puntos_en_cola = 0  # Puntos confirmados que el firmware aún no visitó
+        self.posicion = (0.0, 0.0)  # Último POS recibido (inicio del próximo recorrido)
+        self.puntos_tardios = 0
+
+        # Fly scan: muestras del lock-in que se quieren por celda de la malla
+        self.muestras_por_celda = 4
+
+        # Hilo lector: hace readline bloqueante y deja eventos tipados en la cola
+        self._eventos = queue.Queue()
+        self._lector_activo = True
+        self._hilo_lector = threading.Thread(target=self._leer_serial, name="MesaXYSerial", daemon=True)
+        self._hilo_lector.start()
+
+        if ser is None:
+            time.sleep(1) # El Arduino se reinicia al conectar
         self._wait_for_ready()
 
-    def _wait_for_ready(self):
-        start_time = time.time()
+        # Modo rápido: más baudios, sin DBG en barridos y tramas binarias.
+        # Si el firmware no lo soporta se sigue con el protocolo de texto.
+        self._modo_binario = False
+        if modo_rapido:
+            self._negociar_modo_rapido(baudrate_rapido)
+
+    def _negociar_modo_rapido(self, baudrate):
+        self._descartar_eventos()
+        self._send_command(f"FAST {baudrate}")
+        tipo = self._esperar_evento(("OK", "ERR"), 5, "El ARDUINO no respondió a FAST.")[0]
+        if tipo == "ERR":
+            log.warning("Firmware sin modo rápido: se usa el protocolo de texto.")
+            return
+        self.ser.baudrate = baudrate
+        time.sleep(0.05)
+        self._descartar_eventos()
+        self.ping()  # Confirma que ambos lados quedaron a la nueva velocidad
+        self._modo_binario = True
+        log.info("Modo rápido activo a %d baudios.", baudrate)
+
+    # ---------------------------------------------------------
+    # LECTURA SERIAL (hilo dedicado)
+    # ---------------------------------------------------------
+
+    @staticmethod
+    def _parsear_linea(line):
+        """
+        Convierte una línea del Arduino en un evento (tipo, datos):
+        POS -> (x, y); MK -> MARCA (tipo, t_us, x, y); ERR/DBG -> texto;
+        READY, HOMED, LASER, OK, PONG, ACK -> None.
+        Devuelve None si la línea no se puede interpretar.
+        """
+        if line.startswith("MK"):
+            try:
+                _, tipo, t_us, x_str, y_str = line.split()
+                return "MARCA", (int(tipo), int(t_us), float(x_str), float(y_str))
+            except ValueError:
+                log.warning("Error parseando marca: %s", line)
+                return None
+        if line.startswith("POS"):
+            try:
+                _, x_str, y_str = line.split()
+                return "POS", (float(x_str), float(y_str))
+            except ValueError:
+                log.warning("Error parseando posición: %s", line)
+                return None
+        if line.startswith("ERR"):
+            return "ERR", line
+        if line.startswith("DBG"):
+            return "DBG", line[4:]
+        if line in ("READY", "HOMED", "LASER", "OK", "PONG", "ACK"):
+            return line, None
+        return "RAW", line
+
+    def _leer_serial(self):
+        while self._lector_activo:
+            try:
+                eventos = self._leer_eventos()
+            except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+                # Puerto cerrado o desconectado: avisar a quien esté esperando
+                if self._lector_activo:
+                    self._eventos.put(("DESCONECTADO", str(e), time.perf_counter()))
+                return
+            # Cada evento lleva el instante de llegada (perf_counter)
+            t_llegada = time.perf_counter()
+            for evento in eventos:
+                self._eventos.put(evento + (t_llegada,))
+
+    def _leer_eventos(self):
+        """Lee una línea de texto o una trama binaria y la traduce a eventos."""
+        primero = self.ser.read(1)
+        if not primero:
+            return []  # Timeout sin datos
+        if primero[0] == TRAMA_INICIO:
+            return self._leer_trama()
+        line = (primero + self.ser.readline()).decode('utf-8', errors='replace').strip()
+        if not line:
+            return []
+        evento = self._parsear_linea(line)
+        return [evento] if evento is not None else []
+
+    def _leer_trama(self):
+        cabecera = self.ser.read(2)
+        if len(cabecera) < 2:
+            return [("ERR", "ERR Trama incompleta")]
+        tipo, largo = cabecera
+        resto = self.ser.read(largo + 1)
+        if len(resto) < largo + 1:
+            return [("ERR", "ERR Trama incompleta")]
+        payload, checksum = resto[:-1], resto[-1]
+        if _checksum(cabecera + payload) != checksum:
+            # Perder un POS dejaría al Arduino esperando CONT: mejor abortar
+            return [("ERR", "ERR Checksum de trama inválido")]
+        if tipo == TRAMA_MEDIR and largo == 8:
+            x, y = struct.unpack('<ff', payload)
+            # Mismo redondeo que el POS de texto (3 decimales)
+            return [("POS", (round(x, 3), round(y, 3))), ("LASER", None)]
+        if tipo == TRAMA_MARCA and largo == 13:
+            return [("MARCA", struct.unpack('<BIff', payload))]
+        return [("RAW", payload.hex())]
+
+    def _siguiente_evento(self, timeout):
+        """Siguiente evento de la cola, o None si no llegó nada a tiempo."""
+        try:
+            evento = self._eventos.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if evento[0] == "DESCONECTADO":
+            raise RuntimeError(f"Conexión serial perdida: {evento[1]}")
+        return evento
+
+    def _descartar_eventos(self):
+        """Vacía eventos viejos (p.ej. el OK que sigue a HOMED)."""
         while True:
-            if self.ser.in_waiting:
-                line = self.ser.readline().decode('utf-8').strip()
-                if line in ["READY", "HOMED"]: 
-                    return
-            
-            if time.time() - start_time > 80:
-                raise RuntimeError("El ARDUINO no respondió READY a tiempo.")
+            try:
+                self._eventos.get_nowait()
+            except queue.Empty:
+                return
+
+    def _esperar_evento(self, tipos, timeout, mensaje_error):
+        limite = time.monotonic() + timeout
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise RuntimeError(mensaje_error)
+            evento = self._siguiente_evento(restante)
+            if evento is not None and evento[0] in tipos:
+                return evento
+
+    def _wait_for_ready(self):
+        self._esperar_evento(("READY", "HOMED"), 80, "El ARDUINO no respondió READY a tiempo.")
 
     def _send_command(self, cmd):
         self.ser.write((cmd + "\n").encode('utf-8'))
 
+    def _send_cont(self, n=1):
+        """Autoriza al Arduino a avanzar n puntos (trama o texto)."""
+        if self._modo_binario:
+            self.ser.write(_trama(TRAMA_CONT, struct.pack('<H', n) if n > 1 else b""))
+        else:
+            self._send_command("CONT" if n == 1 else f"CONT {n}")
+
+    # ---------------------------------------------------------
+    # VENTANA DE CRÉDITO (CONT n)
+    # ---------------------------------------------------------
+
+    def _calibrar_credito(self, espera, usar_buffer, pipeline, repeticiones=8):
+        """
+        Mide con PINGs lo que entra en el DWELL además del asentamiento.
+        Devuelve (latencia, captura, dispersión):
+        - latencia: del envío del gatillo (POS + LASER, o la trama M) en el
+          Arduino a su llegada al hilo lector. La parte fija del enlace (USB,
+          planificación) sale del mejor PING; se le suma la transmisión del
+          gatillo a los baudios actuales.
+        - captura: mediana, desde la llegada del PONG, de lo que hace _medir
+          tras un LASER sin contar el asentamiento: pasar el evento al hilo
+          que mide, encender el láser, el retraso de time.sleep y tomar la
+          muestra apagándolo en el mismo mensaje. Se mide con el láser
+          apagado y una espera corta (el retraso de sleep no depende de ella).
+        - dispersión: desvío robusto (MAD) de la captura; una transacción o
+          un sleep aislado muy lento no infla el DWELL de todo el barrido.
+        """
+        por_byte = 10 / self.ser.baudrate  # 8N1: 10 bits por byte
+        pausa = min(espera, 0.01)
+        ida_y_vuelta, duraciones = [], []
+        for _ in range(repeticiones):
+            self._descartar_eventos()
+            t_envio = time.perf_counter()
+            self._send_command("PING")
+            t_pong = self._esperar_evento(("PONG",), 5, "PING failed")[2]
+            ida_y_vuelta.append(t_pong - t_envio)
+            self.lockin.set_amplitude(LASER_OFF_VOLTAGE)  # Mismo costo que encenderlo
+            time.sleep(pausa)
+            if usar_buffer:
+                self.lockin.disparar(voltaje_despues=LASER_OFF_VOLTAGE)
+            elif pipeline:
+                self.lockin.solicitar_medicion(voltaje_despues=LASER_OFF_VOLTAGE)
+            else:
+                self.lockin.get_measurements(voltaje_despues=LASER_OFF_VOLTAGE)
+            duraciones.append(time.perf_counter() - t_pong - pausa)
+            if pipeline and not usar_buffer:
+                self.lockin.leer_medicion()  # Fuera del DWELL: no cuenta
+        if usar_buffer:
+            self.lockin.reiniciar_buffer()  # Descartar los TRIG de prueba
+        # PING\n y PONG\r\n: 11 bytes en total; lo demás es latencia fija (ida y vuelta)
+        fija = max(min(ida_y_vuelta) - 11 * por_byte, 0.0) / 2
+        bytes_gatillo = 12 if self._modo_binario else len("POS 100.000 100.000\r\nLASER\r\n")
+        captura = float(np.median(duraciones))
+        dispersion = 1.4826 * float(np.median(np.abs(np.subtract(duraciones, captura))))
+        return fija + bytes_gatillo * por_byte, captura, dispersion
+
+    def _preparar_credito(self, ventana_cont, espera, usar_buffer=False, pipeline=False):
+        """Configura DWELL en el firmware; si no lo soporta, queda un CONT por punto."""
+        self._ventana = self._ventana_maxima = 1
+        self._credito = 0
+        self.puntos_tardios = 0
+        self._latencia_enlace = 0.0
+        if ventana_cont <= 1:
+            return
+        # El DWELL corre en el reloj del Arduino desde que envía el LASER: la
+        # PC lo ve llegar _latencia_enlace después y tiene menos tiempo.
+        self._latencia_enlace, captura, dispersion = self._calibrar_credito(espera, usar_buffer, pipeline)
+        # Margen = 3 desvíos de la captura medida; si aun así una llega
+        # tarde, _liberar_punto reduce la ventana.
+        margen = max(3 * dispersion, self.margen_minimo_dwell)
+        self._dwell = self._latencia_enlace + espera + captura + margen
+        log.info("Latencia del enlace: %.1f ms; captura: %.1f ms (σ %.1f); DWELL = %.1f ms",
+                 self._latencia_enlace * 1000, captura * 1000, dispersion * 1000, self._dwell * 1000)
+        self._descartar_eventos()
+        self._send_command(f"DWELL {math.ceil(self._dwell * 1000)}")
+        tipo = self._esperar_evento(("OK", "ERR"), 5, "El ARDUINO no respondió a DWELL.")[0]
+        if tipo == "ERR":
+            log.warning("Firmware sin CONT n: se usa un CONT por punto.")
+            return
+        self._ventana = self._ventana_maxima = min(int(ventana_cont), 65535)
+
+    def _tomar_credito(self):
+        """
+        Al llegar un LASER: True si el firmware ya tenía crédito para este
+        punto (avanzará solo tras el DWELL), False si está esperando un CONT.
+        """
+        if self._credito > 0:
+            self._credito -= 1
+            return True
+        return False
+
+    def _liberar_punto(self, con_credito, t_laser, t_captura):
+        """
+        Tras capturar la muestra: si el Arduino espera, le da crédito para
+        toda la ventana; si ya avanzaba con crédito, verifica que la captura
+        cayó dentro del DWELL y repone crédito cuando queda la mitad.
+        """
+        if not con_credito:
+            self._send_cont(self._ventana)
+            self._credito = self._ventana - 1
+            self._t_liberacion = time.perf_counter()
+            return
+
+        # El DWELL empezó en el Arduino antes de que el LASER llegara a la PC
+        t_inicio_dwell = t_laser - self._latencia_enlace
+        if t_captura - t_inicio_dwell > self._dwell:
+            # La mesa pudo moverse durante la captura: ventana más prudente
+            self.puntos_tardios += 1
+            self._ventana = max(1, self._ventana // 2)
+            log.warning("Captura tardía (%.1f ms): ventana = %d",
+                        (t_captura - t_inicio_dwell) * 1000, self._ventana)
+
+        objetivo = self._ventana - 1  # Crédito por delante del punto actual
+        if self._credito <= objetivo // 2 and objetivo > self._credito:
+            n = objetivo - self._credito
+            self._send_cont(n)
+            self._credito += n
+        # Con crédito la mesa arranca sola al terminar el DWELL (estimado)
+        self._t_liberacion = t_inicio_dwell + self._dwell
+
+    def _terminar_credito(self):
+        """
+        Vuelve el firmware a DWELL 0. Se llama al salir de cualquier barrido
+        (también por error, abortado o con el puerto ya cerrado), así que no
+        lanza: un fallo aquí taparía el error original.
+        """
+        try:
+            if self._ventana_maxima > 1:
+                self._send_command("DWELL 0")
+                # Consumir su OK para que no termine antes de tiempo el próximo barrido
+                self._esperar_evento(("OK", "ERR"), 5, "El ARDUINO no respondió a DWELL.")
+        except (serial.SerialException, OSError, RuntimeError) as e:
+            log.warning("No se pudo restablecer DWELL 0: %s", e)
+        finally:
+            self._ventana = self._ventana_maxima = 1
+            self._credito = 0
+
     def stop_current_operation(self):
         """Activa la bandera para detener el bucle de medición"""
         self._abort = True
@@ -41,85 +414,388 @@ class MesaXY:
             self.disable() # Apagar motores
             self.lockin.close()
             time.sleep(0.1)
+            self._lector_activo = False
             if self.ser.is_open:
                 self.ser.close()
         except Exception as e:
-            print(f"Error cerrando: {e}")
+            log.error("Error cerrando: %s", e)
 
     def ajustar_frecuencia(self,freq):
         self.lockin.set_frequency(freq)
 
-    def sweep_and_measure_generator(self, x_max, y_max, res):
+    def sweep_and_measure_generator(self, x_max, y_max, res, usar_buffer=False, pipeline=False,
+                                    ventana_cont=1):
         """
         Generador sincronizado: 
         1. Recibe posición (POS) -> La guarda.
         2. Recibe gatillo (LASER) -> Mide y continúa.
+
+        Con usar_buffer=True cada punto se guarda en el buffer interno del
+        lock-in (TRIG) y se libera al Arduino de inmediato; los valores se
+        leen en binario una vez por fila y se emparejan con las POS anotadas.
+
+        Con pipeline=True el SNAP? y el apagado del láser van en un solo
+        mensaje y el CONT se envía apenas el lock-in congela la muestra, así
+        la lectura GPIB y el procesado en la GUI/DB del punto k ocurren
+        mientras la mesa se mueve al punto k+1 (con el láser ya apagado).
+
+        Con ventana_cont=n > 1 se autorizan n puntos por cada "CONT n" y el
+        firmware se queda DWELL ms en cada punto; los CONT por punto dejan
+        de limitar los puntos/segundo.
+
+        Cada z_data lleva 'tiempos': instantes perf_counter por etapa del
+        punto (ver instrumentacion.py), que la GUI completa y la DB guarda.
+        """
+        yield from self._medir(f"SWEEP {x_max} {y_max} {res}", None, usar_buffer, pipeline, ventana_cont)
+
+    def measure_points_generator(self, puntos, usar_buffer=False, pipeline=False, ventana_cont=1,
+                                 ordenar=True):
+        """
+        Igual que sweep_and_measure_generator, pero recorre una lista
+        arbitraria de (x, y) en mm (comando POINTS del firmware). Con
+        ordenar=True se reordenan con planificar(); si no, en el orden dado.
+        Los puntos se envían con "P x y" (o en tramas, en modo rápido) de a
+        uno por ACK, hasta tener VENTANA_PUNTOS encolados por delante del
+        que se mide; la lista se cierra con END.
+        """
+        if ordenar:
+            puntos = self.planificar(puntos)
+        yield from self._medir("POINTS", iter(puntos), usar_buffer, pipeline, ventana_cont)
+
+    def planificar(self, puntos, mascara=None, res=None, medidos=None):
+        """
+        Prepara una lista de puntos para measure_points_generator: aplica la
+        máscara (función o matriz [iy, ix] de paso res), quita los ya
+        medidos (para retomar) y ordena el recorrido desde la posición
+        actual para minimizar el tiempo de movimiento (ver planificador.py).
+        """
+        if mascara is not None:
+            puntos = planificador.filtrar_mascara(puntos, mascara, res)
+        if medidos is not None:
+            puntos = planificador.excluir_medidos(puntos, medidos, res)
+        return planificador.ordenar_recorrido(puntos, inicio=self.posicion)
+
+    @staticmethod
+    def region_points(x0, y0, x1, y1, res):
+        """Puntos de la malla de paso res dentro del sub-rectángulo [x0, x1] × [y0, y1]."""
+        return planificador.puntos_rectangulo(x0, y0, x1, y1, res)
+
+    def adaptive_sweep_generator(self, plan, **opciones):
+        """
+        Barrido adaptativo (ver adaptativo.py): mide la pasada gruesa del
+        plan y luego cada nivel de refinamiento que éste pida, hasta que no
+        queden puntos. Las opciones son las de measure_points_generator.
+        Si el plan ya trae puntos registrados (al retomar) solo se miden
+        los que falten.
+        """
+        self._abort = False
+        puntos = plan.puntos_iniciales()
+        nivel = 0
+        while not self._abort:
+            if puntos:
+                log.info("Barrido adaptativo, nivel %d: %d puntos", nivel, len(puntos))
+                for x, y, z_data in self.measure_points_generator(puntos, **opciones):
+                    plan.registrar(x, y, z_data)
+                    yield x, y, z_data
+            if self._abort:
+                break
+            puntos = plan.siguientes_puntos()
+            if not puntos:
+                break
+            nivel += 1
+        log.info("Barrido adaptativo: %d de %d puntos de la malla medidos.",
+                 plan.puntos_medidos, plan.total_malla)
+
+    def fly_scan_generator(self, x_max, y_max, res, velocidad=None):
+        """
+        Barrido con movimiento continuo (comando FLY del firmware): cada fila
+        se recorre a velocidad constante con el láser encendido mientras el
+        lock-in guarda muestras a tasa fija, disparado por el Arduino al
+        pasar por el inicio de la fila. El firmware manda marcas (t_us, x)
+        durante la fila; la posición de cada muestra se interpola entre
+        ellas (corrigiendo el retardo del filtro) y las muestras se
+        promedian por celda de la malla. Cede un punto por celda, como
+        sweep_and_measure_generator.
+
+        Sin 'velocidad' (mm/s) se elige la que da muestras_por_celda
+        muestras por celda sin cruzar una celda en menos de un asentamiento.
+        """
+        self._abort = False
+        nx = int(x_max / res) + 1
+        tau, orden = self.lockin.constante_tiempo(), self.lockin.orden_filtro()
+        espera = self.lockin.tiempo_asentamiento(self.fraccion_asentamiento)
+        indice = indice_tasa(self.muestras_por_celda / espera)
+        tasa = tasa_muestreo(indice)
+        if velocidad is None:
+            velocidad = min(res * tasa / self.muestras_por_celda, res / espera,
+                            planificador.MAX_SPEED / planificador.STEPS_PER_MM)
+        # Una fila entera tiene que entrar en el buffer
+        minima = x_max * tasa / (BUFFER_MAX_PUNTOS - 1)
+        if velocidad < minima:
+            log.warning("Fila demasiado larga para el buffer: velocidad %.4f -> %.4f mm/s", velocidad, minima)
+            velocidad = minima
+        # Cada etapa RC retrasa la salida ~tau: la muestra k refleja la posición de t_k - retardo
+        retardo = orden * tau
+        log.info("Fly scan: %.4f mm/s, %g muestras/s (%.1f por celda), retardo %.1f ms.",
+                 velocidad, tasa, res * tasa / velocidad, retardo * 1000)
+
+        self.lockin.iniciar_buffer_continuo(indice)
+        self.lockin.set_amplitude(LASER_ON_VOLTAGE)
+        self._descartar_eventos()
+        self._send_command(f"FLY {x_max} {y_max} {res} {velocidad:.5f}")
+        t0 = time.perf_counter()
+        self._send_cont()  # Buffer armado: la primera fila puede arrancar
+        marcas, n_puntos = [], 0
+        t_fila_us = 0
+        t_inicio_fila = t0
+
+        try:
+            while not self._abort:
+                evento = self._siguiente_evento(timeout=0.1)
+                if evento is None:
+                    continue
+                tipo, datos, t_evento = evento
+
+                if tipo == "MARCA":
+                    clase, t_us, x, y = datos
+                    y = round(y, 3)  # Mismo redondeo que POS
+                    if clase == MARCA_INICIO_FILA:
+                        t_fila_us, marcas, t_inicio_fila = t_us, [], t_evento
+                    # micros() del Arduino da la vuelta cada ~71 min
+                    marcas.append((((t_us - t_fila_us) & 0xFFFFFFFF) / 1e6, x))
+                    if clase != MARCA_FIN_FILA:
+                        continue
+
+                    # Fila completa: leer, rearmar y liberar la próxima antes de procesar
+                    t_fin = marcas[-1][0]
+                    n = min(int((t_fin + retardo) * tasa) + 1, self.lockin.puntos_en_buffer())
+                    r, phi = self.lockin.leer_buffer_crudo(n) if n > 0 else (np.empty(0), np.empty(0))
+                    t_captura = time.perf_counter()
+                    self.lockin.rearmar_buffer()
+                    self._send_cont()
+
+                    t_m, x_m = np.array(marcas).T
+                    celdas = binear_fila(r, phi, np.arange(n) / tasa - retardo, t_m, x_m, res, nx)
+                    for ix, z_data in celdas:
+                        z_data["tiempos"] = {"t0": t0, "t_pos": t_inicio_fila, "t_captura": t_captura,
+                                             "t_yield": time.perf_counter()}
+                        yield round(ix * res, 3), y, z_data
+                    n_puntos += len(celdas)
+                    self.posicion = (x_m[-1], y)
+
+                elif tipo == "ERR":
+                    raise RuntimeError(f"Arduino Error: {datos}")
+
+                elif tipo == "OK":
+                    duracion = time.perf_counter() - t0
+                    log.info("Fly scan terminado: %d puntos en %.1f s (%.1f pts/s).",
+                             n_puntos, duracion, n_puntos / max(duracion, 1e-9))
+                    break
+        finally:
+            self.lockin.detener_buffer()
+            self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+
+    def _enviar_puntos(self):
         """
+        Envía el siguiente punto de la lista en curso si el anterior ya fue
+        confirmado (ACK) y la cola del firmware no tiene VENTANA_PUNTOS; al
+        agotar la lista, END.
+        """
+        if (self._lista_pendiente is None or self._punto_en_vuelo
+                or self._puntos_en_cola >= VENTANA_PUNTOS):
+            return
+        punto = next(self._lista_pendiente, None)
+        if punto is None:
+            self.ser.write(b"END\n")
+            self._lista_pendiente = None
+        elif self._modo_binario:
+            self.ser.write(_trama(TRAMA_PUNTO, struct.pack('<ff', *punto)))
+            self._punto_en_vuelo = True
+        else:
+            self._send_command(f"P {punto[0]:.4f} {punto[1]:.4f}")
+            self._punto_en_vuelo = True
+
+    def _medir(self, cmd, puntos, usar_buffer, pipeline, ventana_cont):
+        """Bucle común de SWEEP y POINTS (puntos: iterador de (x, y) o None)."""
         self._abort = False
         current_x, current_y = 0.0, 0.0  # Nuestra "libreta" de coordenadas
+        posiciones_buffer = []  # POS de los puntos guardados en el lock-in
         
         self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+        espera = self.lockin.tiempo_asentamiento(self.fraccion_asentamiento)
+        tiempos_asentamiento = []
+        if usar_buffer:
+            self.lockin.iniciar_buffer()
+        self._preparar_credito(ventana_cont, espera, usar_buffer, pipeline)
+        try:
+            self._descartar_eventos()
+            self._send_command(cmd)
+            t0 = self._t_liberacion = time.perf_counter()
+            self._lista_pendiente = puntos
+            self._punto_en_vuelo, self._puntos_en_cola = False, 0
+            self._enviar_puntos()
+            tiempos = {"t0": t0}
         
-        cmd = f"SWEEP {x_max} {y_max} {res}"
-        self._send_command(cmd)
-        
-        while not self._abort:
-            if self.ser.in_waiting:
-                line = self.ser.readline().decode('utf-8').strip()
-                if not line: continue
+            while not self._abort:
+                # Timeout corto solo para poder revisar la bandera de abortar
+                evento = self._siguiente_evento(timeout=0.1)
+                if evento is None:
+                    continue
+                tipo, datos, t_evento = evento
                 
                 # A: Actualizar coordenadas en la libreta
-                if line.startswith("POS"):
-                    try:
-                        _, x_str, y_str = line.split()
-                        current_x, current_y = float(x_str), float(y_str)
-                    except ValueError:
-                        print(f"Error parseando posición: {line}")
+                if tipo == "POS":
+                    current_x, current_y = datos
+                    self.posicion = datos
+                    tiempos = {"t0": t0, "t_cont": self._t_liberacion, "t_pos": t_evento}
+                    if self._puntos_en_cola > 0:
+                        self._puntos_en_cola -= 1  # El firmware sacó un punto de su cola
+                        self._enviar_puntos()
+
+                    # Cambio de fila (o buffer lleno): descargar el lock-in
+                    if posiciones_buffer and (current_y != posiciones_buffer[-1][1] or
+                                              len(posiciones_buffer) >= BUFFER_MAX_PUNTOS):
+                        yield from self._vaciar_buffer(posiciones_buffer)
 
                 # B: Ejecutar la medición (El "Gatillo")
-                elif line == "LASER":
+                elif tipo == "LASER":
                     if self._abort: break
-                    
+                
                     # --- SECUENCIA DE MEDICIÓN ---
-                    self.ajustar_frecuencia(LASER_ON_VOLTAGE)
-                    time.sleep(0.015) # Estabilización
-                    
-                    z_data = self.lockin.get_measurements()
-                    print(f"Medido en ({current_x}, {current_y}): {z_data}")
-                    
-                    self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
-                    
+                    tiempos["t_laser"] = t_evento
+                    con_credito = self._tomar_credito()
+                    self.lockin.set_amplitude(LASER_ON_VOLTAGE)
+                    z_data, t_asentamiento = self._esperar_asentamiento(espera)
+                    tiempos_asentamiento.append(t_asentamiento)
+                    tiempos["t_asentado"] = time.perf_counter()
+
+                    if usar_buffer:
+                        # TRIG y apagado en un solo mensaje; se lee al final de la fila
+                        self.lockin.disparar(voltaje_despues=LASER_OFF_VOLTAGE)
+                        tiempos["t_captura"] = time.perf_counter()
+                        posiciones_buffer.append((current_x, current_y, tiempos))
+                        self._liberar_punto(con_credito, t_evento, tiempos["t_captura"])
+                        continue
+                
+                    if pipeline:
+                        # Muestra congelada y láser apagado en un solo mensaje ->
+                        # liberar al Arduino antes de leerla; la mesa nunca se
+                        # mueve con el láser encendido
+                        if z_data is None:
+                            self.lockin.solicitar_medicion(voltaje_despues=LASER_OFF_VOLTAGE)
+                        else:
+                            self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+                        self._liberar_punto(con_credito, t_evento, time.perf_counter())
+                        if z_data is None:
+                            z_data = self.lockin.leer_medicion()
+                    elif z_data is None:
+                        # Muestra y apagado en un solo mensaje: con crédito los
+                        # dos tienen que caer dentro del DWELL
+                        z_data = self.lockin.get_measurements(voltaje_despues=LASER_OFF_VOLTAGE)
+                    else:
+                        self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+                    t_captura = tiempos["t_captura"] = time.perf_counter()
+                    # Por punto: muestreado y fuera de la consola (ver bitacora.py)
+                    log.debug("Medido en (%s, %s): R=%.4e phi=%.2f",
+                              current_x, current_y, z_data['R'], z_data['phi'], extra=PUNTO)
+                
                     # Ceder datos a la GUI
+                    z_data["tiempos"] = tiempos
+                    tiempos["t_yield"] = time.perf_counter()
                     yield current_x, current_y, z_data
-                    
+                
                     # Liberar al Arduino para el siguiente punto
-                    self._send_command("CONT")
+                    if not pipeline:
+                        self._liberar_punto(con_credito, t_evento, t_captura)
 
-                elif line.startswith("ERR"):
-                    raise RuntimeError(f"Arduino Error: {line}")
-                
-                elif line == "OK":
-                    print("Barrido terminado con éxito.")
+                elif tipo == "ACK":
+                    # El firmware encoló el punto enviado: va el siguiente
+                    self._punto_en_vuelo = False
+                    self._puntos_en_cola += 1
+                    self._enviar_puntos()
+
+                elif tipo == "ERR":
+                    raise RuntimeError(f"Arduino Error: {datos}")
+            
+                elif tipo == "OK":
+                    duracion = time.perf_counter() - t0
+                    log.info("Barrido terminado con éxito: %d puntos en %.1f s (%.1f pts/s).",
+                             len(tiempos_asentamiento), duracion, len(tiempos_asentamiento) / max(duracion, 1e-9))
                     break
-            else:
-                time.sleep(0.01)
 
-        self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+            # Lo que haya quedado en el buffer (última fila o barrido abortado)
+            if posiciones_buffer:
+                yield from self._vaciar_buffer(posiciones_buffer)
+        finally:
+            # También si el barrido termina por error, timeout o close() del generador
+            self._terminar_credito()
+            self._lista_pendiente = None
+            if usar_buffer:
+                self.lockin.detener_buffer()
+            self.lockin.set_amplitude(LASER_OFF_VOLTAGE)
+
+        if tiempos_asentamiento:
+            self.estadisticas_asentamiento = {
+                "calculado": espera,
+                "puntos": len(tiempos_asentamiento),
+                "media": sum(tiempos_asentamiento) / len(tiempos_asentamiento),
+                "min": min(tiempos_asentamiento),
+                "max": max(tiempos_asentamiento),
+            }
+            log.info("Asentamiento: %s", self.estadisticas_asentamiento)
+
+    def _esperar_asentamiento(self, espera):
+        """
+        Espera a que el lock-in se estabilice tras encender el láser.
+        Devuelve (última lectura o None, segundos esperados). En modo
+        convergencia, tras la espera calculada sigue leyendo hasta que dos
+        lecturas seguidas de R difieran menos que la tolerancia, con un tope
+        de tres veces la espera calculada.
+        """
+        t0 = time.perf_counter()
+        time.sleep(espera)
+        if not self.modo_convergencia:
+            return None, time.perf_counter() - t0
+
+        limite = t0 + 3 * espera
+        previa = self.lockin.get_measurements()
+        while True:
+            time.sleep(espera / 5)
+            actual = self.lockin.get_measurements()
+            cambio = abs(actual['R'] - previa['R'])
+            if cambio <= self.tolerancia_convergencia * max(abs(actual['R']), 1e-15):
+                break
+            if time.perf_counter() > limite:
+                break
+            previa = actual
+        return actual, time.perf_counter() - t0
+
+    def _vaciar_buffer(self, posiciones):
+        """Lee el buffer del lock-in y cede cada punto con su POS."""
+        mediciones = self.lockin.leer_buffer(len(posiciones))
+        for (x, y, tiempos), z_data in zip(posiciones, mediciones):
+            z_data["tiempos"] = tiempos
+            tiempos["t_yield"] = time.perf_counter()
+            yield x, y, z_data
+        posiciones.clear()
 
     def home(self):
+        self._descartar_eventos()
         self._send_command("HOME")
         self._wait_for_ready()
+        self.posicion = (0.0, 0.0)
+        # El firmware cierra HOME con un OK tras HOMED: consumirlo aquí
+        self._esperar_evento(("OK",), 5, "El ARDUINO no confirmó HOME.")
 
     def ping(self): #Verifiquemos la conexion de una forma chistosa jajaja
-        response = self._send_command("PING")
-        if response != "PONG":
-            raise RuntimeError("PING failed")
-        print("Ping successful")
+        self._send_command("PING")
+        self._esperar_evento(("PONG",), 5, "PING failed")
+        log.info("Ping successful")
 
     def enable(self):
         self._send_command("EN_ON")
-        print("Motors enabled")
+        log.info("Motors enabled")
 
     def disable(self):
         self._send_command("EN_OFF")
-        print("Motors disabled")
\ No newline at end of file
+        log.info("Motors disabled")
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Planificación de recorridos para listas de puntos (comando POINTS).
+
+Los dos motores se mueven a la vez, así que un salto tarda lo que tarde el
+eje más largo con el perfil trapezoidal de AccelStepper: el costo entre dos
+puntos es tiempo_movimiento(max(|dx|, |dy|)). Para puntos cercanos domina la
+aceleración, no la distancia.
+
+ordenar_recorrido prueba serpentina por filas, serpentina por columnas y
+(para listas no muy grandes) vecino más cercano, y se queda con el orden de
+menor tiempo total estimado. Las demás funciones arman la lista: retícula de
+un sub-rectángulo, máscara de zonas a medir y exclusión de puntos ya medidos
+para retomar barridos.
+"""
+import math
+
+import numpy as np
+
+# Mismos valores que MesaXYSerial.ino
+STEPS_PER_MM = 6400.0
+MAX_SPEED = 10000.0     # pasos/s
+ACCELERATION = 20000.0  # pasos/s^2
+
+# Vecino más cercano es O(n²): por encima de esto solo se prueban serpentinas
+MAX_PUNTOS_VECINO = 4000
+
+
+def tiempo_movimiento(distancia_mm, max_speed=MAX_SPEED, aceleracion=ACCELERATION):
+    """Duración de un movimiento con perfil trapezoidal (o triangular si es corto)."""
+    pasos = abs(distancia_mm) * STEPS_PER_MM
+    if pasos == 0:
+        return 0.0
+    pasos_rampa = max_speed ** 2 / aceleracion  # Acelerar + frenar hasta max_speed
+    if pasos < pasos_rampa:
+        return 2 * math.sqrt(pasos / aceleracion)
+    return pasos / max_speed + max_speed / aceleracion
+
+
+def tiempos_movimiento(distancias_mm, max_speed=MAX_SPEED, aceleracion=ACCELERATION):
+    """Versión vectorizada de tiempo_movimiento."""
+    pasos = np.abs(np.asarray(distancias_mm, dtype=float)) * STEPS_PER_MM
+    pasos_rampa = max_speed ** 2 / aceleracion
+    return np.where(pasos < pasos_rampa,
+                    2 * np.sqrt(pasos / aceleracion),
+                    pasos / max_speed + max_speed / aceleracion)
+
+
+def _como_array(puntos):
+    return np.asarray(puntos, dtype=float).reshape(-1, 2)
+
+
+def _a_lista(p):
+    return [(round(float(x), 3), round(float(y), 3)) for x, y in p]
+
+
+def costo_recorrido(puntos, inicio=(0.0, 0.0)):
+    """Tiempo de movimiento estimado (s) para visitar los puntos en ese orden."""
+    p = np.vstack([np.asarray(inicio, dtype=float).reshape(1, 2), _como_array(puntos)])
+    saltos = np.abs(np.diff(p, axis=0)).max(axis=1)
+    return float(tiempos_movimiento(saltos).sum())
+
+
+def puntos_rectangulo(x0, y0, x1, y1, res):
+    """Puntos de la malla (múltiplos de res) dentro de [x0, x1] × [y0, y1]."""
+    tol = 1e-9
+    ix = np.arange(math.ceil(x0 / res - tol), math.floor(x1 / res + tol) + 1)
+    iy = np.arange(math.ceil(y0 / res - tol), math.floor(y1 / res + tol) + 1)
+    yy, xx = np.meshgrid(iy * res, ix * res, indexing='ij')
+    return _a_lista(np.column_stack([xx.ravel(), yy.ravel()]))
+
+
+def filtrar_mascara(puntos, mascara, res=None):
+    """
+    Deja solo los puntos a medir según la máscara: una función
+    mascara(x, y) -> bool, o una matriz booleana indexada [iy, ix] en
+    la malla de paso res (fuera de la matriz cuenta como False).
+    """
+    p = _como_array(puntos)
+    if callable(mascara):
+        dejar = np.array([bool(mascara(x, y)) for x, y in p], dtype=bool)
+    else:
+        mascara = np.asarray(mascara, dtype=bool)
+        ix = np.rint(p[:, 0] / res).astype(np.int64)
+        iy = np.rint(p[:, 1] / res).astype(np.int64)
+        dentro = (iy >= 0) & (iy < mascara.shape[0]) & (ix >= 0) & (ix < mascara.shape[1])
+        dejar = np.zeros(len(p), dtype=bool)
+        dejar[dentro] = mascara[iy[dentro], ix[dentro]]
+    return _a_lista(p[dejar])
+
+
+def _claves(p, res):
+    """Índices de malla combinados en un entero por punto."""
+    ix = np.rint(p[:, 0] / res).astype(np.int64)
+    iy = np.rint(p[:, 1] / res).astype(np.int64)
+    return iy * (1 << 32) + ix
+
+
+def excluir_medidos(puntos, medidos, res):
+    """Quita los puntos cuya celda de malla ya está en 'medidos' (para retomar)."""
+    p = _como_array(puntos)
+    m = _como_array(medidos)
+    if len(p) == 0 or len(m) == 0:
+        return _a_lista(p)
+    return _a_lista(p[~np.isin(_claves(p, res), _claves(m, res))])
+
+
+def _serpentina(p, inicio, eje):
+    """Orden por filas (eje=1) o columnas (eje=0), alternando el sentido."""
+    principal = np.round(p[:, eje], 6)
+    secundario = p[:, 1 - eje]
+    orden = np.lexsort((secundario, principal))
+    # Empezar por la fila/columna más cercana al inicio
+    if abs(principal[orden[-1]] - inicio[eje]) < abs(principal[orden[0]] - inicio[eje]):
+        orden = np.lexsort((secundario, -principal))
+    p = p[orden]
+    _, comienzos = np.unique(np.round(p[:, eje], 6), return_index=True)
+    comienzos = np.sort(comienzos)
+    tramos = np.split(np.arange(len(p)), comienzos[1:])
+    # El primer tramo va en el sentido que lo deja más cerca del inicio
+    invertir = abs(p[tramos[0][-1], 1 - eje] - inicio[1 - eje]) < abs(p[tramos[0][0], 1 - eje] - inicio[1 - eje])
+    indices = []
+    for tramo in tramos:
+        indices.append(tramo[::-1] if invertir else tramo)
+        invertir = not invertir
+    return p[np.concatenate(indices)]
+
+
+def _vecino_mas_cercano(p, inicio):
+    restantes = p.copy()
+    actual = np.asarray(inicio, dtype=float)
+    orden = np.empty_like(p)
+    for k in range(len(p)):
+        i = int(np.abs(restantes - actual).max(axis=1).argmin())
+        actual = restantes[i].copy()
+        orden[k] = actual
+        restantes[i] = restantes[-1]
+        restantes = restantes[:-1]
+    return orden
+
+
+def ordenar_recorrido(puntos, inicio=(0.0, 0.0)):
+    """Devuelve los puntos en el orden de menor tiempo de movimiento estimado."""
+    p = _como_array(puntos)
+    if len(p) <= 2:
+        return _a_lista(p)
+    candidatos = [_serpentina(p, inicio, 1), _serpentina(p, inicio, 0)]
+    if len(p) <= MAX_PUNTOS_VECINO:
+        candidatos.append(_vecino_mas_cercano(p, inicio))
+    mejor = min(candidatos, key=lambda c: costo_recorrido(c, inicio))
+    return _a_lista(mejor)
@@ -0,0 +1,611 @@
+"""
+Simulador de hardware para usar MesaXY y SR830 sin Arduino ni GPIB.
+
+ArduinoSimulado imita el puerto serie con el firmware MesaXYSerial.ino detrás
+(READY, PING, HOME, SWEEP serpentino, POINTS/P/ACK/END, FLY con marcas, CONT /
+CONT n, DWELL, ABORT, FAST con tramas binarias). El tiempo de movimiento sale
+del perfil trapezoidal de AccelStepper con MAX_SPEED/ACCELERATION del
+firmware, y el enlace tiene latencia y tiempo de transmisión según los baudios.
+
+LockinSimulado imita el recurso VISA del SR830 (SNAP?, SLVL, FREQ, OFLT?,
+OFSL?, buffer con TRIG/TRCB? o a tasa fija con SRAT/TSTR 1) con latencia por
+transacción. La señal depende de la posición de la mesa simulada; en el
+muestreo a tasa fija, de la posición en el instante de cada muestra menos el
+retardo del filtro.
+
+Se usa un objeto en el mismo proceso en vez de un pty para que funcione
+igual en Windows.
+"""
+import math
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import serial
+
+from lockin import SR830, LASER_ON_VOLTAGE, BUFFER_MAX_PUNTOS, tasa_muestreo
+from mesaxy import (MesaXY, TRAMA_INICIO, TRAMA_MEDIR, TRAMA_CONT, TRAMA_PUNTO, TRAMA_MARCA,
+                    MARCA_INTERMEDIA, MARCA_INICIO_FILA, MARCA_FIN_FILA, _checksum, _trama)
+from planificador import STEPS_PER_MM, MAX_SPEED, ACCELERATION, tiempo_movimiento
+
+TRAMA_ABORT = ord('A')
+POINT_QUEUE_SIZE = 32
+# Intervalo entre marcas del FLY (MARK_INTERVAL_US del firmware)
+INTERVALO_MARCA = 0.1
+INTERVALO_MARCA_RAPIDO = 0.01
+MARGEN_ARRANQUE = 1.2  # RUNUP_FACTOR del firmware
+
+
+class _Enlace:
+    """
+    Un sentido del puerto serie: los bytes se transmiten de a uno por vez a
+    'baudios' (10 bits por byte) y llegan 'latencia' segundos después.
+    """
+
+    def __init__(self, latencia, baudios):
+        self.latencia = latencia
+        self.baudios = baudios
+        self._cond = threading.Condition()
+        self._en_vuelo = deque()  # (instante de llegada, bytes)
+        self._buffer = bytearray()
+        self._fin_tx = 0.0
+        self.cerrado = False
+
+    def enviar(self, datos):
+        with self._cond:
+            ahora = time.perf_counter()
+            inicio = max(ahora, self._fin_tx)
+            self._fin_tx = inicio + len(datos) * 10 / self.baudios
+            self._en_vuelo.append((self._fin_tx + self.latencia, bytes(datos)))
+            self._cond.notify_all()
+
+    def _recibir_llegados(self):
+        ahora = time.perf_counter()
+        while self._en_vuelo and self._en_vuelo[0][0] <= ahora:
+            self._buffer += self._en_vuelo.popleft()[1]
+
+    def disponibles(self):
+        with self._cond:
+            self._recibir_llegados()
+            return len(self._buffer)
+
+    def recibir(self, n=None, timeout=None, hasta=None):
+        """
+        Como pyserial: devuelve n bytes (o hasta el byte 'hasta', incluido),
+        o lo que haya llegado al vencer el timeout.
+        """
+        limite = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                self._recibir_llegados()
+                if hasta is not None:
+                    fin = self._buffer.find(hasta)
+                    if fin >= 0:
+                        return self._extraer(fin + 1)
+                elif len(self._buffer) >= n:
+                    return self._extraer(n)
+                if self.cerrado:
+                    raise serial.SerialException("Puerto simulado cerrado")
+
+                ahora = time.perf_counter()
+                if limite is not None and ahora >= limite:
+                    return self._extraer(len(self._buffer) if hasta is not None else min(n, len(self._buffer)))
+                esperas = []
+                if self._en_vuelo:
+                    esperas.append(self._en_vuelo[0][0] - ahora)
+                if limite is not None:
+                    esperas.append(limite - ahora)
+                self._cond.wait(max(min(esperas), 0.0) if esperas else None)
+
+    def _extraer(self, n):
+        datos = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return datos
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrado = True
+            self._cond.notify_all()
+
+
+class ArduinoSimulado:
+    """
+    Objeto con la interfaz de serial.Serial que usa MesaXY, con el firmware
+    ejecutándose en un hilo propio (como el loop() del Arduino).
+    """
+
+    def __init__(self, latencia_serial=0.002, baudrate=9600, timeout=5, t_home=0.2,
+                 max_speed=MAX_SPEED, aceleracion=ACCELERATION):
+        self.timeout = timeout
+        self.t_home = t_home
+        self.max_speed = max_speed
+        self.aceleracion = aceleracion
+        self._a_pc = _Enlace(latencia_serial, baudrate)
+        self._a_arduino = _Enlace(latencia_serial, baudrate)
+        self.is_open = True
+
+        # Estado del firmware
+        self.posicion = (0.0, 0.0)
+        self.homed = False
+        self.motores = False
+        self.barrido_activo = False
+        self.modo_binario = False
+        self.silencio_barrido = False
+        self.credito = 0
+        self.dwell = 0.0
+        self.cola_puntos = deque()
+        self.lista_abierta = False
+        # Fila del FLY en curso: (t_disparo, x_inicio, velocidad con signo, y, x_min, x_max)
+        self._tramo = None
+        self.disparo = None  # Salida TRIG hacia el lock-in: disparo(t)
+
+        # Estadísticas (segundos acumulados)
+        self.tiempo_movimiento = 0.0
+        self.tiempo_espera_cont = 0.0
+        self.tiempo_dwell = 0.0
+        self.puntos = 0
+
+        self._hilo = threading.Thread(target=self._loop, name="ArduinoSimulado", daemon=True)
+        self._hilo.start()
+        self._println("READY")
+
+    # ---------------------------------------------------------
+    # INTERFAZ PYSERIAL (lado PC)
+    # ---------------------------------------------------------
+
+    @property
+    def baudrate(self):
+        return self._a_pc.baudios
+
+    @baudrate.setter
+    def baudrate(self, valor):
+        self._a_pc.baudios = valor
+        self._a_arduino.baudios = valor
+
+    @property
+    def in_waiting(self):
+        return self._a_pc.disponibles()
+
+    def read(self, n=1):
+        return self._a_pc.recibir(n=n, timeout=self.timeout)
+
+    def readline(self):
+        return self._a_pc.recibir(hasta=b"\n", timeout=self.timeout)
+
+    def write(self, datos):
+        if not self.is_open:
+            raise serial.SerialException("Puerto simulado cerrado")
+        self._a_arduino.enviar(datos)
+        return len(datos)
+
+    def close(self):
+        self.is_open = False
+        self._a_pc.cerrar()
+        self._a_arduino.cerrar()
+
+    def reiniciar_estadisticas(self):
+        self.tiempo_movimiento = 0.0
+        self.tiempo_espera_cont = 0.0
+        self.tiempo_dwell = 0.0
+        self.puntos = 0
+
+    # ---------------------------------------------------------
+    # FIRMWARE
+    # ---------------------------------------------------------
+
+    def _println(self, texto):
+        self._a_pc.enviar((texto + "\r\n").encode("utf-8"))
+
+    def _leer_comando(self, timeout):
+        """Siguiente comando de la PC: str (texto) o (tipo, payload) (trama)."""
+        try:
+            primero = self._a_arduino.recibir(n=1, timeout=timeout)
+        except serial.SerialException:
+            return None
+        if not primero:
+            return None
+        if self.modo_binario and primero[0] == TRAMA_INICIO:
+            cabecera = self._a_arduino.recibir(n=2, timeout=1.0)
+            if len(cabecera) < 2:
+                return None
+            tipo, largo = cabecera
+            resto = self._a_arduino.recibir(n=largo + 1, timeout=1.0)
+            if len(resto) < largo + 1 or _checksum(cabecera + resto[:-1]) != resto[-1]:
+                self._println("ERR Bad frame")
+                return None
+            return tipo, resto[:-1]
+        linea = primero + self._a_arduino.recibir(hasta=b"\n", timeout=1.0)
+        return linea.decode("utf-8", errors="replace").strip()
+
+    def _loop(self):
+        while self.is_open:
+            cmd = self._leer_comando(timeout=0.5)
+            if cmd:
+                self._procesar(cmd)
+
+    def _poll(self, timeout):
+        cmd = self._leer_comando(timeout)
+        if cmd:
+            self._procesar(cmd)
+
+    def _procesar(self, cmd):
+        if isinstance(cmd, tuple):
+            tipo, payload = cmd
+            if tipo == TRAMA_CONT and self.barrido_activo:
+                self.credito += struct.unpack("<H", payload[:2])[0] if len(payload) >= 2 else 1
+            elif tipo == TRAMA_ABORT and self.barrido_activo:
+                self._procesar("ABORT")
+            elif tipo == TRAMA_PUNTO and len(payload) == 8:
+                self._encolar_punto(*struct.unpack("<ff", payload))
+            return
+
+        partes = cmd.split()
+        nombre = partes[0] if partes else ""
+        if cmd == "PING":
+            self._println("PONG")
+        elif cmd in ("EN_ON", "EN_OFF"):
+            self.motores = cmd == "EN_ON"
+            self._println("OK")
+        elif cmd == "HOME":
+            self._println("DBG Starting homing")
+            time.sleep(self.t_home)
+            self.posicion = (0.0, 0.0)
+            self.homed = True
+            self._println("HOMED")
+            self._println("OK")
+        elif nombre == "CONT":
+            if self.barrido_activo:
+                try:
+                    self.credito += max(int(float(partes[1])), 1) if len(partes) > 1 else 1
+                except ValueError:
+                    self.credito += 1
+        elif nombre == "DWELL" and len(partes) == 2:
+            self.dwell = float(partes[1]) / 1000
+            self._println("OK")
+        elif nombre == "P" and len(partes) == 3:
+            self._encolar_punto(float(partes[1]), float(partes[2]))
+        elif cmd == "END":
+            self.lista_abierta = False
+        elif cmd == "POINTS":
+            if not self.homed:
+                self._println("ERR Not homed")
+                return
+            self._lista_puntos()
+        elif cmd == "ABORT" and self.barrido_activo:
+            self.barrido_activo = False
+            self.credito = 0
+            self._println("OK")
+        elif nombre == "FAST" and len(partes) == 2:
+            self._println("OK")
+            self.baudrate = float(partes[1])
+            self.modo_binario = True
+            self.silencio_barrido = True
+        elif nombre == "SPEED" and len(partes) == 2:
+            self.max_speed = float(partes[1])
+            self._println("OK")
+        elif nombre == "TESTMOVE" and len(partes) == 3:
+            if not self.homed:
+                self._println("ERR Not homed")
+                return
+            self._mover(float(partes[1]), float(partes[2]))
+            self._println("OK")
+        elif nombre == "FLY" and len(partes) == 5:
+            x_max, y_max, res, velocidad = map(float, partes[1:])
+            if not self.homed:
+                self._println("ERR Not homed")
+                return
+            self._vuelo(x_max, y_max, res, velocidad)
+        elif nombre == "SWEEP" and len(partes) == 4:
+            x_max, y_max, res = map(float, partes[1:])
+            if not self.homed:
+                self._println("ERR Not homed")
+                return
+            self._barrido(x_max, y_max, res)
+        else:
+            self._println("ERR Unknown command")
+
+    def _mover(self, x, y):
+        x0, y0 = self.posicion
+        if not (self.silencio_barrido and self.barrido_activo):
+            self._println(f"DBG Moving to steps: {int(-x * STEPS_PER_MM)}, {int(-y * STEPS_PER_MM)}")
+        # Los dos ejes se mueven a la vez: manda el más largo
+        t = max(tiempo_movimiento(x - x0, self.max_speed, self.aceleracion),
+                tiempo_movimiento(y - y0, self.max_speed, self.aceleracion))
+        time.sleep(t)
+        self.tiempo_movimiento += t
+        self.posicion = (x, y)
+
+    def _paso_y_pausa(self, x, y):
+        self._mover(x, y)
+        if self.modo_binario:
+            self._a_pc.enviar(_trama(TRAMA_MEDIR, struct.pack("<ff", x, y)))
+        else:
+            self._println(f"POS {x:.3f} {y:.3f}")
+            self._println("LASER")
+        self.puntos += 1
+
+        t0 = self._esperar_credito()
+        t1 = time.perf_counter()
+        while time.perf_counter() - t0 < self.dwell and self.barrido_activo:
+            self._poll(timeout=max(self.dwell - (time.perf_counter() - t0), 0.0))
+        self.tiempo_dwell += time.perf_counter() - t1
+
+    def _esperar_credito(self):
+        """Bloquea hasta tener crédito (CONT) y lo consume. Devuelve el inicio de la espera."""
+        t0 = time.perf_counter()
+        while self.credito == 0 and self.barrido_activo:
+            self._poll(timeout=0.05)
+        self.tiempo_espera_cont += time.perf_counter() - t0
+        if self.credito > 0:
+            self.credito -= 1
+        return t0
+
+    def _barrido(self, x_max, y_max, res):
+        self.barrido_activo = True
+        self.credito = 0
+        nx = int(x_max / res) + 1
+        ny = int(y_max / res) + 1
+        for j in range(ny):
+            columnas = range(nx) if j % 2 == 0 else range(nx - 1, -1, -1)
+            for i in columnas:
+                if not self.barrido_activo:
+                    break
+                self._paso_y_pausa(i * res, j * res)
+            if not self.barrido_activo:
+                break
+        self.barrido_activo = False
+        self.credito = 0
+        self._println("OK")
+
+    def _marca(self, clase, t, x, y):
+        t_us = int(t * 1e6) & 0xFFFFFFFF
+        if self.modo_binario:
+            self._a_pc.enviar(_trama(TRAMA_MARCA, struct.pack("<BIff", clase, t_us, x, y)))
+        else:
+            self._println(f"MK {clase} {t_us} {x:.5f} {y:.5f}")
+
+    def posicion_en(self, t):
+        """Posición de la mesa en el instante t (durante la última fila del FLY)."""
+        tramo = self._tramo
+        if tramo is None:
+            return self.posicion
+        t_disparo, x_inicio, v, y, x_min, x_max = tramo
+        return min(max(x_inicio + v * (t - t_disparo), x_min), x_max), y
+
+    def _vuelo(self, x_max, y_max, res, velocidad):
+        """
+        Como runFlyScan: cada fila arranca antes del borde para cruzar la
+        malla a velocidad constante, dispara el lock-in al pasar por el
+        borde y manda marcas de posición hasta el borde opuesto.
+        """
+        self.barrido_activo = True
+        self.credito = 0
+        self._tramo = None
+        v_pasos = min(velocidad * STEPS_PER_MM, self.max_speed)
+        v = v_pasos / STEPS_PER_MM
+        rampa = v_pasos ** 2 / (2 * self.aceleracion) / STEPS_PER_MM
+        arranque = MARGEN_ARRANQUE * rampa
+        # Acelerar y recorrer el margen a velocidad constante (o al revés al frenar)
+        t_rampa = v_pasos / self.aceleracion + (arranque - rampa) / v
+        intervalo = INTERVALO_MARCA_RAPIDO if self.modo_binario else INTERVALO_MARCA
+        nx = int(x_max / res) + 1
+        ny = int(y_max / res) + 1
+        for j in range(ny):
+            y = j * res
+            sentido = 1 if j % 2 == 0 else -1
+            x_a, x_b = (0.0, x_max) if sentido > 0 else (x_max, 0.0)
+            self._mover(x_a - sentido * arranque, y)
+            self._esperar_credito()  # La PC armó el buffer del lock-in
+            if not self.barrido_activo:
+                break
+
+            time.sleep(t_rampa)
+            t_disparo = time.perf_counter()
+            duracion = abs(x_b - x_a) / v
+            extremos = sorted((x_a - sentido * arranque, x_b + sentido * arranque))
+            self._tramo = (t_disparo, x_a, sentido * v, y, *extremos)
+            if self.disparo is not None:
+                self.disparo(t_disparo)
+            self._marca(MARCA_INICIO_FILA, t_disparo, x_a, y)
+            t_marca = t_disparo
+            while self.barrido_activo:
+                t_marca = min(t_marca + intervalo, t_disparo + duracion)
+                while self.barrido_activo and time.perf_counter() < t_marca:
+                    self._poll(timeout=t_marca - time.perf_counter())
+                if t_marca >= t_disparo + duracion:
+                    break
+                self._marca(MARCA_INTERMEDIA, t_marca, x_a + sentido * v * (t_marca - t_disparo), y)
+            if not self.barrido_activo:
+                break
+            self._marca(MARCA_FIN_FILA, t_marca, x_b, y)
+            time.sleep(t_rampa)  # Frenar tras el borde
+            self.tiempo_movimiento += duracion + 2 * t_rampa
+            self.posicion = (x_b + sentido * arranque, y)
+            self.puntos += nx
+        self.barrido_activo = False
+        self.credito = 0
+        self._println("OK")
+
+    def _encolar_punto(self, x, y):
+        if not (self.barrido_activo and self.lista_abierta):
+            self._println("ERR No point list")
+        elif len(self.cola_puntos) >= POINT_QUEUE_SIZE:
+            self._println("ERR Point queue full")
+        else:
+            self.cola_puntos.append((x, y))
+            self._println("ACK")
+
+    def _lista_puntos(self):
+        self.barrido_activo = True
+        self.credito = 0
+        self.cola_puntos.clear()
+        self.lista_abierta = True
+        while self.barrido_activo:
+            if self.cola_puntos:
+                self._paso_y_pausa(*self.cola_puntos.popleft())
+            elif not self.lista_abierta:
+                break
+            else:
+                self._poll(timeout=0.05)
+        self.barrido_activo = False
+        self.lista_abierta = False
+        self.credito = 0
+        self._println("OK")
+
+
+class LockinSimulado:
+    """
+    Recurso VISA simulado del SR830. Cada write/query espera su latencia.
+    La señal es una gaussiana centrada en 'centro' (mm) con ancho 'sigma'
+    y solo aparece con el láser encendido (SLVL en LASER_ON_VOLTAGE).
+    """
+
+    def __init__(self, arduino=None, latencia_escritura=0.002, latencia_consulta=0.008,
+                 oflt=4, ofsl=1, centro=(0.05, 0.05), sigma=0.02, ruido=5e-8, amplitud=5e-6):
+        self.arduino = arduino
+        self.latencia_escritura = latencia_escritura
+        self.latencia_consulta = latencia_consulta
+        self.oflt = oflt
+        self.ofsl = ofsl
+        self.centro = centro
+        self.sigma = sigma
+        self.ruido = ruido
+        self.amplitud_senal = amplitud
+        self.timeout = 5000
+
+        self.slvl = 1.0
+        self.freq = 1000.0
+        self.buffer_activo = False
+        self.srat = 14
+        self.tstr = 0
+        self._t_muestreo = None  # Inicio del muestreo a tasa fija
+        self._t_pausa = None
+        if arduino is not None:
+            arduino.disparo = self.disparo_externo
+        self._buffer_r = []
+        self._buffer_phi = []
+        self._respuesta = None
+        self._rng = np.random.default_rng(0)
+
+        self.transacciones = 0
+        self.tiempo_gpib = 0.0
+
+    def reiniciar_estadisticas(self):
+        self.transacciones = 0
+        self.tiempo_gpib = 0.0
+
+    def _ocupar(self, segundos):
+        time.sleep(segundos)
+        self.transacciones += 1
+        self.tiempo_gpib += segundos
+
+    def disparo_externo(self, t):
+        """Flanco en TRIG IN: con TSTR 1 arranca el muestreo a tasa fija."""
+        if self.tstr == 1 and self.srat < 14 and self._t_muestreo is None:
+            self._t_muestreo = t
+            self.buffer_activo = True
+
+    def _muestrear(self):
+        """Completa el buffer a tasa fija con las muestras tomadas hasta ahora."""
+        if self._t_muestreo is None:
+            return
+        tasa = tasa_muestreo(self.srat)
+        fin = self._t_pausa if self._t_pausa is not None else time.perf_counter()
+        n = min(int((fin - self._t_muestreo) * tasa) + 1, BUFFER_MAX_PUNTOS)
+        tau = (1 if self.oflt % 2 == 0 else 3) * 10 ** (self.oflt // 2) * 1e-5
+        retardo = (self.ofsl + 1) * tau
+        for k in range(len(self._buffer_r), n):
+            t = self._t_muestreo + k / tasa - retardo
+            r, phi = self._senal(self.arduino.posicion_en(t) if self.arduino is not None else None)
+            self._buffer_r.append(r)
+            self._buffer_phi.append(phi)
+
+    def _senal(self, posicion=None):
+        if posicion is None:
+            posicion = self.arduino.posicion if self.arduino is not None else (0.0, 0.0)
+        x, y = posicion
+        d2 = (x - self.centro[0]) ** 2 + (y - self.centro[1]) ** 2
+        perfil = math.exp(-d2 / (2 * self.sigma ** 2))
+        encendido = self.slvl >= LASER_ON_VOLTAGE
+        r = abs(self.amplitud_senal * perfil * encendido + self._rng.normal(0, self.ruido))
+        phi = 45.0 - 30.0 * perfil + self._rng.normal(0, 0.1)
+        return r, phi
+
+    def _ejecutar(self, cmd):
+        nombre, _, args = cmd.strip().partition(" ")
+        if nombre == "SLVL":
+            self.slvl = float(args)
+        elif nombre == "FREQ":
+            self.freq = float(args)
+        elif nombre == "REST":
+            self._buffer_r, self._buffer_phi = [], []
+            self._t_muestreo = self._t_pausa = None
+        elif nombre == "STRT":
+            self.buffer_activo = True
+            if self.srat < 14:
+                self._t_muestreo = time.perf_counter()
+        elif nombre == "PAUS":
+            self.buffer_activo = False
+            if self._t_muestreo is not None:
+                self._t_pausa = time.perf_counter()
+        elif nombre == "SRAT":
+            self.srat = int(args)
+        elif nombre == "TSTR":
+            self.tstr = int(args)
+        elif nombre == "TRIG":
+            if self.buffer_activo:
+                r, phi = self._senal()
+                self._buffer_r.append(r)
+                self._buffer_phi.append(phi)
+        elif nombre == "SNAP?":
+            r, phi = self._senal()
+            x, y = r * math.cos(math.radians(phi)), r * math.sin(math.radians(phi))
+            self._respuesta = f"{x:.6e},{y:.6e},{r:.6e},{phi:.4f}"
+        elif nombre == "OFLT?":
+            self._respuesta = str(self.oflt)
+        elif nombre == "OFSL?":
+            self._respuesta = str(self.ofsl)
+        elif nombre == "SPTS?":
+            self._muestrear()
+            self._respuesta = str(len(self._buffer_r))
+        # DDEF, SEND: no cambian nada en la simulación
+
+    def write(self, mensaje):
+        self._ocupar(self.latencia_escritura)
+        for cmd in mensaje.split(";"):
+            self._ejecutar(cmd)
+
+    def read(self):
+        self._ocupar(self.latencia_consulta)
+        respuesta, self._respuesta = self._respuesta, None
+        return respuesta + "\n"
+
+    def query(self, mensaje):
+        for cmd in mensaje.split(";"):
+            self._ejecutar(cmd)
+        return self.read()
+
+    def query_binary_values(self, mensaje, datatype='f', is_big_endian=False, container=list,
+                            header_fmt='ieee', expect_termination=True, data_points=0, **kwargs):
+        self._ocupar(self.latencia_consulta)
+        canal, inicio, n = (int(v) for v in mensaje.split(" ", 1)[1].split(","))
+        self._muestrear()
+        datos = self._buffer_r if canal == 1 else self._buffer_phi
+        return container(np.asarray(datos[inicio:inicio + n], dtype=np.float32))
+
+    def close(self):
+        pass
+
+
+def crear_mesa_simulada(modo_rapido=False, opciones_arduino=None, opciones_lockin=None):
+    """
+    Crea una MesaXY conectada al hardware simulado (ya en home).
+    Devuelve (mesa, arduino, lockin_simulado).
+    """
+    arduino = ArduinoSimulado(**(opciones_arduino or {}))
+    lockin_sim = LockinSimulado(arduino, **(opciones_lockin or {}))
+    mesa = MesaXY(modo_rapido=modo_rapido, lockin=SR830(inst=lockin_sim), ser=arduino)
+    mesa.home()
+    return mesa, arduino, lockin_sim